@@ -1,25 +1,137 @@
 """多智能体旅行规划系统"""
 
 import json
+import math
 import re
 import datetime
-from typing import Dict, Any, List
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Dict, Any, List, Optional, Type
 from loguru import logger
-from ..services.llm_service import get_llm
-from ..models.schemas import TripRequest, TripPlan, DayPlan, Attraction, Meal, WeatherInfo, Location, Hotel, Budget
+from pydantic import BaseModel
+from ..services.llm_service import LLMResult, build_messages, get_llm
+from ..models.schemas import TripRequest, TripPlan, DayPlan, Attraction, Meal, WeatherInfo, Location, Hotel, Budget, DayEditRequest, POIInfo
 from ..config import get_settings
+from ..services.metrics_service import (
+    PLANS_IN_FLIGHT, track_stage, track_plan_tokens, record_fallback, record_replan, record_continuation
+)
+from ..services.tracing_service import span, submit_with_context
+from ..services.enrichment_service import get_enrichment_service
+from ..services.amap_service import get_amap_service
+from ..services.attraction_service import DEFAULT_VISIT_DURATION, get_attraction_gatherer
+from ..services.cache_service import get_shared_cache
+from ..services.deadline_service import has_time_for, note_degradation, time_stage
+
+# 天气描述关键词 -> 恶劣程度(0-4),取匹配到的最高值
+WEATHER_SEVERITY = {
+    "小雨": 1, "阵雨": 1, "小雪": 1, "雾": 1,
+    "中雨": 2, "雷阵雨": 2, "中雪": 2, "霾": 2, "扬沙": 2,
+    "大雨": 3, "大雪": 3, "冻雨": 3, "浮尘": 3,
+    "暴雨": 4, "暴雪": 4, "台风": 4, "冰雹": 4, "沙尘暴": 4,
+}
+
+# 规划输出被截断后最多续写的次数
+MAX_CONTINUATIONS = 2
+
+# 原生函数调用模式下,Agent与模型之间最多往返的工具调用轮数
+MAX_TOOL_TURNS = 3
+
+# JSON输出模式
+JSON_RESPONSE_FORMAT = {"type": "json_object"}
+
+# 高德工具集提供给模型的函数定义(OpenAI tools格式)
+AMAP_TOOL_FUNCTIONS = [
+    {
+        "type": "function",
+        "function": {
+            "name": "amap_maps_text_search",
+            "description": "按关键词搜索城市内的地点(景点、酒店等)",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "keywords": {"type": "string", "description": "搜索关键词,例如 历史文化、公园、酒店"},
+                    "city": {"type": "string", "description": "城市名"}
+                },
+                "required": ["keywords", "city"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "amap_maps_weather",
+            "description": "查询城市未来几天的天气预报",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "city": {"type": "string", "description": "城市名"}
+                },
+                "required": ["city"]
+            }
+        }
+    }
+]
+
+# 各阶段输出在共享缓存中的保存时间(秒),降级时也会读取已过期的值
+STAGE_CACHE_TTL = {
+    "attractions": 7 * 24 * 3600,
+    "weather": 3 * 3600,
+    "hotels": 7 * 24 * 3600,
+}
+
+
+def _weather_severity(text: str) -> int:
+    """根据天气描述计算恶劣程度"""
+    return max((level for keyword, level in WEATHER_SEVERITY.items() if keyword in (text or "")), default=0)
+
+
+def _day_costs(day: DayPlan) -> Dict[str, int]:
+    """单日的门票/酒店/餐饮费用"""
+    return {
+        "total_attractions": sum(a.ticket_price or 0 for a in day.attractions),
+        "total_hotels": day.hotel.estimated_cost if day.hotel else 0,
+        "total_meals": sum(m.estimated_cost or 0 for m in day.meals)
+    }
+
+
+def _distance_km(a: Location, b: Location) -> float:
+    """两点之间的球面距离(公里)"""
+    lon1, lat1, lon2, lat2 = map(math.radians, (a.longitude, a.latitude, b.longitude, b.latitude))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 6371.0 * 2 * math.asin(math.sqrt(h))
+
+
+def _poi_to_tool_item(poi: POIInfo, keywords: str) -> Dict[str, Any]:
+    """把POI转换为工具结果条目,字段同时满足景点(Attraction)和酒店(Hotel)的解析"""
+    item = {
+        "name": poi.name,
+        "address": poi.address or "",
+        "location": poi.location.model_dump(),
+        "visit_duration": DEFAULT_VISIT_DURATION,
+        "description": poi.type or keywords,
+        "category": keywords or "景点",
+        "type": poi.type.split(";")[-1] if poi.type else "",
+        "poi_id": poi.id
+    }
+    if poi.rating is not None:
+        # 酒店的评分字段为字符串,景点的评分字段可从字符串解析
+        item["rating"] = str(poi.rating)
+    return item
+
 
 # ============ 自定义 Agent 实现 ============
 
 class MCPTool:
     """MCP 工具类，用于与 MCP 服务器通信"""
     
-    def __init__(self, name: str, description: str, server_command: List[str], env: Dict[str, str], auto_expand: bool = False):
+    def __init__(self, name: str, description: str, server_command: List[str], env: Dict[str, str], auto_expand: bool = False,
+                 functions: Optional[List[Dict[str, Any]]] = None):
         self.name = name
         self.description = description
         self.server_command = server_command
         self.env = env
         self.auto_expand = auto_expand
+        self.functions = functions or []
     
     def get_spec(self) -> Dict[str, Any]:
         """获取工具规范"""
@@ -31,14 +143,38 @@ class MCPTool:
             "autoExpand": self.auto_expand
         }
 
+    def get_function_specs(self) -> List[Dict[str, Any]]:
+        """获取提供给模型的函数定义"""
+        return self.functions
+
 
 class SimpleAgent:
-    """简单的 Agent 实现"""
+    """简单的 Agent 实现
     
-    def __init__(self, name: str, llm: Any, system_prompt: str):
+    开启原生函数调用(llm_native_tools)时,工具以函数定义传给模型,同一轮返回的多个
+    工具调用并发执行;模型没有返回工具调用时仍按文本格式 [TOOL_CALL:...] 解析。
+    """
+    
+    def __init__(self, name: str, llm: Any, system_prompt: str, stage: str = "default",
+                 json_output: bool = False, direct_tool_results: bool = False):
+        """
+        初始化 Agent
+        
+        Args:
+            name: Agent名称
+            llm: LLM实例
+            system_prompt: 系统提示
+            stage: 调用阶段
+            json_output: 是否要求模型以JSON输出模式返回
+            direct_tool_results: 是否直接返回工具结果(合并为一个JSON列表),
+                不再把结果交回模型生成回复,省去一轮LLM调用
+        """
         self.name = name
         self.llm = llm
         self.system_prompt = system_prompt
+        self.stage = stage
+        self.json_output = json_output
+        self.direct_tool_results = direct_tool_results
         self.tools = []
     
     def add_tool(self, tool: MCPTool):
@@ -49,30 +185,137 @@ class SimpleAgent:
         """列出所有工具"""
         return self.tools
     
-    def run(self, query: str) -> str:
+    def run(self, query: str, days: int = 1) -> str:
         """
         运行 Agent 来处理查询
         
         Args:
             query: 用户查询
+            days: 旅行天数（用于计算输出token预算）
             
         Returns:
             Agent 的响应
         """
-        # 使用 LLM 的 generate 方法获取响应
-        response = self.llm.generate(query, self.system_prompt)
-        
+        with span(f"agent.{self.stage}", agent=self.name):
+            if self.tools and get_settings().llm_native_tools:
+                return self._run_with_tools(query, days)
+
+            # 使用 LLM 获取响应
+            response = self.llm.complete(
+                query, self.system_prompt, stage=self.stage, days=days, response_format=self._response_format()
+            ).content
+            return self._handle_text_response(response)
+
+    def _handle_text_response(self, response: str) -> str:
+        """处理文本响应,包含文本格式的工具调用时执行工具并返回结果"""
         # 检查响应是否包含工具调用
         if "[TOOL_CALL:" in response or "TOOL_CALL:" in response:
             # 解析工具调用
             tool_call = self._parse_tool_call(response)
             if tool_call:
                 # 执行工具调用并返回结果
-                return self._execute_tool_call(tool_call)
+                with span(f"tool.{tool_call['tool_name']}"):
+                    return self._execute_tool_call(tool_call)
         
         # 返回 LLM 的完整响应
         return response
+
+    def _response_format(self) -> Optional[Dict[str, Any]]:
+        """需要JSON输出且开启原生模式时返回JSON输出格式"""
+        if self.json_output and get_settings().llm_native_tools:
+            return JSON_RESPONSE_FORMAT
+        return None
+
+    def _run_with_tools(self, query: str, days: int) -> str:
+        """
+        原生函数调用循环: 同一轮的多个工具调用并发执行,结果一次性交回模型
+        
+        Args:
+            query: 用户查询
+            days: 旅行天数
+            
+        Returns:
+            工具结果(direct_tool_results时)或模型的最终回复
+        """
+        tools = [spec for tool in self.tools for spec in tool.get_function_specs()]
+        messages = build_messages(query, self.system_prompt)
+        for _ in range(MAX_TOOL_TURNS):
+            result = self.llm.chat(messages, stage=self.stage, days=days, tools=tools,
+                                   response_format=self._response_format())
+            if not result.tool_calls:
+                # 模型没有使用原生工具调用,按文本格式处理
+                return self._handle_text_response(result.content)
+
+            outputs = self._execute_tool_calls(result.tool_calls)
+            if self.direct_tool_results:
+                return self._merge_tool_outputs(outputs)
+
+            messages.append({"role": "assistant", "content": result.content or None, "tool_calls": result.tool_calls})
+            messages.extend(
+                {"role": "tool", "tool_call_id": call.get("id", ""), "content": output}
+                for call, output in zip(result.tool_calls, outputs)
+            )
+
+        # 工具调用轮数用尽,不再提供工具,要求模型直接回复
+        result = self.llm.chat(messages, stage=self.stage, days=days, response_format=self._response_format())
+        return result.content
+
+    def _execute_tool_calls(self, tool_calls: List[Dict[str, Any]]) -> List[str]:
+        """并发执行同一轮的工具调用,按调用顺序返回结果"""
+        parsed = [self._parse_native_tool_call(call) for call in tool_calls]
+        logger.info(f"{self.name} 执行{len(parsed)}个工具调用: {', '.join(call['tool_name'] for call in parsed)}")
+        if len(parsed) == 1:
+            return [self._run_tool_call(parsed[0])]
+        with ThreadPoolExecutor(max_workers=len(parsed)) as executor:
+            futures = [submit_with_context(executor, self._run_tool_call, call) for call in parsed]
+            return [future.result() for future in futures]
+
+    def _run_tool_call(self, tool_call: Dict[str, Any]) -> str:
+        """在独立的span中执行一个工具调用"""
+        with span(f"tool.{tool_call['tool_name']}"):
+            return self._execute_tool_call(tool_call)
+
+    @staticmethod
+    def _parse_native_tool_call(call: Dict[str, Any]) -> Dict[str, Any]:
+        """把原生工具调用转换为 {"tool_name", "params"},参数无法解析时为空"""
+        function = call.get("function") or {}
+        try:
+            params = json.loads(function.get("arguments") or "{}")
+        except json.JSONDecodeError:
+            logger.error(f"工具调用参数无法解析: {function.get('arguments')}")
+            params = {}
+        return {
+            "tool_name": function.get("name", ""),
+            "params": params if isinstance(params, dict) else {}
+        }
+
+    @staticmethod
+    def _merge_tool_outputs(outputs: List[str]) -> str:
+        """把多个工具调用返回的JSON列表合并为一个列表"""
+        merged: List[Any] = []
+        for output in outputs:
+            try:
+                items = json.loads(output)
+            except json.JSONDecodeError:
+                continue
+            merged.extend(items if isinstance(items, list) else [items])
+        return json.dumps(merged, ensure_ascii=False)
     
+    def complete(self, query: str, days: int = 1) -> LLMResult:
+        """
+        运行不调用工具的 Agent,返回包含结束原因的完整结果
+        
+        Args:
+            query: 用户查询
+            days: 旅行天数（用于计算输出token预算）
+            
+        Returns:
+            LLM调用结果,finish_reason为"length"时输出被截断
+        """
+        with span(f"agent.{self.stage}", agent=self.name):
+            return self.llm.complete(query, self.system_prompt, stage=self.stage, days=days,
+                                     response_format=self._response_format())
+
     def _parse_tool_call(self, response: str) -> Dict[str, Any]:
         """解析工具调用"""
         try:
@@ -115,47 +358,25 @@ class SimpleAgent:
             logger.error(f"Error parsing tool call: {str(e)}")
             return None
     def _execute_tool_call(self, tool_call: Dict[str, Any]) -> str:
-            """执行工具调用"""
-            try:
-                tool_name = tool_call["tool_name"]
-                params = tool_call["params"]
-                
-                # 根据工具名称执行相应的操作
-                if tool_name == "amap_maps_text_search":
-                    # 模拟景点搜索结果
-                    keywords = params.get("keywords", "")
-                    city = params.get("city", "")
-                    return json.dumps([
-                        {
-                            "name": f"{city}热门景点",
-                            "address": f"{city}市中心",
-                            "location": {"longitude": 116.397128, "latitude": 39.916527},
-                            "visit_duration": 120,
-                            "description": f"{city}的著名景点，适合{keywords}的游客",
-                            "category": keywords,
-                            "ticket_price": 60
-                        }
-                    ])
-                elif tool_name == "amap_maps_weather":
-                    # 模拟天气查询结果
-                    city = params.get("city", "")
-                    return json.dumps([
-                        {
-                            "date": "2025-12-13",
-                            "day_weather": "晴",
-                            "night_weather": "多云",
-                            "day_temp": 25,
-                            "night_temp": 15,
-                            "wind_direction": "南风",
-                            "wind_power": "1-3级"
-                        }
-                    ])
-                else:
-                    logger.error(f"Unknown tool: {tool_name}")
-                    return json.dumps([])
-            except Exception as e:
-                logger.error(f"Error executing tool call: {str(e)}")
+        """执行工具调用: 通过高德地图服务查询,返回JSON列表"""
+        try:
+            tool_name = tool_call["tool_name"]
+            params = tool_call["params"]
+
+            if tool_name == "amap_maps_text_search":
+                keywords = params.get("keywords", "")
+                city = params.get("city", "")
+                pois = get_amap_service().search_poi(keywords, city, extensions="all")
+                return json.dumps([_poi_to_tool_item(poi, keywords) for poi in pois], ensure_ascii=False)
+            elif tool_name == "amap_maps_weather":
+                weather_info = get_amap_service().get_weather(params.get("city", ""))
+                return json.dumps([w.model_dump(mode="json") for w in weather_info], ensure_ascii=False)
+            else:
+                logger.error(f"Unknown tool: {tool_name}")
                 return json.dumps([])
+        except Exception as e:
+            logger.error(f"Error executing tool call: {str(e)}")
+            return json.dumps([])
 
 
 # ============ Agent提示词 ============
@@ -165,8 +386,11 @@ ATTRACTION_AGENT_PROMPT = """你是景点搜索专家。你的任务是根据城
 **重要提示:**
 你必须使用工具来搜索景点!不要自己编造景点信息!
 
-**工具调用格式:**
-使用maps_text_search工具时,必须严格按照以下格式:
+**工具调用:**
+优先使用函数调用 amap_maps_text_search 搜索景点。用户偏好涉及多个类别时,
+在同一次回复中为每个类别各发起一个搜索调用,它们会被并行执行。
+
+不支持函数调用时,必须严格按照以下格式回复:
 `[TOOL_CALL:amap_maps_text_search:keywords=景点关键词,city=城市名]`
 
 **示例:**
@@ -178,38 +402,19 @@ ATTRACTION_AGENT_PROMPT = """你是景点搜索专家。你的任务是根据城
 
 **注意:**
 1. 必须使用工具,不要直接回答
-2. 格式必须完全正确,包括方括号和冒号
+2. 使用文本格式时格式必须完全正确,包括方括号和冒号
 3. 参数用逗号分隔
 """
 
-WEATHER_AGENT_PROMPT = """你是天气查询专家。你的任务是查询指定城市的天气信息。
-
-**重要提示:**
-你必须使用工具来查询天气!不要自己编造天气信息!
-
-**工具调用格式:**
-使用maps_weather工具时,必须严格按照以下格式:
-`[TOOL_CALL:amap_maps_weather:city=城市名]`
-
-**示例:**
-用户: "查询北京天气"
-你的回复: [TOOL_CALL:amap_maps_weather:city=北京]
-
-用户: "上海的天气怎么样"
-你的回复: [TOOL_CALL:amap_maps_weather:city=上海]
-
-**注意:**
-1. 必须使用工具,不要直接回答
-2. 格式必须完全正确,包括方括号和冒号
-"""
-
 HOTEL_AGENT_PROMPT = """你是酒店推荐专家。你的任务是根据城市和景点位置推荐合适的酒店。
 
 **重要提示:**
 你必须使用工具来搜索酒店!不要自己编造酒店信息!
 
-**工具调用格式:**
-使用maps_text_search工具搜索酒店时,必须严格按照以下格式:
+**工具调用:**
+优先使用函数调用 amap_maps_text_search 搜索酒店,需要多个关键词时在同一次回复中并行调用。
+
+不支持函数调用时,必须严格按照以下格式回复:
 `[TOOL_CALL:amap_maps_text_search:keywords=酒店,city=城市名]`
 
 **示例:**
@@ -218,7 +423,7 @@ HOTEL_AGENT_PROMPT = """你是酒店推荐专家。你的任务是根据城市
 
 **注意:**
 1. 必须使用工具,不要直接回答
-2. 格式必须完全正确,包括方括号和冒号
+2. 使用文本格式时格式必须完全正确,包括方括号和冒号
 3. 关键词使用"酒店"或"宾馆"
 """
 
@@ -301,6 +506,51 @@ PLANNER_AGENT_PROMPT = """你是行程规划专家。你的任务是根据景点
    - 预算汇总(budget)包含各项总费用
 """
 
+DAY_PLANNER_AGENT_PROMPT = """你是行程规划专家。你的任务是重新规划旅行计划中的某一天,其他日期保持不变。
+
+请只返回这一天的行程,按照以下JSON格式:
+```json
+{
+  "date": "YYYY-MM-DD",
+  "day_index": 0,
+  "description": "当天行程概述",
+  "transportation": "交通方式",
+  "accommodation": "住宿类型",
+  "hotel": {
+    "name": "酒店名称",
+    "address": "酒店地址",
+    "location": {"longitude": 116.397128, "latitude": 39.916527},
+    "price_range": "300-500元",
+    "rating": "4.5",
+    "distance": "距离景点2公里",
+    "type": "经济型酒店",
+    "estimated_cost": 400
+  },
+  "attractions": [
+    {
+      "name": "景点名称",
+      "address": "详细地址",
+      "location": {"longitude": 116.397128, "latitude": 39.916527},
+      "visit_duration": 120,
+      "description": "景点详细描述",
+      "category": "景点类别",
+      "ticket_price": 60
+    }
+  ],
+  "meals": [
+    {"type": "breakfast", "name": "早餐推荐", "description": "早餐描述", "estimated_cost": 30},
+    {"type": "lunch", "name": "午餐推荐", "description": "午餐描述", "estimated_cost": 50},
+    {"type": "dinner", "name": "晚餐推荐", "description": "晚餐描述", "estimated_cost": 80}
+  ]
+}
+```
+
+**重要提示:**
+1. 安排2-3个景点,不要与其他日期的景点重复
+2. 考虑当天天气,恶劣天气时优先安排室内景点
+3. 必须包含早中晚三餐和费用预估
+"""
+
 
 class MultiAgentTripPlanner:
     def __init__(self, llm):
@@ -310,16 +560,22 @@ class MultiAgentTripPlanner:
             name="amap_maps",
             description="高德地图工具集",
             server_command=["uvx", "amap-mcp-server"],
-            env={}
+            env={},
+            functions=AMAP_TOOL_FUNCTIONS
         )
-        self.search_agent = SimpleAgent("Search Agent", llm, ATTRACTION_AGENT_PROMPT)
-        self.weather_agent = SimpleAgent("Weather Agent", llm, WEATHER_AGENT_PROMPT)
-        self.hotel_agent = SimpleAgent("Hotel Agent", llm, HOTEL_AGENT_PROMPT)
-        self.planner_agent = SimpleAgent("Planner Agent", llm, PLANNER_AGENT_PROMPT)
+        # 搜索类Agent直接返回工具结果,规划类Agent要求JSON输出
+        self.search_agent = SimpleAgent("Search Agent", llm, ATTRACTION_AGENT_PROMPT, stage="attractions",
+                                        direct_tool_results=True)
+        self.hotel_agent = SimpleAgent("Hotel Agent", llm, HOTEL_AGENT_PROMPT, stage="hotels",
+                                       direct_tool_results=True)
+        self.planner_agent = SimpleAgent("Planner Agent", llm, PLANNER_AGENT_PROMPT, stage="planner",
+                                         json_output=True)
+        self.day_planner_agent = SimpleAgent("Day Planner Agent", llm, DAY_PLANNER_AGENT_PROMPT, stage="replan_day",
+                                             json_output=True)
+        self.cache = get_shared_cache() if get_settings().cache_enabled else None
         
         # 添加 MCP 工具到各个 Agent
         self.search_agent.add_tool(self.amap_tool)
-        self.weather_agent.add_tool(self.amap_tool)
         self.hotel_agent.add_tool(self.amap_tool)
         self.planner_agent.add_tool(self.amap_tool)
 
@@ -337,62 +593,521 @@ class MultiAgentTripPlanner:
         return f"请搜索{destination}的适合{days}天旅行的景点"
 
     def _build_planner_query(self, request: TripRequest, attractions: List[Attraction], 
-                           weather_info: List[WeatherInfo], hotels: List[Hotel]) -> str:
+                           weather_info: Optional[List[WeatherInfo]], hotels: Optional[List[Hotel]]) -> str:
         """
         构建行程规划查询
         
         Args:
             request: 旅行请求
             attractions: 景点列表
-            weather_info: 天气信息
-            hotels: 酒店列表
+            weather_info: 天气信息(推测式规划时为None)
+            hotels: 酒店列表(推测式规划时为None)
             
         Returns:
             行程规划查询字符串
         """
-        return f"请为{request.city}规划一个{request.travel_days}天的旅行计划，基于提供的景点、天气和酒店信息"
+        query = f"请为{request.city}规划一个{request.travel_days}天的旅行计划，基于提供的景点、天气和酒店信息"
+        candidates = [
+            item.get("name") if isinstance(item, dict) else getattr(item, "name", "")
+            for item in attractions or []
+        ]
+        if any(candidates):
+            query += f"\n可选景点(按推荐顺序): {', '.join(name for name in candidates if name)}"
+        if request.preferences:
+            query += f"\n旅行偏好: {', '.join(request.preferences)}"
+        return query
 
-    def plan_trip(self, request: TripRequest) -> TripPlan:
-        # 搜索景点
-        attraction_query = self._build_attraction_query(request.city, request.travel_days)
-        try:
-            attraction_response = self.search_agent.run(attraction_query)
-            # 解析景点搜索结果
-            attractions = self._parse_response(attraction_response, "attractions")
-        except Exception as e:
-            logger.error(f"景点搜索失败: {str(e)}")
-            attractions = self._create_default_attractions(request.city)
-        
-        # 查询天气
-        weather_query = f"请查询{request.city}未来{request.travel_days}天的天气情况"
+    def plan_trip(self, request: TripRequest, context: Optional[Dict[str, List[Any]]] = None) -> TripPlan:
+        """
+        生成旅行计划
+
+        Args:
+            request: 旅行请求
+            context: 可选,传入字典时写入各阶段输出(景点/天气/酒店),供单日编辑复用
+
+        Returns:
+            旅行计划
+        """
+        with PLANS_IN_FLIGHT.track_inprogress(), track_plan_tokens():
+            trip_plan = self._plan_trip(request, context if context is not None else {})
+            return self._enrich_plan(trip_plan)
+
+    def _enrich_plan(self, trip_plan: TripPlan) -> TripPlan:
+        """补全景点和酒店的POI信息和图片,剩余时间不足或失败时返回原计划"""
+        if not get_settings().enrichment_enabled:
+            return trip_plan
+        if not has_time_for("enrich"):
+            note_degradation("enrich", "skipped")
+            return trip_plan
         try:
-            weather_response = self.weather_agent.run(weather_query)
-            # 解析天气查询结果
-            weather_info = self._parse_response(weather_response, "weather")
+            with time_stage("enrich"):
+                return get_enrichment_service().enrich_plan(trip_plan)
         except Exception as e:
-            logger.error(f"天气查询失败: {str(e)}")
-            weather_info = self._create_default_weather_info(request)
-        
-        # 推荐酒店
+            logger.error(f"POI信息补全失败: {str(e)}")
+            return trip_plan
+
+    def _plan_trip(self, request: TripRequest, context: Dict[str, List[Any]]) -> TripPlan:
+        if get_settings().planner_speculative:
+            return self._plan_trip_speculative(request, context)
+
+        attractions = self._search_attractions(request)
+        weather_info = self._query_weather(request)
+        hotels = self._recommend_hotels(request)
+        context.update(attractions=attractions, weather_info=weather_info, hotels=hotels)
+        daily_plans = self._run_planner(request, attractions, weather_info, hotels)
+        trip_plan = self._assemble_plan(request, daily_plans, weather_info)
+        # 续写拼接的输出和省略了天气的输出在解析时会填入默认天气,以查询结果为准
+        with track_stage("merge"):
+            self._merge_weather(trip_plan, weather_info)
+        return trip_plan
+
+    def _plan_trip_speculative(self, request: TripRequest, context: Dict[str, List[Any]]) -> TripPlan:
+        """
+        推测式规划: 景点就绪后立即开始行程规划,天气和酒店并行查询,
+        返回后按日期和距离合并到计划中;只有出现恶劣天气时才重新规划
+
+        Args:
+            request: 旅行请求
+            context: 写入各阶段输出
+
+        Returns:
+            旅行计划
+        """
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            weather_future = submit_with_context(executor, self._query_weather, request)
+            hotel_future = submit_with_context(executor, self._recommend_hotels, request)
+            attractions = self._search_attractions(request)
+            daily_plans = self._run_planner(request, attractions, None, None)
+            weather_info = weather_future.result()
+            hotels = hotel_future.result()
+        context.update(attractions=attractions, weather_info=weather_info, hotels=hotels)
+
+        trip_plan = self._assemble_plan(request, daily_plans, weather_info)
+        with track_stage("merge"):
+            self._merge_weather(trip_plan, weather_info)
+            self._merge_hotels(trip_plan, hotels)
+            severe_days = self._severe_weather_days(trip_plan, weather_info)
+
+        if severe_days and not has_time_for("planner", request.travel_days):
+            # 剩余时间不够再规划一次,保留合并了天气的计划
+            note_degradation("replan", "skipped")
+        elif severe_days:
+            logger.info(f"检测到恶劣天气,重新规划: {', '.join(w.date for w in severe_days)}")
+            record_replan("severe_weather")
+            daily_plans = self._run_planner(request, attractions, weather_info, hotels, severe_days=severe_days)
+            trip_plan = self._assemble_plan(request, daily_plans, weather_info)
+            with track_stage("merge"):
+                self._merge_weather(trip_plan, weather_info)
+                self._merge_hotels(trip_plan, hotels)
+        return trip_plan
+
+    def edit_day(self, plan: TripPlan, request: TripRequest, context: Dict[str, List[Any]],
+                 day_index: int, edit: DayEditRequest) -> DayPlan:
+        """
+        编辑单日行程(原地修改plan),复用已保存的阶段输出,只有重新生成时才调用LLM且只发送这一天
+
+        Args:
+            plan: 已保存的旅行计划
+            request: 原始旅行请求
+            context: 生成计划时的阶段输出
+            day_index: 第几天(从0开始)
+            edit: 编辑操作
+
+        Returns:
+            修改后的单日行程
+
+        Raises:
+            ValueError: 天数或景点索引无效、找不到可替换的景点/酒店
+        """
+        if not 0 <= day_index < len(plan.days):
+            raise ValueError(f"第{day_index + 1}天不存在")
+        old_day = plan.days[day_index]
+
+        with track_stage("edit"):
+            if edit.action == "regenerate":
+                day = self._regenerate_day(plan, request, context, day_index, edit.instructions or "")
+            else:
+                day = old_day.model_copy(deep=True)
+                if edit.action in ("swap_attraction", "remove_attraction"):
+                    if edit.attraction_index is None or not 0 <= edit.attraction_index < len(day.attractions):
+                        raise ValueError("景点索引无效")
+                    if edit.action == "remove_attraction":
+                        day.attractions.pop(edit.attraction_index)
+                    else:
+                        used = {a.name for d in plan.days for a in d.attractions}
+                        day.attractions[edit.attraction_index] = self._find_attraction(
+                            plan.city, context, edit.attraction_name, used
+                        )
+                elif edit.action == "change_hotel":
+                    day.hotel = self._find_hotel(plan.city, request, context, day, edit.hotel_name)
+            self._enrich_plan(TripPlan.model_construct(city=plan.city, days=[day]))
+
+        self._adjust_budget(plan, old_day, day)
+        plan.days[day_index] = day
+        return day
+
+    def _regenerate_day(self, plan: TripPlan, request: TripRequest, context: Dict[str, List[Any]],
+                        day_index: int, instructions: str) -> DayPlan:
+        """只把这一天发给LLM重新规划"""
+        day = plan.days[day_index]
+        other_names = [a.name for i, d in enumerate(plan.days) if i != day_index for a in d.attractions]
+        candidates = [
+            item.get("name") if isinstance(item, dict) else getattr(item, "name", "")
+            for item in context.get("attractions", [])
+        ]
+        weather = next((w for w in plan.weather_info if w.date == day.date), None)
+
+        lines = [f"请重新规划{plan.city}旅行的第{day_index + 1}天({day.date})的行程。"]
+        if candidates:
+            lines.append(f"可选景点: {', '.join(name for name in candidates if name)}")
+        if other_names:
+            lines.append(f"其他日期已安排的景点(不要重复): {', '.join(other_names)}")
+        if weather:
+            lines.append(f"当天天气: 白天{weather.day_weather},夜间{weather.night_weather}")
+        lines.append(f"交通方式: {request.transportation}, 住宿偏好: {request.accommodation}")
+        if request.preferences:
+            lines.append(f"旅行偏好: {', '.join(request.preferences)}")
+        if instructions:
+            lines.append(f"额外要求: {instructions}")
+
+        response = self.day_planner_agent.run("\n".join(lines), days=1)
+        with track_stage("parse"):
+            try:
+                return self._parse_day_plan_response(response, day)
+            except Exception as e:
+                # 解析失败属于上游问题,与请求参数无效(ValueError)区分
+                raise RuntimeError(f"单日行程解析失败: {str(e)}")
+
+    def _parse_day_plan_response(self, response: str, original: DayPlan) -> DayPlan:
+        """解析单日行程响应,日期和序号以原行程为准"""
+        json_start = response.find('{')
+        json_end = response.rfind('}') + 1
+        if json_start < 0 or json_end <= json_start:
+            raise ValueError("响应中未找到有效的JSON格式")
+        data = json.loads(self._fix_json_format(response[json_start:json_end]))
+        if isinstance(data.get("days"), list):
+            if not data["days"]:
+                raise ValueError("单日行程解析失败")
+            data = data["days"][0]
+        data["date"] = original.date
+        data["day_index"] = original.day_index
+        data.setdefault("description", original.description)
+        data.setdefault("accommodation", original.accommodation)
+        return DayPlan.model_validate(data)
+
+    @staticmethod
+    def _find_attraction(city: str, context: Dict[str, List[Any]], name: Optional[str], used: set) -> Attraction:
+        """按名称或从未使用的候选景点中选择替换的景点,候选中没有时查询高德"""
+        for item in context.get("attractions", []):
+            try:
+                attraction = item if isinstance(item, Attraction) else Attraction.model_validate(item)
+            except Exception:
+                continue
+            if (name and attraction.name == name) or (not name and attraction.name not in used):
+                return attraction
+
+        if name:
+            pois = get_amap_service().search_poi(name, city)
+            if pois:
+                poi = pois[0]
+                return Attraction(
+                    name=poi.name,
+                    address=poi.address,
+                    location=poi.location,
+                    visit_duration=120,
+                    description=poi.type,
+                    category=poi.type.split(";")[0] if poi.type else "景点"
+                )
+        raise ValueError("没有可替换的景点")
+
+    @staticmethod
+    def _find_hotel(city: str, request: TripRequest, context: Dict[str, List[Any]], day: DayPlan,
+                    name: Optional[str]) -> Hotel:
+        """按名称或距离当天景点最近的原则选择酒店,候选中没有时查询高德"""
+        current = day.hotel.name if day.hotel else None
+        candidates: List[Hotel] = []
+        for item in context.get("hotels", []):
+            try:
+                hotel = item if isinstance(item, Hotel) else Hotel.model_validate(item)
+            except Exception:
+                continue
+            if name and hotel.name == name:
+                return hotel
+            if not name and hotel.name != current:
+                candidates.append(hotel)
+
+        if name or not candidates:
+            pois = get_amap_service().search_poi(name or request.accommodation or "酒店", city)
+            candidates = [
+                Hotel(name=poi.name, address=poi.address, location=poi.location, type=poi.type)
+                for poi in pois if poi.name != current
+            ]
+            if not candidates:
+                raise ValueError("没有可更换的酒店")
+            if name:
+                return candidates[0]
+
+        points = [a.location for a in day.attractions if a.location.longitude or a.location.latitude]
+        located = [h for h in candidates if h.location]
+        if not points or not located:
+            return candidates[0]
+        center = Location(
+            longitude=sum(p.longitude for p in points) / len(points),
+            latitude=sum(p.latitude for p in points) / len(points)
+        )
+        return min(located, key=lambda h: _distance_km(center, h.location))
+
+    @staticmethod
+    def _adjust_budget(plan: TripPlan, old_day: DayPlan, new_day: DayPlan) -> None:
+        """按单日费用变化调整预算(保留LLM给出的其他各项)"""
+        if plan.budget is None:
+            return
+
+        old_costs, new_costs = _day_costs(old_day), _day_costs(new_day)
+        for key in old_costs:
+            delta = new_costs[key] - old_costs[key]
+            setattr(plan.budget, key, max(0, getattr(plan.budget, key) + delta))
+            plan.budget.total = max(0, plan.budget.total + delta)
+
+    def _search_attractions(self, request: TripRequest) -> List[Any]:
+        """搜索景点,剩余时间不足或失败时使用缓存或默认景点"""
+        default = partial(self._create_default_attractions, request.city)
+        if not has_time_for("attractions"):
+            return self._stage_fallback("attractions", request, default)
+        with track_stage("attractions"):
+            try:
+                with time_stage("attractions"):
+                    attractions = self._gather_attractions(request)
+                self._remember_stage("attractions", request.city, attractions)
+                return attractions
+            except Exception as e:
+                logger.error(f"景点搜索失败: {str(e)}")
+                record_fallback("attractions")
+                return self._stage_fallback("attractions", request, default)
+
+    def _gather_attractions(self, request: TripRequest) -> List[Any]:
+        """按偏好从高德生成景点候选池,未启用或没有结果时由景点Agent搜索"""
+        if get_settings().attraction_gather_enabled:
+            attractions = get_attraction_gatherer().gather(request.city, request.preferences, request.travel_days)
+            if attractions:
+                return attractions
+            logger.warning(f"景点候选池为空,改由景点Agent搜索: {request.city}")
+        attraction_query = self._build_attraction_query(request.city, request.travel_days)
+        attraction_response = self.search_agent.run(attraction_query)
+        # 解析景点搜索结果
+        return self._parse_response(attraction_response, "attractions")
+
+    def _query_weather(self, request: TripRequest) -> List[Any]:
+        """直接从高德查询天气预报(无需经过LLM),剩余时间不足或失败时使用缓存或默认天气"""
+        default = partial(self._create_default_weather_info, request)
+        if not has_time_for("weather"):
+            return self._stage_fallback("weather", request, default)
+        with track_stage("weather"):
+            try:
+                with time_stage("weather"):
+                    weather_info = get_amap_service().get_weather(request.city)
+                if not weather_info:
+                    raise RuntimeError("高德天气查询没有返回预报")
+                self._remember_stage("weather", request.city, weather_info)
+                return weather_info
+            except Exception as e:
+                logger.error(f"天气查询失败: {str(e)}")
+                record_fallback("weather")
+                return self._stage_fallback("weather", request, default)
+
+    def _recommend_hotels(self, request: TripRequest) -> List[Any]:
+        """推荐酒店,剩余时间不足或失败时使用缓存或默认酒店"""
+        default = partial(self._create_default_hotels, request.city)
+        if not has_time_for("hotels"):
+            return self._stage_fallback("hotels", request, default)
         hotel_query = f"请为前往{request.city}的旅客推荐合适的住宿地点"
+        with track_stage("hotels"):
+            try:
+                with time_stage("hotels"):
+                    hotel_response = self.hotel_agent.run(hotel_query)
+                # 解析酒店推荐结果
+                hotels = self._parse_response(hotel_response, "hotels")
+                self._remember_stage("hotels", request.city, hotels)
+                return hotels
+            except Exception as e:
+                logger.error(f"酒店推荐失败: {str(e)}")
+                record_fallback("hotels")
+                return self._stage_fallback("hotels", request, default)
+
+    def _remember_stage(self, stage: str, city: str, items: List[Any]) -> None:
+        """保存阶段输出,供之后剩余时间不足或出错时降级使用"""
+        if self.cache is None or not items:
+            return
         try:
-            hotel_response = self.hotel_agent.run(hotel_query)
-            # 解析酒店推荐结果
-            hotels = self._parse_response(hotel_response, "hotels")
+            values = [item.model_dump(mode="json") if isinstance(item, BaseModel) else item for item in items]
+            self.cache.set(f"stage:{stage}:{city}", values, STAGE_CACHE_TTL[stage])
         except Exception as e:
-            logger.error(f"酒店推荐失败: {str(e)}")
-            hotels = self._create_default_hotels(request.city)
-        
-        # 规划行程
+            logger.warning(f"保存{stage}阶段输出失败: {str(e)}")
+
+    def _stage_fallback(self, stage: str, request: TripRequest, default: Callable[[], List[Any]]) -> List[Any]:
+        """
+        阶段降级: 优先使用缓存中该城市最近一次的阶段输出(允许过期),没有时使用默认数据
+
+        Args:
+            stage: 阶段名称(attractions/weather/hotels)
+            request: 旅行请求
+            default: 生成默认数据的函数
+
+        Returns:
+            降级后的阶段输出
+        """
+        cached = None
+        if self.cache is not None:
+            try:
+                cached = self.cache.get(f"stage:{stage}:{request.city}", allow_stale=True)
+            except Exception as e:
+                logger.warning(f"读取{stage}阶段缓存失败: {str(e)}")
+        if cached and stage == "weather":
+            # 只使用行程日期内的天气
+            start = datetime.datetime.strptime(request.start_date, "%Y-%m-%d")
+            dates = {(start + datetime.timedelta(days=i)).strftime("%Y-%m-%d") for i in range(request.travel_days)}
+            cached = [w for w in cached if isinstance(w, dict) and w.get("date") in dates]
+        if cached:
+            note_degradation(stage, "cache")
+            return cached
+        note_degradation(stage, "default")
+        return default()
+
+    def _run_planner(self, request: TripRequest, attractions: List[Any], weather_info: Optional[List[Any]],
+                     hotels: Optional[List[Any]], severe_days: Optional[List[WeatherInfo]] = None) -> Any:
+        """规划行程并解析,剩余时间不足或失败时按已有景点和酒店在本地编排行程"""
+        if not has_time_for("planner", request.travel_days):
+            note_degradation("planner", "local")
+            return self._create_default_daily_plans(request, attractions, hotels)
         planner_query = self._build_planner_query(request, attractions, weather_info, hotels)
+        if severe_days:
+            planner_query += self._build_weather_note(severe_days)
         try:
-            planner_response = self.planner_agent.run(planner_query)
+            with track_stage("planner"), time_stage("planner", request.travel_days):
+                result = self.planner_agent.complete(planner_query, days=request.travel_days)
+                planner_response = result.content
+                if self._is_truncated(result):
+                    # 保留已完整生成的天数,只续写剩余的天数
+                    planner_response = self._continue_plan(request, planner_query, result.content, attractions, hotels)
             # 解析行程规划结果
-            daily_plans = self._parse_trip_plan_response(planner_response, request)
+            with track_stage("parse"):
+                return self._parse_trip_plan_response(planner_response, request)
         except Exception as e:
             logger.error(f"行程规划失败: {str(e)}")
-            daily_plans = self._create_default_daily_plans(request)
-        
+            record_fallback("planner")
+            note_degradation("planner", "local")
+            return self._create_default_daily_plans(request, attractions, hotels)
+
+    def _is_truncated(self, result: LLMResult) -> bool:
+        """根据结束原因和JSON是否完整判断规划输出是否被截断"""
+        if result.finish_reason == "length":
+            return True
+        content = result.content
+        json_start, json_end = content.find('{'), content.rfind('}') + 1
+        return json_start >= 0 and not self._is_json_complete(content[json_start:json_end])
+
+    @staticmethod
+    def _parse_partial_days(response: str) -> List[Dict[str, Any]]:
+        """
+        从可能被截断的规划输出中逐个解析days数组里完整的每日行程
+
+        Args:
+            response: LLM输出
+
+        Returns:
+            完整且能通过校验的每日行程,遇到第一个不完整的条目时停止
+        """
+        match = re.search(r'"days"\s*:\s*\[', response)
+        if not match:
+            return []
+        decoder = json.JSONDecoder()
+        days: List[Dict[str, Any]] = []
+        pos = match.end()
+        while True:
+            while pos < len(response) and response[pos] in " \t\r\n,":
+                pos += 1
+            if pos >= len(response) or response[pos] != "{":
+                break
+            try:
+                day, pos = decoder.raw_decode(response, pos)
+                DayPlan.model_validate(day)
+            except Exception:
+                break
+            days.append(day)
+        return days
+
+    @staticmethod
+    def _build_continuation_query(planner_query: str, done_days: List[Dict[str, Any]], dates: List[str]) -> str:
+        """构建续写剩余天数的查询,附上已安排的景点避免重复"""
+        planned = [
+            a["name"] for day in done_days for a in day.get("attractions", []) if isinstance(a, dict) and a.get("name")
+        ]
+        return (
+            f"请继续规划剩余{len(dates)}天的行程,日期依次为{', '.join(dates)},"
+            f"day_index从{len(done_days)}开始。"
+            f"前{len(done_days)}天已安排的景点: {'、'.join(planned) or '无'},不要重复安排。"
+            "按相同的JSON格式返回,只需要包含days数组。\n\n" + planner_query
+        )
+
+    def _continue_plan(self, request: TripRequest, planner_query: str, response: str,
+                       attractions: List[Any], hotels: Optional[List[Any]]) -> str:
+        """
+        续写被截断的规划输出
+
+        保留已完整生成的天数,请LLM只生成剩余的天数并拼接;续写次数用完或剩余时间不足时,
+        剩余天数按已有景点和酒店在本地编排,不再整份重新生成或使用默认行程。
+
+        Args:
+            request: 旅行请求
+            planner_query: 原规划查询
+            response: 被截断的规划输出
+            attractions: 景点列表
+            hotels: 酒店列表
+
+        Returns:
+            拼接后的规划JSON
+        """
+        start = datetime.datetime.strptime(request.start_date, "%Y-%m-%d")
+        all_dates = [(start + datetime.timedelta(days=i)).strftime("%Y-%m-%d") for i in range(request.travel_days)]
+        days = self._parse_partial_days(response)[:request.travel_days]
+        logger.warning(f"规划输出被截断,已完整生成{len(days)}/{request.travel_days}天")
+
+        for _ in range(MAX_CONTINUATIONS):
+            remaining = all_dates[len(days):]
+            if not remaining or not has_time_for("planner", len(remaining)):
+                break
+            query = self._build_continuation_query(planner_query, days, remaining)
+            try:
+                result = self.planner_agent.complete(query, days=len(remaining))
+            except Exception as e:
+                logger.error(f"续写行程失败: {str(e)}")
+                break
+            days.extend(self._parse_partial_days(result.content)[:len(remaining)])
+            logger.info(f"续写行程: 已完成{len(days)}/{request.travel_days}天")
+
+        if len(days) < request.travel_days:
+            record_continuation("local")
+            note_degradation("planner", "local")
+            local_days = self._create_default_daily_plans(request, attractions, hotels)
+            days.extend(day.model_dump(mode="json") for day in local_days[len(days):])
+        else:
+            record_continuation("complete")
+
+        # 续写的天数按行程日期重新编号
+        day_plans = []
+        for i, day in enumerate(days):
+            day.update(date=all_dates[i], day_index=i)
+            day_plans.append(DayPlan.model_validate(day))
+
+        # 预算在截断的输出中通常缺失,按每日费用重新汇总
+        budget = self._create_default_budget()
+        for key in ("total_attractions", "total_hotels", "total_meals"):
+            setattr(budget, key, sum(_day_costs(day)[key] for day in day_plans))
+        budget.total = budget.total_attractions + budget.total_hotels + budget.total_meals + budget.total_transportation
+        return json.dumps({"days": days, "budget": budget.model_dump()}, ensure_ascii=False)
+
+    def _assemble_plan(self, request: TripRequest, daily_plans: Any, weather_info: List[Any]) -> TripPlan:
+        """将规划结果组装为TripPlan"""
         # 如果daily_plans已经是TripPlan对象，直接返回
         if isinstance(daily_plans, TripPlan):
             return daily_plans
@@ -410,6 +1125,81 @@ class MultiAgentTripPlanner:
             to_transportation=request.to_transportation
         )
 
+    @staticmethod
+    def _build_weather_note(severe_days: List[WeatherInfo]) -> str:
+        """重新规划时附加的恶劣天气说明"""
+        lines = [f"{w.date}: 白天{w.day_weather},夜间{w.night_weather}" for w in severe_days]
+        return "\n\n注意以下日期天气恶劣,请将这些日期安排为室内景点或减少户外活动:\n" + "\n".join(lines)
+
+    @staticmethod
+    def _to_weather_list(weather_info: Optional[List[Any]]) -> List[WeatherInfo]:
+        """将天气查询结果转换为WeatherInfo,跳过无法解析的条目"""
+        result = []
+        for item in weather_info or []:
+            try:
+                result.append(item if isinstance(item, WeatherInfo) else WeatherInfo.model_validate(item))
+            except Exception:
+                continue
+        return result
+
+    def _merge_weather(self, trip_plan: TripPlan, weather_info: List[Any]) -> None:
+        """按日期用查询到的天气覆盖计划中的天气"""
+        fetched = {w.date: w for w in self._to_weather_list(weather_info)}
+        if not fetched:
+            return
+
+        existing = {w.date: w for w in trip_plan.weather_info}
+        dates = [day.date for day in trip_plan.days] or list(fetched)
+        trip_plan.weather_info = [fetched.get(d) or existing[d] for d in dates if d in fetched or d in existing]
+
+    def _merge_hotels(self, trip_plan: TripPlan, hotels: List[Any]) -> None:
+        """为每天选择距离当天景点中心最近的酒店(规划中的酒店已在候选中时保留),同步住宿和预算"""
+        candidates: List[Hotel] = []
+        for item in hotels or []:
+            try:
+                hotel = item if isinstance(item, Hotel) else Hotel.model_validate(item)
+            except Exception:
+                continue
+            if hotel.location and (hotel.location.longitude or hotel.location.latitude):
+                candidates.append(hotel)
+        if not candidates:
+            return
+        candidate_names = {hotel.name for hotel in candidates}
+
+        for index, day in enumerate(trip_plan.days):
+            planned = day.hotel
+            if planned and planned.name in candidate_names:
+                continue
+            points = [a.location for a in day.attractions if a.location.longitude or a.location.latitude]
+            if not points:
+                continue
+            center = Location(
+                longitude=sum(p.longitude for p in points) / len(points),
+                latitude=sum(p.latitude for p in points) / len(points)
+            )
+            nearest = min(candidates, key=lambda h: _distance_km(center, h.location))
+            merged = day.model_copy(update={
+                "hotel": nearest.model_copy(update={
+                    "distance": f"距离景点约{_distance_km(center, nearest.location):.1f}公里",
+                    "price_range": nearest.price_range or (planned.price_range if planned else ""),
+                    "estimated_cost": nearest.estimated_cost or (planned.estimated_cost if planned else 0)
+                }),
+                "accommodation": nearest.name
+            })
+            self._adjust_budget(trip_plan, day, merged)
+            trip_plan.days[index] = merged
+
+    def _severe_weather_days(self, trip_plan: TripPlan, weather_info: List[Any]) -> List[WeatherInfo]:
+        """找出查询到的天气中恶劣程度达到重新规划阈值的行程日期"""
+        threshold = get_settings().weather_replan_severity
+        if threshold <= 0:
+            return []
+        plan_dates = {day.date for day in trip_plan.days}
+        return [
+            w for w in self._to_weather_list(weather_info)
+            if w.date in plan_dates and max(_weather_severity(w.day_weather), _weather_severity(w.night_weather)) >= threshold
+        ]
+
     def _parse_response(self, response: str, response_type: str) -> Any:
         try:
             # 尝试解析 JSON 格式的响应
@@ -463,6 +1253,7 @@ class MultiAgentTripPlanner:
                 
                 # 确保days存在且不为空
                 if not trip_data.get('days'):
+                    record_fallback("parse")
                     trip_data['days'] = self._create_default_daily_plans(request)
                 
                 # 确保其他必要字段存在
@@ -615,11 +1406,35 @@ class MultiAgentTripPlanner:
             )
         ]
     
-    def _create_default_daily_plans(self, request: TripRequest) -> List[DayPlan]:
-        """创建默认每日计划"""
+    @staticmethod
+    def _to_models(model: Type[BaseModel], items: Optional[List[Any]]) -> List[Any]:
+        """将阶段输出转换为模型对象,跳过无法解析的条目"""
+        result = []
+        for item in items or []:
+            try:
+                result.append(item if isinstance(item, model) else model.model_validate(item))
+            except Exception:
+                continue
+        return result
+
+    def _create_default_daily_plans(self, request: TripRequest, attractions: Optional[List[Any]] = None,
+                                    hotels: Optional[List[Any]] = None) -> List[DayPlan]:
+        """
+        在本地编排每日计划(不调用LLM)
+
+        Args:
+            request: 旅行请求
+            attractions: 已查询到的景点,为空时使用默认景点
+            hotels: 已查询到的酒店,为空时使用默认酒店
+
+        Returns:
+            每日计划列表
+        """
         days = []
-        attractions = self._create_default_attractions(request.city)
-        hotels = self._create_default_hotels(request.city)
+        attractions = self._to_models(Attraction, attractions) or self._create_default_attractions(request.city)
+        hotels = self._to_models(Hotel, hotels) or self._create_default_hotels(request.city)
+        # 景点按顺序平均分配到每天,每天1-3个
+        per_day = max(1, min(3, math.ceil(len(attractions) / max(1, request.travel_days))))
         # 解析起始日期字符串
         start_date = datetime.datetime.strptime(request.start_date, "%Y-%m-%d")
         for i in range(request.travel_days):
@@ -628,10 +1443,7 @@ class MultiAgentTripPlanner:
             date_str = current_date.strftime("%Y-%m-%d")
             # date = f"{start_date.year}-{start_date.month:02d}-{start_date.day+i:02d}"
             
-            # 每天安排1-2个景点
-            day_attractions = [attractions[i % len(attractions)]]
-            if i % 2 == 0 and len(attractions) > 1:
-                day_attractions.append(attractions[(i+1) % len(attractions)])
+            day_attractions = [attractions[(i * per_day + k) % len(attractions)] for k in range(per_day)]
             
             # 创建每日计划
             day_plan = DayPlan(
@@ -1,9 +1,14 @@
 """FastAPI主应用"""
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from ..config import get_settings, validate_config, print_config
-from .routes import trip, poi, map as map_routes
+from ..services.metrics_service import CONTENT_TYPE_LATEST, render_metrics
+from ..services.tracing_service import start_trace, finish_trace, stop_trace_writer
+from ..services.health_service import get_health_service
+from ..services.plan_store_service import get_plan_store
+from .routes import trip, poi, images, map as map_routes
 
 # 获取配置
 settings = get_settings()
@@ -26,10 +31,33 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.middleware("http")
+async def tracing_middleware(request: Request, call_next):
+    """为每个请求建立Trace并返回Server-Timing响应头"""
+    trace = start_trace(f"{request.method} {request.url.path}", **{
+        "http.method": request.method,
+        "http.target": request.url.path
+    })
+    try:
+        response = await call_next(request)
+        trace.root.set_attribute("http.status_code", response.status_code)
+        response.headers["Server-Timing"] = trace.server_timing()
+        response.headers["Timing-Allow-Origin"] = "*"
+        response.headers["X-Trace-Id"] = trace.trace_id
+        return response
+    except Exception as e:
+        trace.root.error = type(e).__name__
+        raise
+    finally:
+        finish_trace(trace)
+
+
 # 注册路由
 app.include_router(trip.router, prefix="/api")
 app.include_router(poi.router, prefix="/api")
 app.include_router(map_routes.router, prefix="/api")
+app.include_router(images.router, prefix="/api")
 
 
 @app.on_event("startup")
@@ -56,10 +84,19 @@ async def startup_event():
     print("ReDoc文档: http://localhost:8080/redoc")
     print("="*60 + "\n")
 
+    # 后台异步预热,不阻塞启动;就绪检查在预热完成前返回503
+    get_health_service().start()
+
+    # 定期按保存天数/数量清理旅行计划
+    get_plan_store().start_retention()
+
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """应用关闭事件"""
+    await get_health_service().stop()
+    await get_plan_store().stop_retention()
+    stop_trace_writer()
     print("\n" + "="*60)
     print("应用正在关闭...")
     print("="*60 + "\n")
@@ -87,6 +124,26 @@ async def health():
     }
 
 
+@app.get("/health/live")
+async def liveness():
+    """存活检查: 进程能响应即可"""
+    return {"status": "alive"}
+
+
+@app.get("/health/ready")
+async def readiness():
+    """就绪检查: 预热完成且必需上游最近一次探测可达"""
+    status = get_health_service().readiness()
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
+
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus指标"""
+    return Response(content=render_metrics(), media_type=CONTENT_TYPE_LATEST)
+
+
 if __name__ == "__main__":
     import uvicorn
     
@@ -0,0 +1,91 @@
+"""高性能JSON响应
+
+路由中已经是校验过的模型,直接用pydantic-core序列化(字典用orjson),跳过FastAPI
+response_model的二次校验和jsonable_encoder;并按Accept-Encoding压缩,支持ETag/304。
+"""
+
+import gzip
+import hashlib
+from typing import Any, Optional, Sequence
+
+import orjson
+from fastapi import Request, Response
+from pydantic import BaseModel
+
+try:
+    import brotli
+except ImportError:  # brotli为可选依赖,未安装时只使用gzip
+    brotli = None
+
+# 小于该大小的响应不压缩
+MIN_COMPRESS_SIZE = 1024
+
+
+def _encode(payload: Any) -> bytes:
+    """序列化为JSON字节串(bytes视为已编码的JSON)"""
+    if isinstance(payload, bytes):
+        return payload
+    if isinstance(payload, BaseModel):
+        return payload.__pydantic_serializer__.to_json(payload)
+    return orjson.dumps(payload, default=_default)
+
+
+def _default(obj: Any) -> Any:
+    """orjson无法直接处理的对象(字典中嵌套的pydantic模型)"""
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json")
+    raise TypeError(f"无法序列化的类型: {type(obj).__name__}")
+
+
+def _etag(body: bytes) -> str:
+    """基于响应内容计算弱ETag(不同压缩编码共用)"""
+    return f'W/"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def _compress(body: bytes, accept_encoding: str) -> Optional[tuple]:
+    """按客户端支持的编码压缩,返回 (编码, 压缩后内容)"""
+    if len(body) < MIN_COMPRESS_SIZE:
+        return None
+    accepted = {part.split(";")[0].strip().lower() for part in accept_encoding.split(",")}
+    if brotli is not None and "br" in accepted:
+        return "br", brotli.compress(body, quality=5)
+    if "gzip" in accepted:
+        return "gzip", gzip.compress(body, compresslevel=6)
+    return None
+
+
+def json_response(request: Request, payload: Any, cache_control: str = "no-cache", status_code: int = 200,
+                  media_type: str = "application/json", vary: Sequence[str] = ()) -> Response:
+    """
+    构建JSON响应
+
+    Args:
+        request: 当前请求
+        payload: 已校验的pydantic模型、可序列化的字典/列表或已编码的JSON字节串
+        cache_control: Cache-Control响应头
+        status_code: HTTP状态码
+        media_type: Content-Type
+        vary: 除Accept-Encoding外影响响应内容的请求头(如按Accept协商格式时的Accept)
+
+    Returns:
+        压缩并带ETag的响应,条件请求命中时返回304
+    """
+    body = _encode(payload)
+    etag = _etag(body)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": cache_control,
+        "Vary": ", ".join(["Accept-Encoding", *vary])
+    }
+
+    if request.method in ("GET", "HEAD"):
+        if_none_match = request.headers.get("if-none-match", "")
+        if etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+            return Response(status_code=304, headers=headers)
+
+    compressed = _compress(body, request.headers.get("accept-encoding", ""))
+    if compressed:
+        encoding, body = compressed
+        headers["Content-Encoding"] = encoding
+
+    return Response(content=body, status_code=status_code, media_type=media_type, headers=headers)
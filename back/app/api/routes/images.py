@@ -0,0 +1,55 @@
+"""图片代理API路由"""
+
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse
+from loguru import logger
+from ...services.image_cache_service import get_image_cache_service, VARIANTS
+
+router = APIRouter(prefix="/images", tags=["图片代理"])
+
+# 同一个key和尺寸的内容不会变化,允许长期缓存
+IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+@router.get(
+    "/{key}",
+    summary="获取代理图片",
+    description="返回已登记图片的指定尺寸变体(thumb/card/original),首次访问时下载并缓存"
+)
+async def get_image(
+    key: str,
+    request: Request,
+    size: str = Query("card", description="尺寸: thumb/card/original")
+):
+    """
+    获取代理图片
+
+    Args:
+        key: 图片key
+        request: HTTP请求
+        size: 尺寸变体
+
+    Returns:
+        图片文件
+    """
+    if size not in VARIANTS:
+        raise HTTPException(status_code=400, detail=f"不支持的图片尺寸: {size}")
+
+    etag = f'"{key}-{size}"'
+    headers = {"Cache-Control": IMAGE_CACHE_CONTROL, "ETag": etag}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    try:
+        result = await run_in_threadpool(get_image_cache_service().get_image, key, size)
+    except Exception as e:
+        logger.error(f"获取图片失败: {str(e)}")
+        raise HTTPException(status_code=502, detail=f"获取图片失败: {str(e)}")
+
+    if result is None:
+        raise HTTPException(status_code=404, detail="图片不存在")
+
+    path, media_type = result
+    # FileResponse分块读取文件,大图不会整体载入内存
+    return FileResponse(path, media_type=media_type, headers=headers)
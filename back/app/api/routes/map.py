@@ -1,7 +1,8 @@
 """地图服务API路由"""
 
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Request, Response
 from typing import Optional
+from fastapi.concurrency import run_in_threadpool
 from loguru import logger
 from ...models.schemas import (
     POISearchRequest,
@@ -11,6 +12,17 @@ from ...models.schemas import (
     WeatherResponse
 )
 from ...services.amap_service import get_amap_service
+from ...services.cancellation_service import CLIENT_CLOSED_REQUEST, RequestCancelled, cancel_on_disconnect
+from ..responses import json_response
+
+# POI数据变化很慢,允许客户端缓存
+POI_CACHE_CONTROL = "public, max-age=3600"
+
+# 分页搜索时单次最多返回的条数
+POI_MAX_LIMIT = 500
+
+# 只传游标不传limit时每次返回的条数
+POI_DEFAULT_LIMIT = 20
 
 router = APIRouter(prefix="/map", tags=["地图服务"])
 
@@ -19,12 +31,15 @@ router = APIRouter(prefix="/map", tags=["地图服务"])
     "/poi",
     response_model=POISearchResponse,
     summary="搜索POI",
-    description="根据关键词搜索POI(兴趣点)"
+    description="根据关键词搜索POI(兴趣点),传入limit或cursor时并发分页搜索并返回下一页游标"
 )
 async def search_poi(
+    http_request: Request,
     keywords: str = Query(..., description="搜索关键词", example="故宫"),
     city: str = Query(..., description="城市", example="北京"),
-    citylimit: bool = Query(True, description="是否限制在城市范围内")
+    citylimit: bool = Query(True, description="是否限制在城市范围内"),
+    limit: Optional[int] = Query(None, ge=1, le=POI_MAX_LIMIT, description="最多返回的条数,不传时只返回第一页"),
+    cursor: Optional[str] = Query(None, description="分页游标,取上一次响应的next_cursor")
 ):
     """
     搜索POI
@@ -33,23 +48,57 @@ async def search_poi(
         keywords: 搜索关键词
         city: 城市
         citylimit: 是否限制在城市范围内
+        limit: 最多返回的条数
+        cursor: 分页游标
         
     Returns:
         POI搜索结果
     """
+    start = 0
+    if cursor:
+        if not cursor.isdigit():
+            raise HTTPException(status_code=400, detail="无效的分页游标")
+        start = int(cursor)
+
     try:
         # 获取服务实例
         service = get_amap_service()
         
-        # 搜索POI
-        pois = service.search_poi(keywords, city, citylimit)
-        
-        return POISearchResponse(
+        if limit is None and cursor is None:
+            # 搜索POI
+            async with cancel_on_disconnect(http_request, "map_poi"):
+                pois = await run_in_threadpool(service.search_poi, keywords, city, citylimit)
+            
+            return json_response(http_request, POISearchResponse.model_construct(
+                success=True,
+                message="POI搜索成功",
+                data=pois
+            ), cache_control=POI_CACHE_CONTROL)
+
+        limit = limit or POI_DEFAULT_LIMIT
+        pois = []
+        incomplete = False
+        async with cancel_on_disconnect(http_request, "map_poi"):
+            try:
+                async for poi in service.stream_poi(keywords, city, citylimit, limit=limit, start=start):
+                    pois.append(poi)
+            except RuntimeError as e:
+                # 已取得的结果仍然返回,客户端可从失败位置继续
+                if not pois:
+                    raise
+                logger.warning(f"POI分页搜索中断: {str(e)}")
+                incomplete = True
+
+        next_cursor = str(start + len(pois)) if incomplete or len(pois) == limit else None
+        return json_response(http_request, POISearchResponse.model_construct(
             success=True,
-            message="POI搜索成功",
-            data=pois
-        )
+            message="部分POI搜索失败,可使用游标继续" if incomplete else "POI搜索成功",
+            data=pois,
+            next_cursor=next_cursor
+        ), cache_control="no-cache" if incomplete else POI_CACHE_CONTROL)
         
+    except RequestCancelled:
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
     except Exception as e:
         logger.error(f"POI搜索失败: {str(e)}")
         raise HTTPException(
@@ -65,12 +114,14 @@ async def search_poi(
     description="查询指定城市的天气信息"
 )
 async def get_weather(
+    http_request: Request,
     city: str = Query(..., description="城市名称", example="北京")
 ):
     """
     查询天气
     
     Args:
+        http_request: HTTP请求(用于检测客户端断开)
         city: 城市名称
         
     Returns:
@@ -81,7 +132,8 @@ async def get_weather(
         service = get_amap_service()
         
         # 查询天气
-        weather_info = service.get_weather(city)
+        async with cancel_on_disconnect(http_request, "map_weather"):
+            weather_info = await run_in_threadpool(service.get_weather, city)
         
         return WeatherResponse(
             success=True,
@@ -89,6 +141,8 @@ async def get_weather(
             data=weather_info
         )
         
+    except RequestCancelled:
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
     except Exception as e:
         logger.error(f"天气查询失败: {str(e)}")
         raise HTTPException(
@@ -103,12 +157,13 @@ async def get_weather(
     summary="规划路线",
     description="规划两点之间的路线"
 )
-async def plan_route(request: RouteRequest):
+async def plan_route(request: RouteRequest, http_request: Request):
     """
     规划路线
     
     Args:
         request: 路线规划请求
+        http_request: HTTP请求(用于检测客户端断开)
         
     Returns:
         路线信息
@@ -118,13 +173,15 @@ async def plan_route(request: RouteRequest):
         service = get_amap_service()
         
         # 规划路线
-        route_info = service.plan_route(
-            origin_address=request.origin_address,
-            destination_address=request.destination_address,
-            origin_city=request.origin_city,
-            destination_city=request.destination_city,
-            route_type=request.route_type
-        )
+        async with cancel_on_disconnect(http_request, "map_route"):
+            route_info = await run_in_threadpool(
+                service.plan_route,
+                origin_address=request.origin_address,
+                destination_address=request.destination_address,
+                origin_city=request.origin_city,
+                destination_city=request.destination_city,
+                route_type=request.route_type
+            )
         
         return RouteResponse(
             success=True,
@@ -132,6 +189,8 @@ async def plan_route(request: RouteRequest):
             data=route_info
         )
         
+    except RequestCancelled:
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
     except Exception as e:
         logger.error(f"路线规划失败: {str(e)}")
         raise HTTPException(
@@ -1,14 +1,21 @@
 """POI相关API路由"""
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel, Field
 from typing import List, Optional
+from fastapi.concurrency import run_in_threadpool
 from loguru import logger
 from ...services.amap_service import get_amap_service
 from ...services.unsplash_service import get_unsplash_service
+from ...services.image_cache_service import get_image_cache_service
+from ...config import get_settings
+from ..responses import json_response
 
 router = APIRouter(prefix="/poi", tags=["POI"])
 
+# POI数据变化很慢,允许客户端缓存
+POI_CACHE_CONTROL = "public, max-age=3600"
+
 
 class POIDetailResponse(BaseModel):
     """POI详情响应"""
@@ -23,12 +30,13 @@ class POIDetailResponse(BaseModel):
     summary="获取POI详情",
     description="根据POI ID获取详细信息,包括图片"
 )
-async def get_poi_detail(poi_id: str):
+async def get_poi_detail(poi_id: str, http_request: Request):
     """
     获取POI详情
     
     Args:
         poi_id: POI ID
+        http_request: HTTP请求
         
     Returns:
         POI详情响应
@@ -37,13 +45,13 @@ async def get_poi_detail(poi_id: str):
         amap_service = get_amap_service()
         
         # 调用高德地图POI详情API
-        result = amap_service.get_poi_detail(poi_id)
+        result = await run_in_threadpool(amap_service.get_poi_detail, poi_id)
         
-        return POIDetailResponse(
+        return json_response(http_request, POIDetailResponse.model_construct(
             success=True,
             message="获取POI详情成功",
             data=result
-        )
+        ), cache_control=POI_CACHE_CONTROL)
         
     except Exception as e:
         logger.error(f"获取POI详情失败: {str(e)}")
@@ -58,11 +66,12 @@ async def get_poi_detail(poi_id: str):
     summary="搜索POI",
     description="根据关键词搜索POI"
 )
-async def search_poi(keywords: str, city: str = "北京"):
+async def search_poi(http_request: Request, keywords: str, city: str = "北京"):
     """
     搜索POI
 
     Args:
+        http_request: HTTP请求
         keywords: 搜索关键词
         city: 城市名称
 
@@ -71,13 +80,13 @@ async def search_poi(keywords: str, city: str = "北京"):
     """
     try:
         amap_service = get_amap_service()
-        result = amap_service.search_poi(keywords, city)
+        result = await run_in_threadpool(amap_service.search_poi, keywords, city)
 
-        return {
+        return json_response(http_request, {
             "success": True,
             "message": "搜索成功",
             "data": result
-        }
+        }, cache_control=POI_CACHE_CONTROL)
 
     except Exception as e:
         logger.error(f"搜索POI失败: {str(e)}")
@@ -92,12 +101,13 @@ async def search_poi(keywords: str, city: str = "北京"):
     summary="获取景点图片",
     description="根据景点名称从Unsplash获取图片"
 )
-async def get_attraction_photo(name: str):
+async def get_attraction_photo(name: str, http_request: Request):
     """
     获取景点图片
 
     Args:
         name: 景点名称
+        http_request: HTTP请求
 
     Returns:
         图片URL
@@ -106,20 +116,23 @@ async def get_attraction_photo(name: str):
         unsplash_service = get_unsplash_service()
 
         # 搜索景点图片
-        photo_url = unsplash_service.get_photo_url(f"{name} China landmark")
+        photo_url = await run_in_threadpool(unsplash_service.get_photo_url, f"{name} China landmark")
 
         if not photo_url:
             # 如果没找到,尝试只用景点名称搜索
-            photo_url = unsplash_service.get_photo_url(name)
+            photo_url = await run_in_threadpool(unsplash_service.get_photo_url, name)
+
+        if photo_url and get_settings().image_proxy_enabled:
+            photo_url = get_image_cache_service().proxy_url(photo_url, "card")
 
-        return {
+        return json_response(http_request, {
             "success": True,
             "message": "获取图片成功",
             "data": {
                 "name": name,
                 "photo_url": photo_url
             }
-        }
+        }, cache_control=POI_CACHE_CONTROL)
 
     except Exception as e:
         logger.error(f"获取景点图片失败: {str(e)}")
@@ -1,29 +1,104 @@
 """旅行规划API路由"""
 
-from fastapi import APIRouter, HTTPException
+from typing import List, Optional
+import orjson
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from loguru import logger
 from ...models.schemas import (
     TripRequest,
+    TripPlan,
     TripPlanResponse,
+    CompactTripPlan,
+    CompactTripPlanResponse,
+    DayEditRequest,
+    TripPlanDelta,
+    TripPlanDeltaResponse,
     ErrorResponse
 )
 from ...agents.trip_planner import get_trip_planner_agent
+from ...services.plan_store_service import get_plan_store
+from ...services.admission_service import AdmissionRejected, get_admission_controller
+from ...services.cancellation_service import (
+    CLIENT_CLOSED_REQUEST, RequestCancelled, cancel_on_disconnect, run_in_threadpool_joined
+)
+from ...services.deadline_service import plan_deadline
+from ...config import get_settings
+from ..responses import json_response
 
 router = APIRouter(prefix="/trip", tags=["旅行规划"])
 
+# 请求紧凑格式时使用的媒体类型
+COMPACT_MEDIA_TYPE = "application/vnd.trip-plan.compact+json"
+
+
+def _wants_compact(http_request: Request, format: Optional[str]) -> bool:
+    """根据查询参数或Accept头判断是否返回紧凑格式"""
+    if format:
+        return format == "compact"
+    return COMPACT_MEDIA_TYPE in http_request.headers.get("accept", "")
+
+
+def _format_vary(format: Optional[str]) -> List[str]:
+    """未通过查询参数指定格式时,响应格式取决于Accept头"""
+    return [] if format else ["Accept"]
+
+
+def _client_id(http_request: Request) -> str:
+    """用于公平排队的客户端标识: X-Client-Id头,否则为客户端地址"""
+    return http_request.headers.get("x-client-id") or (http_request.client.host if http_request.client else "unknown")
+
+
+def _patience(http_request: Request) -> float:
+    """客户端可接受的排队时间,不超过配置的默认值"""
+    default = get_settings().plan_queue_patience
+    try:
+        return min(default, max(0.0, float(http_request.headers.get("x-queue-patience", default))))
+    except ValueError:
+        return default
+
+
+def _plan_response(http_request: Request, trip_plan: TripPlan, message: str, format: Optional[str],
+                   plan_id: Optional[str] = None, degradations: Optional[List[str]] = None):
+    """按请求的格式构建旅行计划响应(trip_plan已校验,直接构造避免重复校验)"""
+    vary = _format_vary(format)
+    if _wants_compact(http_request, format):
+        return json_response(http_request, CompactTripPlanResponse.model_construct(
+            success=True,
+            message=message,
+            format="compact",
+            plan_id=plan_id,
+            degradations=degradations or [],
+            data=CompactTripPlan.from_plan(trip_plan)
+        ), media_type=COMPACT_MEDIA_TYPE, vary=vary)
+    return json_response(http_request, TripPlanResponse.model_construct(
+        success=True,
+        message=message,
+        plan_id=plan_id,
+        degradations=degradations or [],
+        data=trip_plan
+    ), vary=vary)
+
 
 @router.post(
     "/plan",
     response_model=TripPlanResponse,
+    responses={200: {"content": {COMPACT_MEDIA_TYPE: {"schema": CompactTripPlanResponse.model_json_schema()}}}},
     summary="生成旅行计划",
-    description="根据用户输入的旅行需求,生成详细的旅行计划"
+    description="根据用户输入的旅行需求,生成详细的旅行计划。format=compact或Accept为紧凑媒体类型时返回去重的紧凑格式"
 )
-async def plan_trip(request: TripRequest):
+async def plan_trip(
+    request: TripRequest,
+    http_request: Request,
+    format: Optional[str] = Query(default=None, description="响应格式: full/compact")
+):
     """
     生成旅行计划
 
     Args:
         request: 旅行请求参数
+        http_request: HTTP请求(用于协商压缩编码和响应格式)
+        format: 响应格式
 
     Returns:
         旅行计划响应
@@ -31,22 +106,55 @@ async def plan_trip(request: TripRequest):
     try:
         logger.info(f"收到旅行规划请求: 城市={request.city}, 日期={request.start_date}-{request.end_date}, 天数={request.travel_days}")
 
+        # 相同请求在复用窗口内直接返回已保存的计划
+        reuse_window = get_settings().plan_reuse_window
+        if reuse_window > 0:
+            store = get_plan_store()
+            plan_id = await run_in_threadpool(store.find_recent, request, reuse_window)
+            if plan_id:
+                stored = await run_in_threadpool(store.get, plan_id)
+                if stored is not None:
+                    logger.info(f"复用已保存的旅行计划: {plan_id}")
+                    return _plan_response(http_request, stored.plan, "旅行计划生成成功", format, plan_id)
+
         # 获取Agent实例
         logger.info("获取多智能体系统实例...")
         agent = get_trip_planner_agent()
 
-        # 生成旅行计划
+        # 生成旅行计划(超出并发和排队上限时快速返回429,客户端断开时取消排队和生成,
+        # 时限含排队时间,剩余时间不足的阶段提前降级;取消后等规划线程退出再释放准入名额)
         logger.info("开始生成旅行计划...")
-        trip_plan = agent.plan_trip(request)
+        context = {}
+        with plan_deadline(get_settings().plan_slo_seconds) as deadline:
+            patience = min(_patience(http_request), deadline.remaining())
+            async with cancel_on_disconnect(http_request, "trip_plan"):
+                async with get_admission_controller().admit(_client_id(http_request), patience):
+                    trip_plan = await run_in_threadpool_joined(agent.plan_trip, request, context)
+
+        # 保存计划和阶段输出,供单日编辑复用;保存失败不影响本次返回
+        plan_id = None
+        try:
+            plan_id = await run_in_threadpool(get_plan_store().save, trip_plan, request, context)
+        except Exception as e:
+            logger.error(f"保存旅行计划失败: {str(e)}")
 
         logger.info("旅行计划生成成功,准备返回响应")
+        message = "旅行计划生成成功"
+        if deadline.degradations:
+            logger.warning(f"本次规划存在降级: {', '.join(deadline.degradations)}")
+            message = "旅行计划生成成功(部分信息为缓存或默认数据)"
 
-        return TripPlanResponse(
-            success=True,
-            message="旅行计划生成成功",
-            data=trip_plan
-        )
+        return _plan_response(http_request, trip_plan, message, format, plan_id, deadline.degradations)
 
+    except RequestCancelled:
+        logger.info("客户端已断开,旅行规划已取消")
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=429,
+            detail=f"服务繁忙,请{e.retry_after}秒后重试",
+            headers={"Retry-After": str(e.retry_after)}
+        )
     except Exception as e:
         logger.error(f"生成旅行计划失败: {str(e)}")
         import traceback
@@ -57,6 +165,65 @@ async def plan_trip(request: TripRequest):
         )
 
 
+@router.patch(
+    "/{plan_id}/days/{day_index}",
+    response_model=TripPlanDeltaResponse,
+    summary="编辑单日行程",
+    description="替换/移除景点、更换酒店或重新生成某一天,复用已保存的阶段结果,只返回修改后的这一天和预算"
+)
+async def edit_trip_day(plan_id: str, day_index: int, edit: DayEditRequest, http_request: Request):
+    """
+    编辑单日行程
+
+    Args:
+        plan_id: 计划ID
+        day_index: 第几天(从0开始)
+        edit: 编辑操作
+        http_request: HTTP请求
+
+    Returns:
+        增量结果
+    """
+    store = get_plan_store()
+    stored = await run_in_threadpool(store.get, plan_id)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="旅行计划不存在或已过期")
+
+    try:
+        logger.info(f"编辑旅行计划: {plan_id}, 第{day_index + 1}天, 操作={edit.action}")
+        agent = get_trip_planner_agent()
+        async with cancel_on_disconnect(http_request, "trip_edit"):
+            day = await run_in_threadpool(
+                agent.edit_day, stored.plan, stored.request, stored.context, day_index, edit
+            )
+        saved = await run_in_threadpool(store.update, stored)
+    except RequestCancelled:
+        logger.info("客户端已断开,单日编辑已取消")
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"编辑旅行计划失败: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"编辑旅行计划失败: {str(e)}"
+        )
+    if not saved:
+        # 编辑期间计划已被其他请求修改,本次结果基于旧版本,不能覆盖
+        raise HTTPException(status_code=409, detail="旅行计划已被其他请求修改,请重新加载后再编辑")
+
+    return json_response(http_request, TripPlanDeltaResponse.model_construct(
+        success=True,
+        message="行程已更新",
+        data=TripPlanDelta.model_construct(
+            plan_id=plan_id,
+            day_index=day_index,
+            day=day,
+            budget=stored.plan.budget
+        )
+    ))
+
+
 @router.get(
     "/health",
     summary="健康检查",
@@ -79,4 +246,40 @@ async def health_check():
         raise HTTPException(
             status_code=503,
             detail=f"服务不可用: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+
+@router.get(
+    "/{plan_id}",
+    response_model=TripPlanResponse,
+    responses={200: {"content": {COMPACT_MEDIA_TYPE: {"schema": CompactTripPlanResponse.model_json_schema()}}}},
+    summary="获取旅行计划",
+    description="从计划存储直接读取已生成的旅行计划,用于刷新结果页或分享链接"
+)
+async def get_trip_plan(
+    plan_id: str,
+    http_request: Request,
+    format: Optional[str] = Query(default=None, description="响应格式: full/compact")
+):
+    """
+    获取已保存的旅行计划
+
+    Args:
+        plan_id: 计划ID
+        http_request: HTTP请求
+        format: 响应格式
+
+    Returns:
+        旅行计划响应
+    """
+    plan_json = await run_in_threadpool(get_plan_store().get_plan_json, plan_id)
+    if plan_json is None:
+        raise HTTPException(status_code=404, detail="旅行计划不存在或已过期")
+
+    if _wants_compact(http_request, format):
+        trip_plan = TripPlan.model_validate_json(plan_json)
+        return _plan_response(http_request, trip_plan, "获取旅行计划成功", format, plan_id)
+
+    # 完整格式直接拼接存储中的JSON,不做解析和重新序列化
+    envelope = orjson.dumps({"success": True, "message": "获取旅行计划成功", "plan_id": plan_id})
+    return json_response(http_request, envelope[:-1] + b',"data":' + plan_json + b'}', vary=_format_vary(format))
@@ -33,19 +33,101 @@ class Settings(BaseSettings):
 
     # 高德地图API配置
     gd_api_key: str = ""
+    gd_api_keys: str = ""  # 额外的高德API Key(逗号分隔),与GD_API_KEY组成Key池
+    amap_key_qps: float = 20.0  # 配置多个Key时每个Key的QPS上限(代替AMAP_QPS), 0表示不限
+    amap_key_daily_quota: int = 0  # 每个Key的日配额, 0表示不限
+    amap_key_cooldown: float = 60.0  # Key返回访问过于频繁(10004)时的隔离时间(秒)
+    amap_base_url: str = "https://restapi.amap.com/v3"
+    amap_qps: float = 20.0  # 只有一个Key时所有worker共享的高德API请求速率上限, 0表示不限
+    amap_batch_enabled: bool = True  # 合并同一时间窗口内的请求,通过 /batch 接口一次发送
+    amap_batch_window: float = 0.01  # 合并窗口(秒)
 
     # Unsplash API配置
     unsplash_access_key: str = ""
     unsplash_secret_key: str = ""
+    unsplash_base_url: str = "https://api.unsplash.com"
 
     # LLM配置 (从环境变量读取)
     llm_api_key: str = ""
     llm_base_url: str = ""
     llm_model: str = ""
+    llm_model_id: str = ""
+    llm_timeout: int = 300
+    llm_max_tokens: int = 10000  # 单次调用的max_tokens上限
+    llm_adaptive_budget: bool = True  # 根据观测到的输出长度自适应调整各阶段max_tokens
+    llm_stream: bool = True  # 流式接收LLM输出,客户端断开时可在生成中途中止
+    llm_native_tools: bool = True  # 使用原生函数调用和JSON输出模式,模型拒绝时自动改用文本格式的工具调用
+    llm_slo_seconds: float = 180.0  # 主模型/备用模型单次调用的延迟目标
+
+    # 快速模型: 用于只输出工具调用的阶段,未配置模型ID时全部使用主模型
+    llm_fast_model_id: str = ""
+    llm_fast_base_url: str = ""  # 为空时使用主模型地址
+    llm_fast_api_key: str = ""  # 为空时使用主模型API Key
+    llm_fast_stages: str = "attractions,hotels"
+    llm_fast_slo_seconds: float = 10.0
+
+    # 备用模型: 前面的模型出错或超出延迟目标时使用
+    llm_fallback_model_id: str = ""
+    llm_fallback_base_url: str = ""
+    llm_fallback_api_key: str = ""
+    llm_failover_cooldown: float = 60.0  # 出错或超时的模型在该时间内降低优先级
 
     # 日志配置
     log_level: str = "INFO"
 
+    # 规划准入控制(按worker进程生效)
+    plan_max_concurrency: int = 8  # 同时执行的最大规划数
+    plan_max_queue: int = 32  # 最大排队数
+    plan_max_per_client: int = 2  # 单个客户端同时执行和排队的最大请求数
+    plan_queue_patience: float = 60.0  # 默认可接受的排队时间(秒),客户端可通过X-Queue-Patience头缩短
+
+    # 推测式规划: 景点就绪后立即开始规划,天气和酒店返回后再合并
+    planner_speculative: bool = True
+    weather_replan_severity: int = 3  # 天气恶劣程度(1小雨-4暴雨/台风)达到该值时重新规划,0表示不重新规划
+
+    # 规划时限: 从收到请求(含排队)起计算,剩余时间不足以执行某阶段时提前改用缓存或本地数据
+    plan_slo_seconds: float = 200.0  # 低于前端240秒的请求超时,0表示不限制
+
+    # 计划存储: 生成的计划按ID保存,用于单日编辑和再次查看
+    plan_db_path: str = "data/plans.db"
+    plan_retention_days: int = 30  # 超过该天数的计划被清理,0表示不按时间清理
+    plan_max_count: int = 0  # 最多保留的计划数,0表示不限制
+    plan_retention_interval: float = 3600.0  # 清理任务的执行间隔(秒)
+    plan_reuse_window: int = 0  # 相同请求在该时间(秒)内直接返回已保存的计划,0表示总是重新生成
+
+    # 景点候选池配置: 按偏好并发搜索高德POI,关闭时由景点Agent搜索
+    attraction_gather_enabled: bool = True
+    attraction_default_keywords: str = "景点,博物馆,公园"  # 每个城市都会搜索的默认关键词
+    attraction_pois_per_day: int = 4  # 候选池大小 = 旅行天数 × 该值
+    attraction_max_pages: int = 2  # 候选不足时每个关键词最多搜索的页数
+
+    # POI信息补全配置
+    enrichment_enabled: bool = True
+    enrichment_concurrency: int = 8  # 单个计划补全时的最大并发请求数
+
+    # 图片代理配置
+    image_proxy_enabled: bool = True
+    image_cache_dir: str = "data/images"
+    image_cache_max_bytes: int = 512 * 1024 * 1024  # 磁盘缓存上限
+
+    # 启动与健康检查配置
+    upstream_probe_interval: float = 60.0  # 上游探测间隔(秒)
+    upstream_probe_timeout: float = 5.0
+
+    # 上游录制与回放配置: live直接请求, record请求并录制, replay只从存档回放
+    upstream_mode: str = "live"
+    upstream_archive_dir: str = "data/upstream_archive"
+    upstream_replay_latency: bool = False  # 回放时按录制的耗时返回
+
+    # 生产部署配置
+    workers: int = 0  # worker进程数, 0表示按CPU核数
+    cache_enabled: bool = True
+    cache_db_path: str = "data/cache.db"  # 跨worker共享的缓存/限流数据库
+
+    # 链路追踪配置
+    trace_file: str = ""  # 为空时不写入追踪文件
+    trace_slow_threshold_ms: float = 10000.0  # 超过该耗时的请求输出完整Span树
+
     class Config:
         env_file = ".env"
         case_sensitive = False
@@ -101,10 +183,14 @@ def print_config():
 
     # 检查LLM配置
     llm_api_key = os.getenv("LLM_API_KEY") or os.getenv("OPENAI_API_KEY")
-    llm_base_url = os.getenv("LLM_BASE_URL") or settings.openai_base_url
-    llm_model = os.getenv("LLM_MODEL_ID") or settings.openai_model
+    llm_base_url = settings.llm_base_url or "默认"
+    llm_model = settings.llm_model_id or settings.llm_model or "默认"
 
     print(f"LLM API Key: {'已配置' if llm_api_key else '未配置'}")
     print(f"LLM Base URL: {llm_base_url}")
     print(f"LLM Model: {llm_model}")
+    if settings.llm_fast_model_id:
+        print(f"LLM Fast Model: {settings.llm_fast_model_id} ({settings.llm_fast_stages})")
+    if settings.llm_fallback_model_id:
+        print(f"LLM Fallback Model: {settings.llm_fallback_model_id}")
     print(f"日志级别: {settings.log_level}")
\ No newline at end of file
@@ -96,6 +96,9 @@ class Hotel(BaseModel):
     distance: str = Field(default="", description="距离景点距离")
     type: str = Field(default="", description="酒店类型")
     estimated_cost: int = Field(default=0, description="预估费用(元/晚)")
+    poi_id: Optional[str] = Field(default="", description="POI ID")
+    photos: Optional[List[str]] = Field(default_factory=list, description="酒店图片URL列表")
+    image_url: Optional[str] = Field(default=None, description="图片URL")
 
 
 class DayPlan(BaseModel):
@@ -160,9 +163,129 @@ class TripPlanResponse(BaseModel):
     """旅行计划响应"""
     success: bool = Field(..., description="是否成功")
     message: str = Field(default="", description="消息")
+    plan_id: Optional[str] = Field(default=None, description="计划ID,用于后续编辑和查询")
+    degradations: List[str] = Field(default_factory=list, description="本次规划中降级的阶段,格式为 阶段:数据来源")
     data: Optional[TripPlan] = Field(default=None, description="旅行计划数据")
 
 
+# ============ 单日编辑 ============
+
+DAY_EDIT_ACTIONS = ("swap_attraction", "remove_attraction", "change_hotel", "regenerate")
+
+
+class DayEditRequest(BaseModel):
+    """单日行程编辑请求"""
+    action: str = Field(..., description="操作: swap_attraction/remove_attraction/change_hotel/regenerate")
+    attraction_index: Optional[int] = Field(default=None, description="要替换或移除的景点索引")
+    attraction_name: Optional[str] = Field(default=None, description="替换后的景点名称,为空时自动选择")
+    hotel_name: Optional[str] = Field(default=None, description="更换后的酒店名称,为空时自动选择")
+    instructions: Optional[str] = Field(default="", description="重新生成时的额外要求")
+
+    @field_validator('action')
+    @classmethod
+    def validate_action(cls, v):
+        """校验操作类型"""
+        if v not in DAY_EDIT_ACTIONS:
+            raise ValueError(f"不支持的操作: {v}")
+        return v
+
+
+class TripPlanDelta(BaseModel):
+    """单日编辑后的增量结果,前端替换对应的一天和预算即可"""
+    plan_id: str = Field(..., description="计划ID")
+    day_index: int = Field(..., description="修改的是第几天(从0开始)")
+    day: DayPlan = Field(..., description="修改后的单日行程")
+    budget: Optional[Budget] = Field(default=None, description="修改后的预算")
+
+
+class TripPlanDeltaResponse(BaseModel):
+    """单日编辑响应"""
+    success: bool = Field(..., description="是否成功")
+    message: str = Field(default="", description="消息")
+    data: Optional[TripPlanDelta] = Field(default=None, description="增量结果")
+
+
+# ============ 紧凑格式 ============
+
+class CompactDayPlan(BaseModel):
+    """紧凑格式的单日行程,酒店和景点以索引引用顶层表"""
+    date: str = Field(..., description="日期 YYYY-MM-DD")
+    day_index: int = Field(..., description="第几天(从0开始)")
+    description: str = Field(..., description="当日行程描述")
+    transportation: str = Field(default="公交地铁", description="交通方式")
+    accommodation: str = Field(..., description="住宿")
+    hotel: Optional[int] = Field(default=None, description="hotels表中的索引")
+    attractions: List[int] = Field(default=[], description="attractions表中的索引")
+    meals: List[Meal] = Field(default=[], description="餐饮列表")
+
+
+class CompactTripPlan(BaseModel):
+    """紧凑格式的旅行计划,重复的酒店和景点只传输一次"""
+    start_city: str = Field(..., description="出发城市")
+    city: str = Field(..., description="目的地城市")
+    start_date: str = Field(..., description="开始日期")
+    end_date: str = Field(..., description="结束日期")
+    hotels: List[Hotel] = Field(default=[], description="去重后的酒店表")
+    attractions: List[Attraction] = Field(default=[], description="去重后的景点表")
+    days: List[CompactDayPlan] = Field(..., description="每日行程")
+    weather_info: List[WeatherInfo] = Field(default=[], description="天气信息")
+    overall_suggestions: str = Field(..., description="总体建议")
+    budget: Optional[Budget] = Field(default=None, description="预算信息")
+    to_transportation: Optional[str] = Field(default=None, description="出发和返回方式")
+
+    @classmethod
+    def from_plan(cls, plan: TripPlan) -> "CompactTripPlan":
+        """将完整旅行计划转换为紧凑格式(内容完全相同的酒店/景点合并为一项)"""
+        hotels: List[Hotel] = []
+        attractions: List[Attraction] = []
+        hotel_index: dict = {}
+        attraction_index: dict = {}
+
+        def intern(item: BaseModel, table: list, index: dict) -> int:
+            key = item.model_dump_json()
+            if key not in index:
+                index[key] = len(table)
+                table.append(item)
+            return index[key]
+
+        days = [
+            CompactDayPlan.model_construct(
+                date=day.date,
+                day_index=day.day_index,
+                description=day.description,
+                transportation=day.transportation,
+                accommodation=day.accommodation,
+                hotel=intern(day.hotel, hotels, hotel_index) if day.hotel else None,
+                attractions=[intern(a, attractions, attraction_index) for a in day.attractions],
+                meals=day.meals
+            )
+            for day in plan.days
+        ]
+        return cls.model_construct(
+            start_city=plan.start_city,
+            city=plan.city,
+            start_date=plan.start_date,
+            end_date=plan.end_date,
+            hotels=hotels,
+            attractions=attractions,
+            days=days,
+            weather_info=plan.weather_info,
+            overall_suggestions=plan.overall_suggestions,
+            budget=plan.budget,
+            to_transportation=plan.to_transportation
+        )
+
+
+class CompactTripPlanResponse(BaseModel):
+    """紧凑格式的旅行计划响应"""
+    success: bool = Field(..., description="是否成功")
+    message: str = Field(default="", description="消息")
+    format: str = Field(default="compact", description="数据格式")
+    plan_id: Optional[str] = Field(default=None, description="计划ID,用于后续编辑和查询")
+    degradations: List[str] = Field(default_factory=list, description="本次规划中降级的阶段,格式为 阶段:数据来源")
+    data: Optional[CompactTripPlan] = Field(default=None, description="紧凑格式的旅行计划数据")
+
+
 class POIInfo(BaseModel):
     """POI信息"""
     id: str = Field(..., description="POI ID")
@@ -171,6 +294,7 @@ class POIInfo(BaseModel):
     address: str = Field(..., description="地址")
     location: Location = Field(..., description="经纬度坐标")
     tel: Optional[str] = Field(default=None, description="电话")
+    rating: Optional[float] = Field(default=None, description="评分(extensions=all时返回)")
 
 
 class POISearchResponse(BaseModel):
@@ -178,6 +302,7 @@ class POISearchResponse(BaseModel):
     success: bool = Field(..., description="是否成功")
     message: str = Field(default="", description="消息")
     data: List[POIInfo] = Field(default=[], description="POI列表")
+    next_cursor: Optional[str] = Field(default=None, description="下一页游标,为空表示没有更多结果")
 
 
 class RouteInfo(BaseModel):
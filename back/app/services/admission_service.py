@@ -0,0 +1,177 @@
+"""旅行规划准入控制
+
+限制同时执行的规划数和排队长度,超出时快速返回429,而不是让所有请求一起拖到
+LLM超时再统一兜底:
+    - 并发上限内的请求直接执行,其余按客户端轮询排队,单个客户端不能占满队列
+    - 根据最近的规划耗时估算排队等待时间,超过客户端可接受的等待时间时立即拒绝
+    - 限制按进程生效,多worker部署时总容量为 worker数 × 并发上限
+"""
+
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict
+
+from loguru import logger
+
+from ..config import get_settings
+from .metrics_service import observe_queue_wait, record_admission
+
+# 平滑规划耗时的系数
+EWMA_ALPHA = 0.2
+
+
+class AdmissionRejected(Exception):
+    """请求未被准入"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """有界并发 + 按客户端公平排队"""
+
+    def __init__(self, max_concurrency: int, max_queue: int, max_per_client: int,
+                 initial_service_time: float = 30.0):
+        """
+        初始化准入控制
+
+        Args:
+            max_concurrency: 同时执行的最大规划数
+            max_queue: 最大排队数
+            max_per_client: 单个客户端同时执行和排队的最大请求数
+            initial_service_time: 尚无观测时假定的单次规划耗时(秒)
+        """
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.max_per_client = max(1, max_per_client)
+        self.service_time = initial_service_time
+        self.running = 0
+        self.queued = 0
+        self._per_client: Dict[str, int] = {}
+        # 客户端 -> 等待中的Future,按客户端轮询出队
+        self._waiters: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+
+    def estimate_wait(self) -> float:
+        """估算新请求的排队等待时间(秒)"""
+        if self.running < self.max_concurrency and self.queued == 0:
+            return 0.0
+        return (self.queued + 1) / self.max_concurrency * self.service_time
+
+    def _reject(self, reason: str, wait: float) -> AdmissionRejected:
+        """记录并构造拒绝异常"""
+        record_admission(reason)
+        retry_after = max(1, math.ceil(wait or self.service_time / self.max_concurrency))
+        logger.warning(f"拒绝规划请求: {reason}, running={self.running}, queued={self.queued}, retry_after={retry_after}s")
+        return AdmissionRejected(reason, retry_after)
+
+    def _dispatch(self) -> None:
+        """有空闲并发时按客户端轮询唤醒排队的请求"""
+        while self.running < self.max_concurrency and self._waiters:
+            client, waiters = next(iter(self._waiters.items()))
+            future = waiters.popleft()
+            # 该客户端移到轮询末尾
+            del self._waiters[client]
+            if waiters:
+                self._waiters[client] = waiters
+            self.queued -= 1
+            if future.done():
+                continue
+            self.running += 1
+            future.set_result(None)
+
+    def _remove_waiter(self, client: str, future: asyncio.Future) -> None:
+        """从队列中移除放弃等待的请求"""
+        waiters = self._waiters.get(client)
+        if waiters and future in waiters:
+            waiters.remove(future)
+            self.queued -= 1
+            if not waiters:
+                del self._waiters[client]
+
+    @asynccontextmanager
+    async def admit(self, client: str, patience: float) -> AsyncIterator[None]:
+        """
+        申请执行一次规划
+
+        Args:
+            client: 客户端标识
+            patience: 客户端可接受的最长排队时间(秒)
+
+        Raises:
+            AdmissionRejected: 客户端请求过多、队列已满或预计等待时间过长
+        """
+        if self._per_client.get(client, 0) >= self.max_per_client:
+            raise self._reject("client_limit", self.estimate_wait())
+
+        wait = self.estimate_wait()
+        if wait > 0:
+            if self.queued >= self.max_queue:
+                raise self._reject("queue_full", wait)
+            if wait > patience:
+                raise self._reject("wait_too_long", wait)
+
+        self._per_client[client] = self._per_client.get(client, 0) + 1
+        enqueued_at = time.perf_counter()
+        try:
+            if wait > 0:
+                future = asyncio.get_running_loop().create_future()
+                self._waiters.setdefault(client, deque()).append(future)
+                self.queued += 1
+                try:
+                    await asyncio.wait_for(asyncio.shield(future), timeout=patience)
+                except asyncio.TimeoutError:
+                    # 超时的同时可能刚好被唤醒,此时按已准入处理
+                    if not future.done():
+                        self._remove_waiter(client, future)
+                        raise self._reject("wait_timeout", self.estimate_wait())
+                except asyncio.CancelledError:
+                    # 客户端断开: 未被唤醒时移出队列,已被唤醒则归还并发名额
+                    if future.done():
+                        self.running -= 1
+                        self._dispatch()
+                    else:
+                        self._remove_waiter(client, future)
+                    raise
+            else:
+                self.running += 1
+            observe_queue_wait(time.perf_counter() - enqueued_at)
+            record_admission("admitted")
+
+            start = time.perf_counter()
+            try:
+                yield
+            finally:
+                elapsed = time.perf_counter() - start
+                self.service_time = (1 - EWMA_ALPHA) * self.service_time + EWMA_ALPHA * elapsed
+                self.running -= 1
+                self._dispatch()
+        finally:
+            remaining = self._per_client.get(client, 1) - 1
+            if remaining:
+                self._per_client[client] = remaining
+            else:
+                self._per_client.pop(client, None)
+
+
+# 全局准入控制实例
+_admission_controller = None
+
+
+def get_admission_controller() -> AdmissionController:
+    """获取准入控制实例(单例模式)"""
+    global _admission_controller
+
+    if _admission_controller is None:
+        settings = get_settings()
+        _admission_controller = AdmissionController(
+            settings.plan_max_concurrency,
+            settings.plan_max_queue,
+            settings.plan_max_per_client
+        )
+
+    return _admission_controller
@@ -0,0 +1,191 @@
+"""高德地图批量请求合并
+
+一次规划会分别请求天气、景点搜索、酒店搜索、地理编码和POI详情,每个请求各付一次
+HTTPS往返。合并器收集一个短时间窗口内的待发请求,通过高德 /batch 接口一次发送
+(每次最多20个子请求),再把子响应分发回各调用方:
+    - 没有其他请求在等待或发送中时直接发送,单独的请求不增加等待时间
+    - 否则窗口内第一个请求的线程负责等待窗口结束后发送,攒满20个时由最后加入的线程立即发送
+    - 一批只有一个请求时直接按普通GET发送,不经过 /batch
+    - 限流、缓存和取消检查仍在合并之前按单个请求进行,调用方的Span中标记batched
+"""
+
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlencode, urlparse
+
+import httpx
+from loguru import logger
+
+from .metrics_service import observe_upstream
+from .tracing_service import span
+
+# 高德 /batch 接口每次最多包含的子请求数
+MAX_BATCH_SIZE = 20
+
+
+class _PendingCall:
+    """等待发送的单个请求"""
+
+    def __init__(self, endpoint: str, path: str, params: Dict[str, Any], timeout: float):
+        self.endpoint = endpoint
+        self.path = path
+        self.params = params
+        self.timeout = timeout
+        self.future: Future = Future()
+
+
+class AmapBatcher:
+    """按时间窗口合并高德地图请求"""
+
+    def __init__(self, client: httpx.Client, base_url: str, api_key: str, window: float,
+                 max_size: int = MAX_BATCH_SIZE):
+        """
+        初始化合并器
+
+        Args:
+            client: HTTP客户端
+            base_url: 高德API地址(如 https://restapi.amap.com/v3)
+            api_key: 高德API Key(/batch 请求本身也需要)
+            window: 合并窗口(秒)
+            max_size: 每批最多的子请求数
+        """
+        self.client = client
+        self.base_url = base_url.rstrip("/")
+        # 子请求的URL只包含路径部分,如 /v3/place/text?...
+        self.path_prefix = urlparse(self.base_url).path.rstrip("/")
+        self.api_key = api_key
+        self.window = window
+        self.max_size = max(1, min(max_size, MAX_BATCH_SIZE))
+        self._pending: List[_PendingCall] = []
+        # 已进入call且尚未返回的请求数(含等待中和发送中)
+        self._active = 0
+        self._lock = threading.Lock()
+
+    def call(self, endpoint: str, path: str, params: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+        """
+        发送一个请求(可能与其他请求合并),返回响应JSON
+
+        Args:
+            endpoint: 接口名称(用于指标标签)
+            path: API路径
+            params: 请求参数(含key)
+            timeout: 超时时间(秒)
+
+        Returns:
+            响应JSON
+
+        Raises:
+            httpx.HTTPError: 请求失败或超时
+        """
+        call = _PendingCall(endpoint, path, params, timeout)
+        batch: Optional[List[_PendingCall]] = None
+        with self._lock:
+            self._active += 1
+            self._pending.append(call)
+            leader = len(self._pending) == 1
+            if len(self._pending) >= self.max_size or (leader and self._active == 1):
+                # 攒满一批,或当前没有其他请求(不值得等待)时立即发送
+                batch = self._take()
+
+        try:
+            if batch is None and leader:
+                # 有其他请求在进行中,窗口内的第一个请求等待后续请求加入
+                time.sleep(self.window)
+                with self._lock:
+                    batch = self._take()
+            if batch:
+                self._send(batch)
+
+            try:
+                return call.future.result(timeout=timeout)
+            except FutureTimeoutError:
+                raise httpx.ReadTimeout(f"高德批量请求超时: {endpoint}")
+        finally:
+            with self._lock:
+                self._active -= 1
+
+    def _take(self) -> List[_PendingCall]:
+        """取出当前所有待发请求(调用方需持有锁)"""
+        batch, self._pending = self._pending, []
+        return batch
+
+    def _send(self, batch: List[_PendingCall]) -> None:
+        """发送一批请求并分发结果,异常写入每个调用方的Future"""
+        try:
+            if len(batch) == 1:
+                results = [self._get(batch[0])]
+            else:
+                results = self._post_batch(batch)
+        except Exception as e:
+            results = [e] * len(batch)
+        for call, result in zip(batch, results):
+            if isinstance(result, Exception):
+                call.future.set_exception(result)
+            else:
+                call.future.set_result(result)
+
+    def _get(self, call: _PendingCall) -> Dict[str, Any]:
+        """单个请求直接按GET发送"""
+        start = time.perf_counter()
+        status = "error"
+        try:
+            response = self.client.get(f"{self.base_url}/{call.path}", params=call.params, timeout=call.timeout)
+            status = str(response.status_code)
+            response.raise_for_status()
+            return response.json()
+        finally:
+            observe_upstream("amap", call.endpoint, status, time.perf_counter() - start)
+
+    def _post_batch(self, batch: List[_PendingCall]) -> List[Any]:
+        """
+        通过 /batch 接口发送多个请求
+
+        Returns:
+            与batch顺序对应的响应JSON或异常
+        """
+        ops = [{"url": f"{self.path_prefix}/{call.path}?{urlencode(call.params)}"} for call in batch]
+        start = time.perf_counter()
+        status = "error"
+        try:
+            with span("amap.batch", size=len(batch)) as current:
+                response = self.client.post(
+                    f"{self.base_url}/batch",
+                    params={"key": batch[0].params.get("key", self.api_key)},
+                    json={"ops": ops},
+                    timeout=max(call.timeout for call in batch)
+                )
+                status = str(response.status_code)
+                if current:
+                    current.set_attribute("http.status_code", status)
+                response.raise_for_status()
+                items = response.json()
+        finally:
+            elapsed = time.perf_counter() - start
+            observe_upstream("amap", "batch", status, elapsed)
+
+        if not isinstance(items, list) or len(items) != len(batch):
+            raise httpx.DecodingError(f"高德批量请求返回格式错误: {str(items)[:200]}")
+
+        results: List[Any] = []
+        for call, item in zip(batch, items):
+            sub_status, body = self._unpack(item)
+            observe_upstream("amap", call.endpoint, str(sub_status), elapsed)
+            if sub_status != 200:
+                logger.warning(f"高德批量子请求失败: {call.endpoint}, status={sub_status}")
+                results.append(httpx.HTTPError(f"高德批量子请求失败: {call.endpoint}, status={sub_status}"))
+            else:
+                results.append(body)
+        logger.debug(f"高德批量请求: {len(batch)}个子请求, 耗时{elapsed:.3f}s")
+        return results
+
+    @staticmethod
+    def _unpack(item: Any) -> Tuple[int, Any]:
+        """解析子响应 {"status": 200, "body": {...}}"""
+        if not isinstance(item, dict):
+            return 0, None
+        try:
+            return int(item.get("status") or 0), item.get("body")
+        except (TypeError, ValueError):
+            return 0, None
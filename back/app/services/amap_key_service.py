@@ -0,0 +1,184 @@
+"""高德地图API Key池
+
+单个Key的QPS和日配额决定了高德调用的上限。配置多个Key后,每次请求选择当前
+负载最低的可用Key,吞吐量随Key数线性增长:
+    - 每个Key有独立的令牌桶(AMAP_KEY_QPS,代替单Key时的全局限流AMAP_QPS)和
+      按自然日(北京时间)统计的调用次数,二者保存在共享SQLite中,多worker共用
+    - 返回配额错误的Key自动隔离: 10003(日配额用尽)隔离到次日零点,
+      10004(访问过于频繁)隔离 AMAP_KEY_COOLDOWN 秒
+    - 只有一个Key时不隔离也不逐Key限流,行为与单Key时相同
+"""
+
+import datetime
+import hashlib
+import time
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from ..config import get_settings
+from .cache_service import SharedRateLimiter, SharedStore, get_shared_store
+from .metrics_service import record_amap_key_quarantine
+
+# 日配额用尽
+INFOCODE_DAILY_QUOTA = "10003"
+# 访问过于频繁
+INFOCODE_TOO_FREQUENT = "10004"
+
+# 高德配额按北京时间的自然日重置
+QUOTA_TIMEZONE = datetime.timezone(datetime.timedelta(hours=8))
+
+
+class NoAvailableKey(Exception):
+    """所有Key都已隔离或用尽日配额"""
+
+
+def _key_id(key: str) -> str:
+    """Key的标识(不在数据库和日志中保存Key本身)"""
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=6).hexdigest()
+
+
+def _today() -> str:
+    """配额统计的日期(北京时间)"""
+    return datetime.datetime.now(QUOTA_TIMEZONE).strftime("%Y-%m-%d")
+
+
+def _next_reset() -> float:
+    """下一次日配额重置的时间戳(北京时间次日零点)"""
+    now = datetime.datetime.now(QUOTA_TIMEZONE)
+    tomorrow = (now + datetime.timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return tomorrow.timestamp()
+
+
+class AmapKeyPool:
+    """多Key负载均衡与配额隔离"""
+
+    def __init__(self, keys: List[str], store: SharedStore, qps: float = 0.0, daily_quota: int = 0,
+                 cooldown: float = 60.0):
+        """
+        初始化Key池
+
+        Args:
+            keys: Key列表(第一个为主Key)
+            store: 共享存储(需包含amap_keys和rate_limits表)
+            qps: 每个Key的QPS上限, 0表示不限(只有一个Key时不限)
+            daily_quota: 每个Key的日配额, 0表示不限
+            cooldown: 访问过于频繁(10004)时的隔离时间(秒)
+        """
+        self.keys = list(dict.fromkeys(k for k in keys if k))
+        self.store = store
+        self.daily_quota = daily_quota
+        self.cooldown = cooldown
+        self._ids: Dict[str, str] = {key: _key_id(key) for key in self.keys}
+        # QPS不限或只有一个Key(由全局限流控制)时不创建令牌桶
+        self._limiters = {
+            key: SharedRateLimiter(store, f"amap_key:{self._ids[key]}", qps) for key in self.keys
+        } if qps > 0 and len(self.keys) > 1 else {}
+
+    def _load(self) -> Dict[str, Tuple[int, float]]:
+        """读取各Key今天的调用次数和隔离截止时间"""
+        today = _today()
+        rows = self.store.connect().execute("SELECT key_id, day, used, quarantined_until FROM amap_keys").fetchall()
+        return {key_id: (used if day == today else 0, until) for key_id, day, used, until in rows}
+
+    def _candidates(self) -> List[str]:
+        """按今天的调用次数从少到多排列的可用Key"""
+        state = self._load()
+        now = time.time()
+        available = []
+        for key in self.keys:
+            used, until = state.get(self._ids[key], (0, 0.0))
+            if until > now or (self.daily_quota and used >= self.daily_quota):
+                continue
+            available.append((used, key))
+        return [key for _, key in sorted(available, key=lambda item: item[0])]
+
+    def acquire(self, timeout: float = 30.0) -> str:
+        """
+        选择负载最低且有QPS余量的Key,并计入今天的调用次数
+
+        只有一个Key时直接返回,不计数也不访问共享存储(限流由全局限流器负责)
+
+        Args:
+            timeout: 所有Key都没有QPS余量时的最长等待时间(秒)
+
+        Returns:
+            本次请求使用的Key
+
+        Raises:
+            NoAvailableKey: 所有Key都已隔离或用尽日配额
+        """
+        if len(self.keys) == 1:
+            return self.keys[0]
+        deadline = time.time() + timeout
+        while True:
+            candidates = self._candidates()
+            if not candidates:
+                raise NoAvailableKey("所有高德API Key均已隔离或用尽日配额")
+            waits = []
+            for key in candidates:
+                limiter = self._limiters.get(key)
+                wait = limiter.try_acquire() if limiter else 0.0
+                if wait <= 0:
+                    self._count(key)
+                    return key
+                waits.append(wait)
+            wait = min(waits)
+            if time.time() + wait > deadline:
+                # 与全局限流一致,等待超时后仍然发送,由上游决定是否拒绝
+                logger.warning("高德API Key池等待QPS余量超时")
+                self._count(candidates[0])
+                return candidates[0]
+            time.sleep(wait)
+
+    def _count(self, key: str) -> None:
+        """计入一次调用"""
+        today = _today()
+        self.store.connect().execute(
+            "INSERT INTO amap_keys (key_id, day, used) VALUES (?, ?, 1) "
+            "ON CONFLICT(key_id) DO UPDATE SET used = CASE WHEN day = excluded.day THEN used + 1 ELSE 1 END, "
+            "day = excluded.day",
+            (self._ids[key], today)
+        )
+
+    def report(self, key: str, infocode: Optional[str]) -> bool:
+        """
+        根据响应的infocode隔离返回配额错误的Key
+
+        Args:
+            key: 本次请求使用的Key
+            infocode: 高德响应中的infocode
+
+        Returns:
+            该Key是否被隔离
+        """
+        if infocode not in (INFOCODE_DAILY_QUOTA, INFOCODE_TOO_FREQUENT) or len(self.keys) == 1:
+            return False
+        if infocode == INFOCODE_DAILY_QUOTA:
+            reason, until = "daily_quota", _next_reset()
+        else:
+            reason, until = "too_frequent", time.time() + self.cooldown
+        self.store.connect().execute(
+            "INSERT INTO amap_keys (key_id, day, used, quarantined_until) VALUES (?, ?, 0, ?) "
+            "ON CONFLICT(key_id) DO UPDATE SET quarantined_until = MAX(quarantined_until, excluded.quarantined_until)",
+            (self._ids[key], _today(), until)
+        )
+        record_amap_key_quarantine(reason)
+        logger.warning(
+            f"高德API Key {self._ids[key]} 被隔离({reason}),"
+            f"至{datetime.datetime.fromtimestamp(until, QUOTA_TIMEZONE).strftime('%Y-%m-%d %H:%M:%S')}"
+        )
+        return True
+
+
+def create_key_pool() -> AmapKeyPool:
+    """按配置创建Key池(主Key + GD_API_KEYS)"""
+    settings = get_settings()
+    keys = [settings.gd_api_key] + [k.strip() for k in settings.gd_api_keys.split(",")]
+    return AmapKeyPool(
+        keys,
+        get_shared_store(),
+        qps=settings.amap_key_qps,
+        daily_quota=settings.amap_key_daily_quota,
+        cooldown=settings.amap_key_cooldown
+    )
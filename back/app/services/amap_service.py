@@ -1,13 +1,52 @@
 """高德地图API服务封装"""
 
+import asyncio
+import math
+import time
 import httpx
-from typing import List, Dict, Any, Optional
+from urllib.parse import urlencode
+from typing import AsyncIterator, List, Dict, Any, Optional, Tuple
+from fastapi.concurrency import run_in_threadpool
 from loguru import logger
 from ..config import get_settings
 from ..models.schemas import Location, POIInfo, WeatherInfo
+from .cancellation_service import check_cancelled
+from .deadline_service import upstream_timeout
+from .metrics_service import observe_upstream
+from .tracing_service import span
+from .cache_service import get_shared_cache, get_shared_store, SharedRateLimiter
+from .amap_batch_service import AmapBatcher
+from .amap_key_service import create_key_pool
+from .replay_service import create_http_client
 
-# 高德地图API基础URL
-AMAP_API_BASE_URL = "https://restapi.amap.com/v3"
+# 各接口响应的缓存时间(秒)
+POI_CACHE_TTL = 24 * 3600
+POI_DETAIL_CACHE_TTL = 24 * 3600
+WEATHER_CACHE_TTL = 30 * 60
+GEOCODE_CACHE_TTL = 7 * 24 * 3600
+ROUTE_CACHE_TTL = 3600
+
+# 请求超时时间(秒),规划请求中不超过剩余时间
+REQUEST_TIMEOUT = 30.0
+
+# POI搜索每页的最大条数(高德接口限制)
+POI_MAX_PAGE_SIZE = 25
+
+# POI搜索最多可翻到的页数(高德接口限制)
+POI_MAX_PAGES = 100
+
+# 分页搜索时同时请求的最大页数(实际速率仍受共享限流约束)
+POI_PAGE_CONCURRENCY = 5
+
+
+def _parse_rating(item: Dict[str, Any]) -> Optional[float]:
+    """解析POI的评分(extensions=all时返回在biz_ext中,没有评分时为空列表)"""
+    biz_ext = item.get("biz_ext")
+    rating = biz_ext.get("rating") if isinstance(biz_ext, dict) else None
+    try:
+        return float(rating) if isinstance(rating, str) and rating else None
+    except ValueError:
+        return None
 
 class AmapService:
     """高德地图服务封装类"""
@@ -16,13 +55,85 @@ class AmapService:
         """初始化服务"""
         settings = get_settings()
         self.api_key = settings.gd_api_key
-        self.client = httpx.Client(timeout=30.0)
+        self.base_url = settings.amap_base_url.rstrip("/")
+        self.client = create_http_client("amap", timeout=REQUEST_TIMEOUT)
+        self.cache = get_shared_cache() if settings.cache_enabled else None
+        self.key_pool = create_key_pool()
+        # 多个Key时按Key限流,吞吐量随Key数增长;只有一个Key时使用全局限流
+        self.rate_limiter = (
+            SharedRateLimiter(get_shared_store(), "amap", settings.amap_qps)
+            if len(self.key_pool.keys) == 1 else None
+        )
+        # 合并结果取决于请求时序,录制/回放时逐个请求以保证请求指纹可复现
+        self.batcher = (
+            AmapBatcher(self.client, self.base_url, self.api_key, settings.amap_batch_window)
+            if settings.amap_batch_enabled and settings.upstream_mode == "live" else None
+        )
         
         if not self.api_key:
             logger.error("高德地图API Key未配置,请在.env文件中设置GD_API_KEY")
             raise ValueError("高德地图API Key未配置,请在.env文件中设置GD_API_KEY")
+
+    def _request(self, endpoint: str, path: str, params: Dict[str, Any], ttl: float = 0) -> Dict[str, Any]:
+        """
+        发送高德地图API请求,优先使用共享缓存
+
+        Args:
+            endpoint: 接口名称(用于指标标签)
+            path: API路径
+            params: 请求参数
+            ttl: 缓存时间(秒), 0表示不缓存
+
+        Returns:
+            响应JSON
+        """
+        if not ttl or self.cache is None:
+            return self._fetch(endpoint, path, params)
+        # 缓存键不包含API Key
+        cache_key = f"amap:{path}?" + urlencode(sorted((k, v) for k, v in params.items() if k != "key"))
+        return self.cache.get_or_load(
+            "amap",
+            cache_key,
+            ttl,
+            lambda: self._fetch(endpoint, path, params),
+            should_cache=lambda data: data.get("status") == "1"
+        )
+
+    def _fetch(self, endpoint: str, path: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """请求高德地图API(使用Key池中负载最低的Key),Key返回配额错误时隔离并换一个Key重试一次"""
+        for _ in range(2):
+            # 客户端已断开时不再占用限流配额和高德调用量
+            check_cancelled("amap")
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire(timeout=upstream_timeout(REQUEST_TIMEOUT))
+            key = self.key_pool.acquire(timeout=upstream_timeout(REQUEST_TIMEOUT))
+            check_cancelled("amap")
+            data = self._send(endpoint, path, {**params, "key": key}, upstream_timeout(REQUEST_TIMEOUT))
+            if not (isinstance(data, dict) and self.key_pool.report(key, data.get("infocode"))):
+                break
+        return data
+
+    def _send(self, endpoint: str, path: str, params: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+        """发送请求并记录耗时"""
+        if self.batcher is not None:
+            # 与同一时间窗口内的其他请求合并发送,耗时由合并器记录
+            with span(f"amap.{endpoint}", batched=True):
+                return self.batcher.call(endpoint, path, params, timeout)
+        start = time.perf_counter()
+        status = "error"
+        try:
+            with span(f"amap.{endpoint}") as current:
+                response = self.client.get(f"{self.base_url}/{path}", params=params, timeout=timeout)
+                status = str(response.status_code)
+                if current:
+                    current.set_attribute("http.status_code", status)
+                response.raise_for_status()
+                return response.json()
+        finally:
+            observe_upstream("amap", endpoint, status, time.perf_counter() - start)
     
-    def search_poi(self, keywords: str, city: str, citylimit: bool = True) -> List[POIInfo]:
+    def search_poi(self, keywords: str, city: str, citylimit: bool = True, page: int = 1,
+                   offset: int = 20, extensions: str = "base") -> List[POIInfo]:
         """
         搜索POI
         
@@ -30,10 +141,35 @@ class AmapService:
             keywords: 搜索关键词
             city: 城市
             citylimit: 是否限制在城市范围内
+            page: 页码(从1开始)
+            offset: 每页条数(最大25)
+            extensions: base只返回基本信息,all同时返回评分等扩展信息
             
         Returns:
             POI信息列表
         """
+        return self.search_poi_page(keywords, city, citylimit, page, offset, extensions)[0]
+
+    def search_poi_page(self, keywords: str, city: str, citylimit: bool = True, page: int = 1,
+                        offset: int = 20, extensions: str = "base", strict: bool = False) -> Tuple[List[POIInfo], int]:
+        """
+        搜索一页POI,同时返回结果总数
+        
+        Args:
+            keywords: 搜索关键词
+            city: 城市
+            citylimit: 是否限制在城市范围内
+            page: 页码(从1开始)
+            offset: 每页条数(最大25)
+            extensions: base只返回基本信息,all同时返回评分等扩展信息
+            strict: 请求失败或高德返回错误时抛出RuntimeError,否则记录日志并返回空结果
+            
+        Returns:
+            (本页POI信息列表, 结果总数)
+
+        Raises:
+            RuntimeError: strict为True且请求失败
+        """
         try:
             # 构建请求参数
             params = {
@@ -41,17 +177,16 @@ class AmapService:
                 "keywords": keywords,
                 "city": city,
                 "citylimit": "true" if citylimit else "false",
-                "extensions": "base",
+                "page": page,
+                "offset": max(1, min(offset, POI_MAX_PAGE_SIZE)),
+                "extensions": extensions,
                 "output": "json"
             }
             
             # 发送请求
-            response = self.client.get(f"{AMAP_API_BASE_URL}/place/text", params=params)
-            response.raise_for_status()
-            
-            # 解析结果
-            data = response.json()
+            data = self._request("search_poi", "place/text", params, ttl=POI_CACHE_TTL)
             pois = []
+            total = 0
             
             if data.get("status") == "1" and "pois" in data:
                 for item in data["pois"]:
@@ -69,23 +204,97 @@ class AmapService:
                         type=item.get("type", ""),
                         address=item.get("address", ""),
                         location=location,
-                        tel=item.get("tel", "")
+                        tel=item.get("tel", ""),
+                        rating=_parse_rating(item)
                     )
                     pois.append(poi_info)
+                total = int(data.get("count") or 0)
             else:
                 error_info = data.get("info", "未知错误")
                 error_code = data.get("infocode", "未知错误码")
                 logger.error(f"高德地图API返回错误: {error_info} (错误码: {error_code})")
+                if strict:
+                    raise RuntimeError(f"高德地图API返回错误: {error_info} (错误码: {error_code})")
             
-            return pois
+            return pois, total
             
         except httpx.HTTPStatusError as e:
             logger.error(f"POI搜索HTTP错误: {e.response.status_code} - {e.response.text}")
-            return []
+            if strict:
+                raise RuntimeError(f"POI搜索HTTP错误: {e.response.status_code}") from e
+            return [], 0
         except Exception as e:
+            if strict and isinstance(e, RuntimeError):
+                raise
             logger.error(f"POI搜索失败: {str(e)}")
-            return []
+            if strict:
+                raise RuntimeError(f"POI搜索失败: {str(e)}") from e
+            return [], 0
     
+    async def stream_poi(self, keywords: str, city: str, citylimit: bool = True, limit: int = 100,
+                         start: int = 0, extensions: str = "base") -> AsyncIterator[POIInfo]:
+        """
+        分页搜索POI,以异步流的方式按结果顺序逐条返回
+        
+        先请求起始位置所在的页得到结果总数,再在限流范围内并发请求其余需要的页,
+        只请求到 start + limit 为止;调用方提前停止读取时取消尚未开始的页。
+        
+        Args:
+            keywords: 搜索关键词
+            city: 城市
+            citylimit: 是否限制在城市范围内
+            limit: 最多返回的条数
+            start: 起始位置(从0开始,用于游标翻页)
+            extensions: base只返回基本信息,all同时返回评分等扩展信息
+            
+        Yields:
+            POI信息
+            
+        Raises:
+            RuntimeError: 某一页请求失败(第一页失败时没有任何结果;中间某一页失败时
+                已返回的结果仍然有效,可从失败位置继续)
+        """
+        page_size = POI_MAX_PAGE_SIZE
+        first_page = start // page_size + 1
+        if limit <= 0 or first_page > POI_MAX_PAGES:
+            return
+
+        pois, total = await run_in_threadpool(
+            self.search_poi_page, keywords, city, citylimit, first_page, page_size, extensions, True
+        )
+        end = min(total, start + limit, POI_MAX_PAGES * page_size)
+        position = start
+        for poi in pois[start % page_size:]:
+            if position >= end:
+                return
+            yield poi
+            position += 1
+
+        semaphore = asyncio.Semaphore(POI_PAGE_CONCURRENCY)
+
+        async def fetch(page: int) -> List[POIInfo]:
+            async with semaphore:
+                result, _ = await run_in_threadpool(
+                    self.search_poi_page, keywords, city, citylimit, page, page_size, extensions, True
+                )
+                return result
+
+        # 其余页并发请求,按页码顺序返回
+        tasks = [asyncio.create_task(fetch(page)) for page in range(first_page + 1, math.ceil(end / page_size) + 1)]
+        try:
+            for page, task in enumerate(tasks, start=first_page + 1):
+                pois = await task
+                if not pois:
+                    raise RuntimeError(f"POI搜索第{page}页请求失败")
+                for poi in pois:
+                    if position >= end:
+                        return
+                    yield poi
+                    position += 1
+        finally:
+            for task in tasks:
+                task.cancel()
+
     def get_weather(self, city: str) -> List[WeatherInfo]:
         """
         查询天气
@@ -106,11 +315,7 @@ class AmapService:
             }
             
             # 发送请求
-            response = self.client.get(f"{AMAP_API_BASE_URL}/weather/weatherInfo", params=params)
-            response.raise_for_status()
-            
-            # 解析结果
-            data = response.json()
+            data = self._request("weather", "weather/weatherInfo", params, ttl=WEATHER_CACHE_TTL)
             weather_infos = []
             
             if data.get("status") == "1" and "forecasts" in data:
@@ -191,11 +396,7 @@ class AmapService:
                 params["destinationcity"] = destination_city
                 
             # 发送请求 - 修复URL拼接错误
-            response = self.client.get(f"{AMAP_API_BASE_URL}/direction/{api_path}", params=params)
-            response.raise_for_status()
-            
-            # 解析结果
-            data = response.json()
+            data = self._request("route", f"direction/{api_path}", params, ttl=ROUTE_CACHE_TTL)
             
             if data.get("status") == "1" and "route" in data:
                 route_data = data["route"]
@@ -245,11 +446,7 @@ class AmapService:
                 params["city"] = city
                 
             # 发送请求
-            response = self.client.get(f"{AMAP_API_BASE_URL}/geocode/geo", params=params)
-            response.raise_for_status()
-            
-            # 解析结果
-            data = response.json()
+            data = self._request("geocode", "geocode/geo", params, ttl=GEOCODE_CACHE_TTL)
             
             if data.get("status") == "1" and "geocodes" in data:
                 geocodes = data["geocodes"]
@@ -292,11 +489,7 @@ class AmapService:
             }
             
             # 发送请求
-            response = self.client.get(f"{AMAP_API_BASE_URL}/place/detail", params=params)
-            response.raise_for_status()
-            
-            # 解析结果
-            data = response.json()
+            data = self._request("poi_detail", "place/detail", params, ttl=POI_DETAIL_CACHE_TTL)
             
             if data.get("status") == "1" and "pois" in data:
                 pois = data["pois"]
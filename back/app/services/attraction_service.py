@@ -0,0 +1,164 @@
+"""景点候选池服务
+
+按旅行偏好为每个关键词并发搜索高德POI(加上每个城市通用的默认关键词),
+候选不足时再翻页,然后按POI ID和地理位置去重,按偏好匹配数和评分排序,
+截取与旅行天数相当的候选池交给行程规划。无需经过LLM生成工具调用。
+"""
+
+import math
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+
+from loguru import logger
+
+from ..config import get_settings
+from ..models.schemas import Attraction, Location, POIInfo
+from .amap_service import POI_MAX_PAGE_SIZE, POI_PAGE_CONCURRENCY, get_amap_service
+from .tracing_service import submit_with_context
+
+# 距离在该范围内(米)的POI视为同一地点(同一景点的不同入口、门票点等)
+DEDUP_DISTANCE_M = 80.0
+
+# 候选池的最小数量
+MIN_POOL_SIZE = 6
+
+# 默认游览时间(分钟)
+DEFAULT_VISIT_DURATION = 120
+
+
+def _distance_m(a: Location, b: Location) -> float:
+    """两点之间的球面距离(米)"""
+    lon1, lat1, lon2, lat2 = map(math.radians, (a.longitude, a.latitude, b.longitude, b.latitude))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 6371000.0 * 2 * math.asin(math.sqrt(h))
+
+
+@dataclass
+class _Candidate:
+    """去重后的候选POI及命中它的关键词"""
+    poi: POIInfo
+    keywords: Set[str] = field(default_factory=set)
+    order: int = 0
+
+
+class AttractionGatherer:
+    """按偏好并发搜索景点并生成候选池"""
+
+    def __init__(self):
+        settings = get_settings()
+        self.amap = get_amap_service()
+        self.default_keywords = [k.strip() for k in settings.attraction_default_keywords.split(",") if k.strip()]
+        self.pois_per_day = max(1, settings.attraction_pois_per_day)
+        self.max_pages = max(1, settings.attraction_max_pages)
+
+    def pool_size(self, days: int) -> int:
+        """候选池大小"""
+        return max(MIN_POOL_SIZE, self.pois_per_day * max(1, days))
+
+    def gather(self, city: str, preferences: List[str], days: int) -> List[Attraction]:
+        """
+        生成景点候选池
+
+        Args:
+            city: 城市
+            preferences: 旅行偏好(每个偏好作为一个搜索关键词)
+            days: 旅行天数
+
+        Returns:
+            按推荐顺序排列的景点列表,没有关键词或搜索全部失败时为空列表
+        """
+        preferences = list(dict.fromkeys(p.strip() for p in preferences if p and p.strip()))
+        keywords = list(dict.fromkeys(preferences + self.default_keywords))
+        if not keywords:
+            return []
+        size = self.pool_size(days)
+        candidates: Dict[str, _Candidate] = {}
+        # 关键词 -> 结果总数,用于判断是否还有下一页
+        totals: Dict[str, int] = {}
+
+        with ThreadPoolExecutor(max_workers=min(len(keywords), POI_PAGE_CONCURRENCY)) as executor:
+            for page in range(1, self.max_pages + 1):
+                pending = [k for k in keywords if page == 1 or totals.get(k, 0) > (page - 1) * POI_MAX_PAGE_SIZE]
+                if not pending or (page > 1 and len(candidates) >= size):
+                    break
+                futures = [
+                    (keyword, submit_with_context(executor, self.amap.search_poi_page, keyword, city,
+                                                  page=page, offset=POI_MAX_PAGE_SIZE, extensions="all"))
+                    for keyword in pending
+                ]
+                for keyword, future in futures:
+                    try:
+                        pois, totals[keyword] = future.result()
+                    except Exception as e:
+                        # 单个关键词失败不影响其他关键词的结果,也不再翻页
+                        logger.warning(f"景点搜索失败: {keyword}, {str(e)}")
+                        totals[keyword] = 0
+                        continue
+                    for poi in pois:
+                        self._add(candidates, poi, keyword)
+
+        ranked = self._rank(list(candidates.values()), preferences)[:size]
+        logger.info(
+            f"景点候选池: {city}, 关键词{len(keywords)}个, 去重后{len(candidates)}个, 选取{len(ranked)}个"
+        )
+        return [self._to_attraction(candidate, preferences) for candidate in ranked]
+
+    @staticmethod
+    def _add(candidates: Dict[str, _Candidate], poi: POIInfo, keyword: str) -> None:
+        """按POI ID和地理位置去重后加入候选"""
+        existing = candidates.get(poi.id)
+        if existing is None and (poi.location.longitude or poi.location.latitude):
+            existing = next(
+                (c for c in candidates.values() if _distance_m(c.poi.location, poi.location) <= DEDUP_DISTANCE_M),
+                None
+            )
+        if existing is None:
+            existing = candidates[poi.id] = _Candidate(poi, order=len(candidates))
+        elif (poi.rating or 0) > (existing.poi.rating or 0):
+            # 同一地点保留评分更高的记录
+            existing.poi = poi
+        existing.keywords.add(keyword)
+
+    @staticmethod
+    def _preference_matches(candidate: _Candidate, preferences: List[str]) -> int:
+        """候选匹配的偏好数: 由该偏好搜索命中或类型中包含该偏好"""
+        return sum(1 for p in preferences if p in candidate.keywords or p in candidate.poi.type)
+
+    def _rank(self, candidates: List[_Candidate], preferences: List[str]) -> List[_Candidate]:
+        """按偏好匹配数、评分和搜索结果中的原始顺序排序"""
+        return sorted(
+            candidates,
+            key=lambda c: (-self._preference_matches(c, preferences), -(c.poi.rating or 0), c.order)
+        )
+
+    @staticmethod
+    def _to_attraction(candidate: _Candidate, preferences: List[str]) -> Attraction:
+        """转换为景点"""
+        poi = candidate.poi
+        matched = [p for p in preferences if p in candidate.keywords]
+        category = matched[0] if matched else (poi.type.split(";")[-1] if poi.type else "景点")
+        return Attraction(
+            name=poi.name,
+            address=poi.address or "",
+            location=poi.location,
+            visit_duration=DEFAULT_VISIT_DURATION,
+            description=poi.type or category,
+            category=category,
+            rating=poi.rating,
+            poi_id=poi.id
+        )
+
+
+# 全局服务实例
+_attraction_gatherer = None
+
+
+def get_attraction_gatherer() -> AttractionGatherer:
+    """获取景点候选池服务实例(单例模式)"""
+    global _attraction_gatherer
+
+    if _attraction_gatherer is None:
+        _attraction_gatherer = AttractionGatherer()
+
+    return _attraction_gatherer
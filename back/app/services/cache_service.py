@@ -0,0 +1,265 @@
+"""跨进程共享缓存与限流服务
+
+多worker部署时,各进程通过同一个SQLite数据库(WAL模式)共享上游响应缓存和限流状态,
+避免进程数增加后上游调用量和配额消耗成倍增长。
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from loguru import logger
+
+from ..config import get_settings
+from .metrics_service import record_cache
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS leases (
+    key TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rate_limits (
+    name TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS amap_keys (
+    key_id TEXT PRIMARY KEY,
+    day TEXT NOT NULL,
+    used INTEGER NOT NULL,
+    quarantined_until REAL NOT NULL DEFAULT 0
+);
+"""
+
+
+class SharedStore:
+    """基于SQLite WAL的共享存储,每个线程(及fork后的每个进程)使用独立连接"""
+
+    def __init__(self, path: str, schema: str = _SCHEMA):
+        """
+        打开数据库并建表
+
+        Args:
+            path: 数据库文件路径
+            schema: 建表语句
+        """
+        self.path = path
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        with self.connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(schema)
+
+    def connect(self) -> sqlite3.Connection:
+        """获取当前线程的连接,fork之后自动重新打开"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=10000")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+
+class SharedCache:
+    """带过期时间的共享键值缓存"""
+
+    def __init__(self, store: SharedStore):
+        self.store = store
+
+    def get(self, key: str, allow_stale: bool = False) -> Optional[Any]:
+        """
+        读取缓存
+
+        Args:
+            key: 缓存键
+            allow_stale: 是否允许返回已过期的值
+
+        Returns:
+            缓存值,不存在时返回None
+        """
+        row = self.store.connect().execute(
+            "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        if not allow_stale and row[1] < time.time():
+            return None
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        """
+        写入缓存
+
+        Args:
+            key: 缓存键
+            value: 可JSON序列化的值
+            ttl: 有效期(秒)
+        """
+        self.store.connect().execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, json.dumps(value, ensure_ascii=False), time.time() + ttl)
+        )
+
+    def get_or_load(self, cache_name: str, key: str, ttl: float, loader: Callable[[], Any],
+                    should_cache: Callable[[Any], bool] = lambda v: True, lease_timeout: float = 30.0) -> Any:
+        """
+        读取缓存,未命中时调用loader加载
+
+        同一个键同时只有一个进程/线程会调用loader,其他调用方等待其结果,
+        避免多个worker同时未命中时重复请求上游。
+
+        Args:
+            cache_name: 缓存名称(用于指标标签)
+            key: 缓存键
+            ttl: 有效期(秒)
+            loader: 加载函数
+            should_cache: 判断结果是否可缓存(例如上游返回错误时不缓存)
+            lease_timeout: 加载租约的最长持有时间(秒)
+
+        Returns:
+            缓存值或加载结果
+        """
+        value = self.get(key)
+        if value is not None:
+            record_cache(cache_name, True)
+            return value
+        record_cache(cache_name, False)
+
+        owner = uuid.uuid4().hex
+        if not self._acquire_lease(key, owner, lease_timeout):
+            # 其他调用方正在加载,等待其写入缓存
+            deadline = time.time() + lease_timeout
+            while time.time() < deadline:
+                time.sleep(0.05)
+                value = self.get(key)
+                if value is not None:
+                    return value
+                if self._acquire_lease(key, owner, lease_timeout):
+                    break
+        try:
+            value = loader()
+            if value is not None and should_cache(value):
+                self.set(key, value, ttl)
+            return value
+        finally:
+            self._release_lease(key, owner)
+
+    def _acquire_lease(self, key: str, owner: str, timeout: float) -> bool:
+        """尝试获取加载租约,已过期的租约可被抢占"""
+        now = time.time()
+        conn = self.store.connect()
+        conn.execute("DELETE FROM leases WHERE key = ? AND expires_at < ?", (key, now))
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO leases (key, owner, expires_at) VALUES (?, ?, ?)",
+            (key, owner, now + timeout)
+        )
+        return cursor.rowcount == 1
+
+    def _release_lease(self, key: str, owner: str) -> None:
+        """释放加载租约"""
+        self.store.connect().execute("DELETE FROM leases WHERE key = ? AND owner = ?", (key, owner))
+
+    def purge_expired(self) -> int:
+        """清理过期的缓存项,返回清理数量"""
+        cursor = self.store.connect().execute("DELETE FROM cache WHERE expires_at < ?", (time.time(),))
+        return cursor.rowcount
+
+
+class SharedRateLimiter:
+    """跨进程共享的令牌桶限流器"""
+
+    def __init__(self, store: SharedStore, name: str, rate: float, burst: Optional[float] = None):
+        """
+        Args:
+            store: 共享存储
+            name: 限流器名称
+            rate: 每秒令牌数, 0表示不限流
+            burst: 桶容量,默认等于rate
+        """
+        self.store = store
+        self.name = name
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate, 1.0)
+
+    def acquire(self, timeout: float = 30.0) -> bool:
+        """
+        获取一个令牌,必要时等待
+
+        Args:
+            timeout: 最长等待时间(秒)
+
+        Returns:
+            是否成功获取
+        """
+        if self.rate <= 0:
+            return True
+        deadline = time.time() + timeout
+        while True:
+            wait = self.try_acquire()
+            if wait <= 0:
+                return True
+            if time.time() + wait > deadline:
+                logger.warning(f"限流器 {self.name} 等待超时")
+                return False
+            time.sleep(wait)
+
+    def try_acquire(self) -> float:
+        """尝试扣减令牌,成功返回0,否则返回需要等待的秒数"""
+        conn = self.store.connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated_at FROM rate_limits WHERE name = ?", (self.name,)).fetchone()
+            tokens = self.burst if row is None else min(self.burst, row[0] + (now - row[1]) * self.rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / self.rate
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_limits (name, tokens, updated_at) VALUES (?, ?, ?)",
+                (self.name, tokens, now)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+
+# 全局共享存储实例
+_shared_store = None
+_shared_cache = None
+
+
+def get_shared_store() -> SharedStore:
+    """获取共享存储实例(单例模式)"""
+    global _shared_store
+
+    if _shared_store is None:
+        _shared_store = SharedStore(get_settings().cache_db_path)
+
+    return _shared_store
+
+
+def get_shared_cache() -> SharedCache:
+    """获取共享缓存实例(单例模式)"""
+    global _shared_cache
+
+    if _shared_cache is None:
+        _shared_cache = SharedCache(get_shared_store())
+
+    return _shared_cache
@@ -0,0 +1,157 @@
+"""请求取消服务
+
+客户端断开连接后,后端继续生成的计划没有人读取,却仍在消耗LLM token和高德配额。
+每个可取消的请求持有一个取消令牌,放在上下文变量中随 run_in_threadpool 和
+submit_with_context 传递到规划线程和阶段子任务:
+    - 路由在等待结果期间监听连接断开消息,断开时设置令牌并取消等待(含准入排队)
+    - 上游请求在发出前、流式生成在每个分块之间检查令牌,已取消时立即中止,
+      流式响应关闭连接后上游也会停止生成
+"""
+
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Callable, Optional, TypeVar
+
+from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
+from loguru import logger
+
+from .metrics_service import record_cancellation
+
+# 客户端已断开时的响应状态码(沿用nginx的 499 Client Closed Request,只出现在日志中)
+CLIENT_CLOSED_REQUEST = 499
+
+T = TypeVar("T")
+
+
+class RequestCancelled(BaseException):
+    """请求已被取消
+
+    与 asyncio.CancelledError 一样继承BaseException,
+    避免被各阶段兜底用的 except Exception 吞掉后继续执行后续阶段。
+    """
+
+    def __init__(self, reason: str = "client_disconnected"):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class CancelToken:
+    """线程安全的取消令牌"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self.reason: Optional[str] = None
+
+    @property
+    def cancelled(self) -> bool:
+        """是否已取消"""
+        return self._event.is_set()
+
+    def cancel(self, reason: str = "client_disconnected") -> None:
+        """取消令牌"""
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    def raise_if_cancelled(self) -> None:
+        """已取消时抛出RequestCancelled"""
+        if self._event.is_set():
+            raise RequestCancelled(self.reason or "client_disconnected")
+
+
+_current_token: ContextVar[Optional[CancelToken]] = ContextVar("cancel_token", default=None)
+
+
+def current_cancel_token() -> Optional[CancelToken]:
+    """获取当前请求的取消令牌,不在可取消的请求中时返回None"""
+    return _current_token.get()
+
+
+def check_cancelled(kind: Optional[str] = None) -> None:
+    """
+    检查当前请求是否已取消,已取消时抛出RequestCancelled
+
+    Args:
+        kind: 被中止的工作类型(llm/amap等),传入时记录取消指标
+    """
+    token = _current_token.get()
+    if token is not None and token.cancelled:
+        if kind:
+            record_cancellation(kind)
+        token.raise_if_cancelled()
+
+
+@asynccontextmanager
+async def cancel_on_disconnect(http_request: Request, route: str) -> AsyncIterator[CancelToken]:
+    """
+    在上下文内监听客户端连接,断开时取消令牌和当前任务
+
+    上下文内通过 run_in_threadpool 执行的同步代码会继承令牌;线程本身无法被强制中断,
+    会在下一个检查点(上游请求前或流式生成的下一个分块)抛出RequestCancelled退出。
+
+    Args:
+        http_request: HTTP请求
+        route: 路由名称(用于指标标签)
+
+    Yields:
+        取消令牌
+
+    Raises:
+        RequestCancelled: 客户端已断开连接
+    """
+    token = CancelToken()
+    context_token = _current_token.set(token)
+    task = asyncio.current_task()
+
+    async def watch() -> None:
+        # 请求体已读取完毕,之后收到的消息只有断开通知;
+        # 不使用 is_disconnected(),它在 BaseHTTPMiddleware 之下始终返回False
+        while (await http_request.receive())["type"] != "http.disconnect":
+            pass
+        logger.warning(f"客户端已断开连接,取消请求: {route}")
+        token.cancel("client_disconnected")
+        task.cancel()
+
+    watcher = asyncio.create_task(watch())
+    try:
+        yield token
+    except (asyncio.CancelledError, RequestCancelled):
+        if not token.cancelled:
+            raise
+        # 由本上下文发起的取消,转换为RequestCancelled交给路由处理
+        # Task.uncancel() 只在Python 3.11+中存在,3.10中捕获CancelledError即可继续执行
+        if hasattr(task, "uncancel") and task.cancelling():
+            task.uncancel()
+        record_cancellation(route)
+        raise RequestCancelled(token.reason or "client_disconnected")
+    finally:
+        watcher.cancel()
+        _current_token.reset(context_token)
+
+
+async def run_in_threadpool_joined(func: Callable[..., T], *args: Any) -> T:
+    """
+    在线程池中执行函数,等待期间被取消时仍等到线程退出后才返回
+
+    线程在下一个取消检查点才会退出,直接返回会让调用方提前释放准入名额等资源,
+    而线程仍在运行。
+
+    Args:
+        func: 要执行的函数
+        *args: 函数参数
+
+    Returns:
+        函数返回值
+    """
+    future = asyncio.ensure_future(run_in_threadpool(func, *args))
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        # 线程收到取消令牌后会抛出RequestCancelled,这里只等待它结束
+        await asyncio.wait([future])
+        if not future.cancelled():
+            future.exception()
+        raise
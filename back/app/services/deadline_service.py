@@ -0,0 +1,216 @@
+"""规划截止时间与降级
+
+每次规划请求带一个截止时间,放在上下文变量中随 run_in_threadpool 和
+submit_with_context 传递到各阶段和上游调用:
+    - 上游请求的超时不超过剩余时间,截止时间已过时直接抛出DeadlineExceeded
+    - 每个阶段开始前比较剩余时间和该阶段的预计耗时,不足时提前改用缓存、
+      过期缓存或本地计算的数据,而不是等到LLM超时后再兜底
+    - 降级的阶段记录在截止时间对象上,由路由写入响应
+"""
+
+import math
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from loguru import logger
+
+from .metrics_service import record_degradation
+
+# 各阶段耗时的初始估计(秒): 阶段 -> (固定部分, 每天增加的部分)
+STAGE_ESTIMATES: Dict[str, Tuple[float, float]] = {
+    "attractions": (3.0, 0.0),
+    "weather": (2.0, 0.0),
+    "hotels": (3.0, 0.0),
+    "planner": (5.0, 5.0),
+    "enrich": (2.0, 0.0),
+}
+
+# 平滑阶段耗时的系数
+EWMA_ALPHA = 0.2
+
+
+class DeadlineExceeded(Exception):
+    """已超过规划截止时间
+
+    继承Exception,各阶段已有的异常兜底会直接改用默认数据。
+    """
+
+
+class Deadline:
+    """一次规划的截止时间和降级记录"""
+
+    def __init__(self, seconds: float):
+        """
+        初始化截止时间
+
+        Args:
+            seconds: 总时限(秒),0或负数表示不限制
+        """
+        self.expires_at = time.monotonic() + seconds if seconds > 0 else math.inf
+        self.degradations: List[str] = []
+        self._lock = threading.Lock()
+
+    def remaining(self) -> float:
+        """剩余时间(秒)"""
+        return self.expires_at - time.monotonic()
+
+    def degrade(self, stage: str, fallback: str) -> None:
+        """
+        记录一次降级
+
+        Args:
+            stage: 阶段名称
+            fallback: 改用的数据来源(cache/local/default/skipped)
+        """
+        entry = f"{stage}:{fallback}"
+        with self._lock:
+            if entry in self.degradations:
+                return
+            self.degradations.append(entry)
+        record_degradation(stage, fallback)
+        logger.warning(f"规划阶段降级: {entry}, 剩余时间{max(0.0, self.remaining()):.1f}s")
+
+
+class StageEstimator:
+    """按阶段估计耗时,随天数增长的阶段按天归一化,只保存在当前进程内"""
+
+    def __init__(self):
+        self._estimates: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _units(stage: str, days: int) -> int:
+        """归一化的单位数"""
+        return max(1, days) if STAGE_ESTIMATES.get(stage, (0.0, 0.0))[1] else 1
+
+    def estimate(self, stage: str, days: int = 1) -> float:
+        """
+        预计阶段耗时
+
+        Args:
+            stage: 阶段名称
+            days: 旅行天数
+
+        Returns:
+            预计耗时(秒)
+        """
+        with self._lock:
+            per_unit = self._estimates.get(stage)
+        if per_unit is None:
+            base, per_day = STAGE_ESTIMATES.get(stage, (0.0, 0.0))
+            return base + per_day * days
+        return per_unit * self._units(stage, days)
+
+    def observe(self, stage: str, days: int, seconds: float) -> None:
+        """
+        记录一次阶段的实际耗时
+
+        Args:
+            stage: 阶段名称
+            days: 旅行天数
+            seconds: 实际耗时(秒)
+        """
+        value = seconds / self._units(stage, days)
+        with self._lock:
+            previous = self._estimates.get(stage)
+            self._estimates[stage] = value if previous is None else (1 - EWMA_ALPHA) * previous + EWMA_ALPHA * value
+
+
+_current_deadline: ContextVar[Optional[Deadline]] = ContextVar("plan_deadline", default=None)
+_stage_estimator = StageEstimator()
+
+
+@contextmanager
+def plan_deadline(seconds: float) -> Iterator[Deadline]:
+    """
+    在上下文内设置规划截止时间
+
+    Args:
+        seconds: 总时限(秒),0表示不限制(仍然收集降级记录)
+
+    Yields:
+        截止时间
+    """
+    deadline = Deadline(seconds)
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
+
+
+def current_deadline() -> Optional[Deadline]:
+    """获取当前请求的截止时间,不在规划请求中时返回None"""
+    return _current_deadline.get()
+
+
+def upstream_timeout(default: float) -> float:
+    """
+    计算上游请求的超时时间,不超过剩余时间
+
+    Args:
+        default: 上游配置的超时时间(秒)
+
+    Returns:
+        本次请求的超时时间(秒)
+
+    Raises:
+        DeadlineExceeded: 截止时间已过
+    """
+    deadline = _current_deadline.get()
+    if deadline is None:
+        return default
+    remaining = deadline.remaining()
+    if remaining <= 0:
+        raise DeadlineExceeded("已超过规划截止时间")
+    return min(default, remaining)
+
+
+def check_deadline() -> None:
+    """截止时间已过时抛出DeadlineExceeded(用于流式生成等长时间操作的中途检查)"""
+    deadline = _current_deadline.get()
+    if deadline is not None and deadline.remaining() <= 0:
+        raise DeadlineExceeded("已超过规划截止时间")
+
+
+def has_time_for(stage: str, days: int = 1) -> bool:
+    """
+    判断剩余时间是否足够执行阶段
+
+    Args:
+        stage: 阶段名称
+        days: 旅行天数
+
+    Returns:
+        没有截止时间或剩余时间不少于预计耗时时返回True
+    """
+    deadline = _current_deadline.get()
+    if deadline is None or deadline.expires_at == math.inf:
+        return True
+    return deadline.remaining() >= _stage_estimator.estimate(stage, days)
+
+
+@contextmanager
+def time_stage(stage: str, days: int = 1) -> Iterator[None]:
+    """
+    记录阶段成功执行的耗时,用于后续估计(出错时不记录)
+
+    Args:
+        stage: 阶段名称
+        days: 旅行天数
+    """
+    start = time.perf_counter()
+    yield
+    _stage_estimator.observe(stage, days, time.perf_counter() - start)
+
+
+def note_degradation(stage: str, fallback: str) -> None:
+    """在当前请求的截止时间上记录一次降级,不在规划请求中时只记录指标"""
+    deadline = _current_deadline.get()
+    if deadline is not None:
+        deadline.degrade(stage, fallback)
+    else:
+        record_degradation(stage, fallback)
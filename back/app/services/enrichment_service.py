@@ -0,0 +1,157 @@
+"""POI信息补全服务
+
+规划器生成的景点和酒店只有名称和大致信息。补全阶段在返回计划之前,将每个景点/酒店
+匹配到高德POI,并发补全 poi_id、真实坐标、图片列表和 image_url,前端拿到计划后
+无需再逐个请求图片和POI详情。
+"""
+
+import difflib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Union
+
+from loguru import logger
+
+from ..config import get_settings
+from ..models.schemas import Attraction, Hotel, Location, TripPlan
+from .amap_service import get_amap_service
+from .cache_service import get_shared_cache
+from .image_cache_service import get_image_cache_service
+from .metrics_service import track_stage
+from .tracing_service import submit_with_context
+from .unsplash_service import get_unsplash_service
+
+# 补全结果缓存时间(秒)
+ENRICHMENT_CACHE_TTL = 24 * 3600
+
+# 名称相似度低于该值时认为没有匹配到POI
+MIN_NAME_SIMILARITY = 0.5
+
+
+def _name_similarity(a: str, b: str) -> float:
+    """计算两个名称的相似度,包含关系视为完全匹配"""
+    if not a or not b:
+        return 0.0
+    if a in b or b in a:
+        return 1.0
+    return difflib.SequenceMatcher(None, a, b).ratio()
+
+
+class EnrichmentService:
+    """景点/酒店POI信息补全"""
+
+    def __init__(self):
+        settings = get_settings()
+        self.concurrency = max(1, settings.enrichment_concurrency)
+        self.amap = get_amap_service()
+        self.unsplash = get_unsplash_service()
+        self.cache = get_shared_cache() if settings.cache_enabled else None
+        self.images = get_image_cache_service() if settings.image_proxy_enabled else None
+
+    def enrich_plan(self, plan: TripPlan) -> TripPlan:
+        """
+        补全旅行计划中全部景点和酒店的POI信息
+
+        Args:
+            plan: 旅行计划
+
+        Returns:
+            补全后的旅行计划(原地修改)
+        """
+        with track_stage("enrich"):
+            # 同名条目只补全一次
+            items: Dict[str, List[Union[Attraction, Hotel]]] = {}
+            for day in plan.days:
+                for attraction in day.attractions:
+                    items.setdefault(f"attraction:{attraction.name}", []).append(attraction)
+                if day.hotel:
+                    items.setdefault(f"hotel:{day.hotel.name}", []).append(day.hotel)
+
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                futures = {
+                    key: submit_with_context(executor, self._lookup, plan.city, group[0].name, key.startswith("hotel:"))
+                    for key, group in items.items()
+                }
+                for key, future in futures.items():
+                    try:
+                        info = future.result()
+                    except Exception as e:
+                        logger.warning(f"补全{key}失败: {str(e)}")
+                        continue
+                    if info:
+                        for item in items[key]:
+                            self._apply(item, info)
+        return plan
+
+    def _lookup(self, city: str, name: str, is_hotel: bool) -> Optional[Dict[str, Any]]:
+        """查询单个条目的补全信息,优先使用缓存"""
+        if self.cache is None:
+            return self._fetch(city, name, is_hotel)
+        return self.cache.get_or_load(
+            "enrichment",
+            f"enrichment:{city}:{name}",
+            ENRICHMENT_CACHE_TTL,
+            lambda: self._fetch(city, name, is_hotel) or {},
+            should_cache=bool
+        ) or None
+
+    def _fetch(self, city: str, name: str, is_hotel: bool) -> Optional[Dict[str, Any]]:
+        """
+        匹配高德POI并获取图片
+
+        Args:
+            city: 城市
+            name: 景点或酒店名称
+            is_hotel: 是否为酒店
+
+        Returns:
+            补全信息,未匹配到POI时返回None
+        """
+        pois = self.amap.search_poi(name, city)
+        best = max(pois, key=lambda p: _name_similarity(name, p.name), default=None)
+        if best is None or _name_similarity(name, best.name) < MIN_NAME_SIMILARITY:
+            return None
+
+        detail = self.amap.get_poi_detail(best.id)
+        photos = [p.get("url") for p in detail.get("photos", []) if isinstance(p, dict) and p.get("url")]
+
+        image_url = photos[0] if photos else None
+        if not image_url and not is_hotel:
+            image_url = self.unsplash.get_photo_url(f"{name} China landmark")
+
+        # 经由图片代理返回,浏览器拿到的是缓存后的卡片尺寸
+        if self.images is not None:
+            image_url = self.images.proxy_url(image_url, "card")
+            photos = [self.images.proxy_url(url, "thumb") for url in photos]
+
+        return {
+            "poi_id": best.id,
+            "location": best.location.model_dump(),
+            "photos": photos,
+            "image_url": image_url
+        }
+
+    @staticmethod
+    def _apply(item: Union[Attraction, Hotel], info: Dict[str, Any]) -> None:
+        """将补全信息写入景点/酒店"""
+        item.poi_id = info["poi_id"]
+        location = info.get("location")
+        if location and (location.get("longitude") or location.get("latitude")):
+            item.location = Location(**location)
+        if info.get("photos"):
+            item.photos = info["photos"]
+        if info.get("image_url"):
+            item.image_url = info["image_url"]
+
+
+# 全局服务实例
+_enrichment_service = None
+
+
+def get_enrichment_service() -> EnrichmentService:
+    """获取POI补全服务实例(单例模式)"""
+    global _enrichment_service
+
+    if _enrichment_service is None:
+        _enrichment_service = EnrichmentService()
+
+    return _enrichment_service
@@ -0,0 +1,157 @@
+"""启动预热与健康检查服务
+
+应用启动后在后台异步完成初始化(构建LLM和多智能体实例、创建上游服务并预先建立连接),
+之后定期探测各上游的可达性。存活检查只说明进程在运行;就绪检查返回缓存的探测结果,
+预热完成且必需的上游可达后才接收流量。
+"""
+
+import asyncio
+import time
+from dataclasses import dataclass, asdict
+from typing import Any, Callable, Dict, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from loguru import logger
+
+from ..config import get_settings
+
+# 就绪前必须可达的上游, Unsplash不可用只影响图片
+REQUIRED_UPSTREAMS = ("amap", "llm")
+
+
+@dataclass
+class ProbeResult:
+    """单个上游的探测结果"""
+    ok: bool
+    latency_ms: float
+    checked_at: float
+    detail: str = ""
+
+
+class HealthService:
+    """预热与上游探测"""
+
+    def __init__(self):
+        self.warmed_up = False
+        self.warmup_error: Optional[str] = None
+        self.probes: Dict[str, ProbeResult] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def _probe_targets(self) -> Dict[str, Callable[[], Any]]:
+        """各上游的探测函数,使用服务自身的客户端以预先建立连接池"""
+        from .amap_service import get_amap_service
+        from .llm_service import get_llm
+        from .unsplash_service import get_unsplash_service
+
+        settings = get_settings()
+        timeout = settings.upstream_probe_timeout
+        amap = get_amap_service()
+        llm = get_llm()
+        unsplash = get_unsplash_service()
+        # 只要收到HTTP响应就说明网络和TLS连接正常,不消耗接口配额
+        return {
+            "amap": lambda: amap.client.head(amap.base_url, timeout=timeout),
+            "llm": lambda: llm.primary.client.get(f"{llm.primary.base_url}/models", timeout=timeout),
+            "unsplash": lambda: unsplash.client.head(unsplash.base_url, timeout=timeout),
+        }
+
+    def _warmup(self) -> None:
+        """构建全部单例(在线程池中执行)"""
+        from ..agents.trip_planner import get_trip_planner_agent
+        from .amap_service import get_amap_service
+        from .unsplash_service import get_unsplash_service
+
+        get_amap_service()
+        get_unsplash_service()
+        get_trip_planner_agent()
+
+    @staticmethod
+    def _run_probe(func: Callable[[], Any]) -> ProbeResult:
+        """执行一次探测"""
+        start = time.perf_counter()
+        try:
+            response = func()
+            status = getattr(response, "status_code", 0)
+            ok = status < 500
+            detail = f"HTTP {status}"
+        except Exception as e:
+            ok = False
+            detail = f"{type(e).__name__}: {str(e)}"
+        return ProbeResult(ok=ok, latency_ms=round((time.perf_counter() - start) * 1000, 1),
+                           checked_at=time.time(), detail=detail)
+
+    async def probe_all(self) -> None:
+        """并发探测所有上游并更新缓存的结果"""
+        mode = get_settings().upstream_mode
+        if mode != "live":
+            # 录制/回放时探测请求会写入存档或在存档中找不到,不探测,视为可达
+            now = time.time()
+            for name in ("amap", "llm", "unsplash"):
+                self.probes[name] = ProbeResult(ok=True, latency_ms=0.0, checked_at=now, detail=f"{mode}模式,未探测")
+            return
+        targets = await run_in_threadpool(self._probe_targets)
+        results = await asyncio.gather(*[
+            run_in_threadpool(self._run_probe, func) for func in targets.values()
+        ])
+        for name, result in zip(targets.keys(), results):
+            if not result.ok:
+                logger.warning(f"上游 {name} 探测失败: {result.detail}")
+            self.probes[name] = result
+
+    async def _run(self) -> None:
+        """后台任务: 预热后定期探测"""
+        try:
+            await run_in_threadpool(self._warmup)
+        except Exception as e:
+            self.warmup_error = str(e)
+            logger.error(f"启动预热失败: {str(e)}")
+            return
+        self.warmed_up = True
+        logger.info("启动预热完成")
+
+        interval = get_settings().upstream_probe_interval
+        while True:
+            await self.probe_all()
+            await asyncio.sleep(interval)
+
+    def start(self) -> None:
+        """在当前事件循环中启动后台预热任务"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """停止后台任务"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def readiness(self) -> Dict[str, Any]:
+        """汇总就绪状态"""
+        upstreams = {name: asdict(result) for name, result in self.probes.items()}
+        ready = self.warmed_up and all(
+            name in self.probes and self.probes[name].ok for name in REQUIRED_UPSTREAMS
+        )
+        return {
+            "ready": ready,
+            "warmed_up": self.warmed_up,
+            "warmup_error": self.warmup_error,
+            "upstreams": upstreams
+        }
+
+
+# 全局健康检查服务实例
+_health_service = None
+
+
+def get_health_service() -> HealthService:
+    """获取健康检查服务实例(单例模式)"""
+    global _health_service
+
+    if _health_service is None:
+        _health_service = HealthService()
+
+    return _health_service
@@ -0,0 +1,229 @@
+"""图片代理与磁盘缓存服务
+
+后端返回给前端的图片URL先登记为短key,浏览器通过 /api/images/{key} 获取。
+原图只下载一次并流式写入磁盘,缩略图/卡片尺寸的变体按需生成;缓存总大小受限,
+超出时按最近访问时间淘汰。只有登记过的URL才能被代理,避免成为开放代理。
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from loguru import logger
+
+from ..config import get_settings
+from .cache_service import get_shared_cache
+from .metrics_service import observe_upstream, record_cache
+from .replay_service import create_http_client
+from .tracing_service import span
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow为可选依赖,未安装时各尺寸都返回原图
+    Image = None
+
+# 图片尺寸变体: 名称 -> 最大宽度, None表示原图
+VARIANTS: Dict[str, Optional[int]] = {
+    "thumb": 240,
+    "card": 720,
+    "original": None
+}
+
+# URL登记的有效期(秒)
+URL_REGISTRY_TTL = 30 * 24 * 3600
+
+# 单张原图的最大字节数
+MAX_DOWNLOAD_BYTES = 20 * 1024 * 1024
+
+# 流式读写的块大小
+CHUNK_SIZE = 64 * 1024
+
+# 下载/生成变体的锁分段数,同一个key总是落在同一段
+LOCK_STRIPES = 64
+
+
+class ImageCacheService:
+    """图片代理与磁盘LRU缓存"""
+
+    def __init__(self):
+        settings = get_settings()
+        self.root = Path(settings.image_cache_dir)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = settings.image_cache_max_bytes
+        self.registry = get_shared_cache()
+        self.client = create_http_client("images", timeout=30.0, follow_redirects=True)
+        self._locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        # 自上次扫描以来估算的缓存总大小
+        self._estimated_bytes = self._scan_size()
+
+    @staticmethod
+    def make_key(url: str) -> str:
+        """由图片URL计算key"""
+        return hashlib.blake2b(url.encode("utf-8"), digest_size=12).hexdigest()
+
+    def proxy_url(self, url: Optional[str], size: str = "card") -> Optional[str]:
+        """
+        登记图片URL并返回代理地址
+
+        Args:
+            url: 原始图片URL
+            size: 尺寸变体
+
+        Returns:
+            代理地址(相对路径),url为空时返回None
+        """
+        if not url or url.startswith("/api/images/"):
+            return url
+        key = self.make_key(url)
+        self.registry.set(f"image:{key}", url, URL_REGISTRY_TTL)
+        return f"/api/images/{key}?size={size}"
+
+    def get_image(self, key: str, size: str) -> Optional[Tuple[Path, str]]:
+        """
+        获取指定尺寸的图片文件,必要时下载原图并生成变体
+
+        Args:
+            key: 图片key
+            size: 尺寸变体
+
+        Returns:
+            (文件路径, 媒体类型),key未登记或下载失败时返回None
+        """
+        if size not in VARIANTS:
+            size = "card"
+        path = self._path(key, size)
+        if path.exists():
+            record_cache("image", True)
+            self._touch(path)
+            return path, self._media_type(path)
+        record_cache("image", False)
+
+        with self._lock_for(key):
+            # 等锁期间其他线程可能已经生成
+            if path.exists():
+                return path, self._media_type(path)
+            original = self._path(key, "original")
+            if not original.exists():
+                url = self.registry.get(f"image:{key}")
+                if not url or not self._download(url, original):
+                    return None
+            if size != "original":
+                if not self._resize(original, path, VARIANTS[size]):
+                    return original, self._media_type(original)
+        self._maybe_evict()
+        return path, self._media_type(path)
+
+    def _path(self, key: str, size: str) -> Path:
+        """缓存文件路径(按key前两位分目录)"""
+        return self.root / key[:2] / f"{key}_{size}"
+
+    @staticmethod
+    def _media_type(path: Path) -> str:
+        """根据文件头判断图片类型"""
+        with open(path, "rb") as f:
+            head = f.read(12)
+        if head.startswith(b"\x89PNG"):
+            return "image/png"
+        if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+            return "image/webp"
+        if head[:3] == b"GIF":
+            return "image/gif"
+        return "image/jpeg"
+
+    def _lock_for(self, key: str) -> threading.Lock:
+        """同一个key的下载/生成串行执行(按key分段加锁,锁的数量固定)"""
+        return self._locks[hash(key) % LOCK_STRIPES]
+
+    def _download(self, url: str, target: Path) -> bool:
+        """流式下载原图,先写临时文件再原子替换,内存占用与图片大小无关"""
+        target.parent.mkdir(parents=True, exist_ok=True)
+        start = time.perf_counter()
+        status = "error"
+        fd, tmp_path = tempfile.mkstemp(dir=target.parent, suffix=".part")
+        try:
+            with span("image.download"), os.fdopen(fd, "wb") as f:
+                with self.client.stream("GET", url) as response:
+                    status = str(response.status_code)
+                    response.raise_for_status()
+                    written = 0
+                    for chunk in response.iter_bytes(CHUNK_SIZE):
+                        written += len(chunk)
+                        if written > MAX_DOWNLOAD_BYTES:
+                            raise ValueError(f"图片超过大小限制: {url}")
+                        f.write(chunk)
+            os.replace(tmp_path, target)
+            self._estimated_bytes += written
+            return True
+        except Exception as e:
+            logger.warning(f"下载图片失败: {str(e)}")
+            return False
+        finally:
+            observe_upstream("image", "download", status, time.perf_counter() - start)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _resize(self, source: Path, target: Path, width: int) -> bool:
+        """生成缩放后的变体,Pillow不可用或图片本身更小时返回False"""
+        if Image is None:
+            return False
+        try:
+            with Image.open(source) as img:
+                if img.width <= width:
+                    return False
+                img.thumbnail((width, width * 4))
+                fd, tmp_path = tempfile.mkstemp(dir=target.parent, suffix=".part")
+                os.close(fd)
+                img.convert("RGB").save(tmp_path, format="JPEG", quality=80, optimize=True, progressive=True)
+            os.replace(tmp_path, target)
+            self._estimated_bytes += target.stat().st_size
+            return True
+        except Exception as e:
+            logger.warning(f"生成图片变体失败: {str(e)}")
+            return False
+
+    @staticmethod
+    def _touch(path: Path) -> None:
+        """更新访问时间,作为LRU淘汰依据"""
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+
+    def _scan_size(self) -> int:
+        """统计缓存目录总大小"""
+        return sum(f.stat().st_size for f in self.root.glob("*/*") if f.is_file())
+
+    def _maybe_evict(self) -> None:
+        """估算大小超过上限时扫描目录,按最近访问时间淘汰到上限的90%"""
+        if self._estimated_bytes <= self.max_bytes:
+            return
+        files = [(f.stat().st_mtime, f.stat().st_size, f) for f in self.root.glob("*/*") if f.is_file()]
+        total = sum(size for _, size, _ in files)
+        target = int(self.max_bytes * 0.9)
+        for _, size, f in sorted(files):
+            if total <= target:
+                break
+            try:
+                f.unlink()
+                total -= size
+            except OSError:
+                pass
+        self._estimated_bytes = total
+
+
+# 全局服务实例
+_image_cache_service = None
+
+
+def get_image_cache_service() -> ImageCacheService:
+    """获取图片缓存服务实例(单例模式)"""
+    global _image_cache_service
+
+    if _image_cache_service is None:
+        _image_cache_service = ImageCacheService()
+
+    return _image_cache_service
@@ -1,87 +1,286 @@
 """LLM服务模块"""
 
-import os
-from typing import Optional, Dict, Any
-from dotenv import load_dotenv
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Any, List, Tuple
 import httpx
 import json
 from loguru import logger
+from ..config import get_settings
+from .cancellation_service import check_cancelled
+from .deadline_service import DeadlineExceeded, check_deadline, upstream_timeout
+from .metrics_service import observe_upstream, record_llm_failover, record_llm_usage
+from .replay_service import create_http_client
+from .token_budget_service import get_token_budgeter
+from .tracing_service import span
 
-# 加载环境变量
-load_dotenv()
+# 默认LLM服务地址和模型
+DEFAULT_LLM_BASE_URL = "https://open.bigmodel.cn/api/paas/v4"
+DEFAULT_LLM_MODEL_ID = "glm-4"
 
-class ZhipuLLM:
-    """智谱AI LLM类"""
+# 请求内容本身有误(参数错误、超出上下文长度等)的状态码,换一个模型也会同样失败;
+# 401/404等可能只是某个模型的Key或地址配置错误,仍然切换
+REJECTED_STATUS_CODES = (400, 413, 422)
+
+
+class LLMSloExceeded(RuntimeError):
+    """单次调用超过延迟目标,已中止"""
+
+
+class LLMRequestRejected(RuntimeError):
+    """请求本身被拒绝,换模型也会失败"""
+
+
+@dataclass
+class LLMResult:
+    """一次LLM调用的结果"""
+    content: str
+    finish_reason: Optional[str] = None
+    usage: Dict[str, int] = field(default_factory=dict)
+    max_tokens: int = 0
+    model: str = ""
+    # 原生函数调用返回的工具调用 [{"id", "type", "function": {"name", "arguments"}}]
+    tool_calls: List[Dict[str, Any]] = field(default_factory=list)
+
+
+def build_messages(prompt: str, system_prompt: Optional[str] = None) -> List[Dict[str, Any]]:
+    """构建单轮对话的消息列表"""
+    messages = []
+    if system_prompt:
+        messages.append({"role": "system", "content": system_prompt})
+    messages.append({"role": "user", "content": prompt})
+    return messages
+
+
+class OpenAICompatibleLLM:
+    """OpenAI兼容接口的LLM(智谱、DeepSeek、通义、vLLM等均可)"""
     
-    def __init__(self):
-        # 尝试从多个可能的位置获取API密钥
-        self.api_key = os.getenv("LLM_API_KEY")
-        if not self.api_key:
-            # 尝试从项目根目录的.env文件加载
-            project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-            env_path = os.path.join(project_root, ".env")
-            if os.path.exists(env_path):
-                load_dotenv(env_path)
-                self.api_key = os.getenv("LLM_API_KEY")
-        
-        self.base_url = os.getenv("LLM_BASE_URL", "https://open.bigmodel.cn/api/paas/v4")
-        self.model_id = os.getenv("LLM_MODEL_ID", "glm-4")
-        self.timeout = int(os.getenv("LLM_TIMEOUT", "300"))  # 增加超时时间到5分钟
-        self.max_tokens = int(os.getenv("LLM_MAX_TOKENS", "10000"))  # 设置最大令牌数
+    def __init__(self, name: str, base_url: str, api_key: str, model_id: str,
+                 timeout: Optional[int] = None, slo_seconds: float = 0.0):
+        """
+        初始化LLM
+
+        Args:
+            name: 名称(primary/fast/fallback),用于日志和指标
+            base_url: 接口地址
+            api_key: API Key
+            model_id: 模型ID
+            timeout: 请求超时时间(秒)
+            slo_seconds: 单次调用的延迟目标,超过时路由会切换到下一个模型,0表示不限制
+        """
+        settings = get_settings()
+        self.name = name
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.model_id = model_id
+        self.timeout = timeout or settings.llm_timeout  # 增加超时时间到5分钟
+        self.max_tokens = settings.llm_max_tokens  # 设置最大令牌数
+        self.slo_seconds = slo_seconds
+        self.stream = settings.llm_stream
+        # 是否发送tools和response_format,上游拒绝这两个参数后关闭,之后按文本格式调用工具
+        self.native_tools = settings.llm_native_tools
+        self.upstream = "llm" if name == "primary" else f"llm_{name}"
+        self.budgeter = get_token_budgeter()
         
         if not self.api_key:
             logger.error("LLM_API_KEY 环境变量未设置")
             raise ValueError("LLM_API_KEY 环境变量未设置")
+
+        # 复用连接池,避免每次调用重新建立TLS连接
+        self.client = create_http_client(self.upstream, timeout=self.timeout)
         
-        logger.info(f"LLM服务初始化成功: {self.base_url}, 模型: {self.model_id}")
+        logger.info(f"LLM服务初始化成功[{self.name}]: {self.base_url}, 模型: {self.model_id}")
     
-    def generate(self, prompt: str, system_prompt: Optional[str] = None) -> str:
+    def generate(self, prompt: str, system_prompt: Optional[str] = None, stage: str = "default", days: int = 1) -> str:
         """
-        调用智谱AI API生成响应
+        调用LLM生成响应
         
         Args:
             prompt: 用户输入提示
             system_prompt: 系统提示（可选）
+            stage: 调用阶段（用于指标统计和token预算）
+            days: 旅行天数（用于token预算）
             
         Returns:
             LLM生成的响应
         """
+        return self.complete(prompt, system_prompt, stage=stage, days=days).content
+
+    def complete(self, prompt: str, system_prompt: Optional[str] = None, stage: str = "default",
+                 days: int = 1, max_tokens: Optional[int] = None,
+                 response_format: Optional[Dict[str, Any]] = None) -> LLMResult:
+        """
+        调用LLM,返回内容、结束原因和token用量
+        
+        Args:
+            prompt: 用户输入提示
+            system_prompt: 系统提示（可选）
+            stage: 调用阶段
+            days: 旅行天数
+            max_tokens: 输出token上限,不传时由预算按阶段和天数计算
+            response_format: 输出格式,例如 {"type": "json_object"}
+            
+        Returns:
+            LLM调用结果
+        """
+        return self.chat(build_messages(prompt, system_prompt), stage=stage, days=days,
+                         max_tokens=max_tokens, response_format=response_format)
+
+    def chat(self, messages: List[Dict[str, Any]], stage: str = "default", days: int = 1,
+             max_tokens: Optional[int] = None, tools: Optional[List[Dict[str, Any]]] = None,
+             response_format: Optional[Dict[str, Any]] = None,
+             slo_seconds: Optional[float] = None) -> LLMResult:
+        """
+        以完整的消息列表调用LLM,支持原生函数调用
+
+        上游以400/422等拒绝带tools或response_format的请求时,去掉这两个参数重试一次;
+        重试成功说明该模型不支持原生函数调用,之后不再发送(模型按提示词以文本格式调用工具)。
+        
+        Args:
+            messages: 消息列表(可包含assistant的tool_calls和tool角色的结果)
+            stage: 调用阶段
+            days: 旅行天数
+            max_tokens: 输出token上限,不传时由预算按阶段和天数计算
+            tools: 可调用的函数定义(OpenAI tools格式)
+            response_format: 输出格式,例如 {"type": "json_object"}
+            slo_seconds: 本次调用的时限(秒),超过时中止并抛出LLMSloExceeded,不传时不限制
+            
+        Returns:
+            LLM调用结果,模型调用工具时tool_calls非空
+
+        Raises:
+            LLMSloExceeded: 超过slo_seconds
+            LLMRequestRejected: 上游以不可重试的4xx拒绝请求
+        """
+        if not self.native_tools:
+            tools, response_format = None, None
+        try:
+            return self._chat(messages, stage, days, max_tokens, tools, response_format, slo_seconds)
+        except LLMRequestRejected:
+            if not (tools or response_format):
+                raise
+            logger.warning(f"LLM[{self.name}]拒绝tools/response_format参数,改为文本格式重试")
+            result = self._chat(messages, stage, days, max_tokens, None, None, slo_seconds)
+            self.native_tools = False
+            return result
+
+    def _chat(self, messages: List[Dict[str, Any]], stage: str, days: int, max_tokens: Optional[int],
+              tools: Optional[List[Dict[str, Any]]], response_format: Optional[Dict[str, Any]],
+              slo_seconds: Optional[float]) -> LLMResult:
+        """发送一次聊天补全请求,参数和异常见chat"""
         headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
-        
-        # 构建消息历史
-        messages = []
-        if system_prompt:
-            messages.append({"role": "system", "content": system_prompt})
-        messages.append({"role": "user", "content": prompt})
+
+        if max_tokens is None:
+            max_tokens = self.budgeter.budget(stage, days)
         
         payload = {
             "model": self.model_id,
             "messages": messages,
             "temperature": 0.7,
             "top_p": 0.7,
-            "max_tokens": self.max_tokens  # 添加最大令牌数限制
+            "max_tokens": max_tokens  # 按调用类型和天数计算的最大令牌数
         }
+        if tools:
+            payload["tools"] = tools
+            payload["tool_choice"] = "auto"
+        if response_format:
+            payload["response_format"] = response_format
+        if self.stream:
+            payload["stream"] = True
+            payload["stream_options"] = {"include_usage": True}
         
+        # 客户端已断开时不再发出请求;超时不超过规划剩余时间
+        check_cancelled("llm")
+        timeout = upstream_timeout(self.timeout)
+        # 延迟目标比剩余时间更短时,按延迟目标限制连接/读取超时和流式读取的总时长
+        slo_bound = bool(slo_seconds) and slo_seconds < timeout
+        if slo_bound:
+            timeout = slo_seconds
+
         try:
-            logger.info(f"发送LLM请求: {self.base_url}/chat/completions")
-            response = httpx.post(
-                f"{self.base_url}/chat/completions",
-                headers=headers,
-                json=payload,
-                timeout=self.timeout
+            logger.info(f"发送LLM请求[{self.name}]: {self.base_url}/chat/completions (stage={stage}, max_tokens={max_tokens})")
+            start = time.perf_counter()
+            expires_at = start + slo_seconds if slo_bound else None
+            status = "error"
+            try:
+                with span("llm.chat_completions", provider=self.name, model=self.model_id, stage=stage, max_tokens=max_tokens) as llm_span:
+                    if self.stream:
+                        with self.client.stream(
+                            "POST",
+                            f"{self.base_url}/chat/completions",
+                            headers=headers,
+                            json=payload,
+                            timeout=timeout
+                        ) as response:
+                            status = str(response.status_code)
+                            if response.is_error:
+                                response.read()
+                            response.raise_for_status()
+                            content, finish_reason, usage, tool_calls = self._read_stream(response, expires_at)
+                    else:
+                        response = self.client.post(
+                            f"{self.base_url}/chat/completions",
+                            headers=headers,
+                            json=payload,
+                            timeout=timeout
+                        )
+                        status = str(response.status_code)
+                        response.raise_for_status()
+                        result = response.json()
+                        choice = result["choices"][0]
+                        message = choice["message"]
+                        content, finish_reason = message.get("content") or "", choice.get("finish_reason")
+                        tool_calls = message.get("tool_calls") or []
+                        usage = result.get("usage") or {}
+                    if llm_span is not None:
+                        llm_span.set_attribute("finish_reason", finish_reason)
+                        llm_span.set_attribute("prompt_tokens", usage.get("prompt_tokens", 0))
+                        llm_span.set_attribute("completion_tokens", usage.get("completion_tokens", 0))
+            finally:
+                observe_upstream(self.upstream, "chat_completions", status, time.perf_counter() - start)
+
+            record_llm_usage(stage, usage)
+            self.budgeter.observe(stage, days, usage.get("completion_tokens", 0), finish_reason)
+            logger.info(
+                f"LLM响应成功: prompt_tokens={usage.get('prompt_tokens', 0)}, "
+                f"completion_tokens={usage.get('completion_tokens', 0)}, finish_reason={finish_reason}, "
+                f"tool_calls={len(tool_calls)}"
             )
-            response.raise_for_status()
-            
-            result = response.json()
-            content = result["choices"][0]["message"]["content"]
-            logger.info("LLM响应成功")
-            return content
+            return LLMResult(
+                content=content,
+                finish_reason=finish_reason,
+                usage=usage,
+                max_tokens=max_tokens,
+                model=self.model_id,
+                tool_calls=tool_calls
+            )
+        except DeadlineExceeded:
+            logger.warning(f"LLM调用超过规划截止时间[{self.name}]: stage={stage}")
+            raise
+        except LLMSloExceeded:
+            logger.warning(f"LLM调用超过延迟目标[{self.name}]: stage={stage}, {slo_seconds:g}s")
+            raise
+        except httpx.TimeoutException as e:
+            if slo_bound:
+                logger.warning(f"LLM调用超过延迟目标[{self.name}]: stage={stage}, {slo_seconds:g}s")
+                raise LLMSloExceeded(str(e))
+            # 按剩余时间缩短的超时到期,视为超过截止时间而不是模型故障
+            if timeout < self.timeout:
+                logger.warning(f"LLM调用超过规划截止时间[{self.name}]: stage={stage}")
+                raise DeadlineExceeded(str(e))
+            error_msg = f"大模型调用失败！错误详情: {str(e)}"
+            logger.error(error_msg)
+            raise RuntimeError(error_msg)
         except httpx.HTTPStatusError as e:
-            error_msg = f"LLM API HTTP错误: {e.response.status_code} - {e.response.text}"
+            code = e.response.status_code
+            error_msg = f"LLM API HTTP错误: {code} - {e.response.text}"
             logger.error(error_msg)
+            if code in REJECTED_STATUS_CODES:
+                raise LLMRequestRejected(error_msg)
             raise RuntimeError(error_msg)
         except Exception as e:
             error_msg = f"大模型调用失败！错误详情: {str(e)}"
@@ -89,12 +288,252 @@ class ZhipuLLM:
             raise RuntimeError(error_msg)
 
 
-def get_llm():
+    @staticmethod
+    def _read_stream(response: httpx.Response,
+                     expires_at: Optional[float] = None) -> Tuple[str, Optional[str], Dict[str, int], List[Dict[str, Any]]]:
+        """
+        读取SSE流式响应,每个分块之间检查请求是否已取消、是否超过截止时间和延迟目标
+
+        已取消时抛出RequestCancelled,退出stream上下文会关闭连接,上游随之停止生成。
+
+        Args:
+            response: 流式响应
+            expires_at: 延迟目标到期的时间(perf_counter),超过时抛出LLMSloExceeded
+
+        Returns:
+            (内容, 结束原因, token用量, 工具调用)
+        """
+        parts: List[str] = []
+        finish_reason: Optional[str] = None
+        usage: Dict[str, int] = {}
+        # 工具调用按index分多个分块返回,名称和参数需要拼接
+        tool_calls: Dict[int, Dict[str, Any]] = {}
+        for line in response.iter_lines():
+            check_cancelled("llm")
+            check_deadline()
+            if expires_at is not None and time.perf_counter() > expires_at:
+                raise LLMSloExceeded("流式生成超过延迟目标")
+            if not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                break
+            chunk = json.loads(data)
+            if chunk.get("usage"):
+                usage = chunk["usage"]
+            choices = chunk.get("choices") or []
+            if not choices:
+                continue
+            delta = choices[0].get("delta") or {}
+            parts.append(delta.get("content") or "")
+            for call_delta in delta.get("tool_calls") or []:
+                call = tool_calls.setdefault(call_delta.get("index", len(tool_calls)), {
+                    "id": "", "type": "function", "function": {"name": "", "arguments": ""}
+                })
+                call["id"] = call_delta.get("id") or call["id"]
+                function = call_delta.get("function") or {}
+                call["function"]["name"] += function.get("name") or ""
+                call["function"]["arguments"] += function.get("arguments") or ""
+            finish_reason = choices[0].get("finish_reason") or finish_reason
+        return "".join(parts), finish_reason, usage, [tool_calls[i] for i in sorted(tool_calls)]
+
+
+class ZhipuLLM(OpenAICompatibleLLM):
+    """智谱AI LLM类(按LLM_*配置创建的主模型)"""
+
+    def __init__(self):
+        settings = get_settings()
+        super().__init__(
+            "primary",
+            settings.llm_base_url or DEFAULT_LLM_BASE_URL,
+            settings.llm_api_key,
+            settings.llm_model_id or settings.llm_model or DEFAULT_LLM_MODEL_ID,
+            slo_seconds=settings.llm_slo_seconds
+        )
+
+
+class LLMRouter:
+    """按调用阶段选择模型,出错或超出延迟目标时切换到下一个模型
+
+    只输出一行工具调用的阶段(景点/天气/酒店)优先使用快速小模型,行程规划使用主模型;
+    每个阶段的候选链为 [快速模型(仅快速阶段)] + [主模型] + [备用模型]。
+    后面还有候选模型时,每次调用以该模型的延迟目标为时限,超时即中止并切换;
+    出错或超时的模型在冷却时间内排到候选链末尾。请求内容本身被拒绝(400/413/422)时直接抛出,不切换。
+    """
+
+    def __init__(self, providers: Dict[str, OpenAICompatibleLLM], fast_stages: List[str], cooldown: float):
+        """
+        初始化路由
+
+        Args:
+            providers: 名称 -> 模型,必须包含primary,可选fast/fallback
+            fast_stages: 使用快速模型的阶段
+            cooldown: 模型出错或超出延迟目标后的冷却时间(秒)
+        """
+        self.providers = providers
+        self.primary = providers["primary"]
+        self.fast_stages = set(fast_stages)
+        self.cooldown = cooldown
+        self._cooldown_until: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def route(self, stage: str) -> List[OpenAICompatibleLLM]:
+        """
+        计算阶段的候选模型链,冷却中的模型排到末尾
+
+        Args:
+            stage: 调用阶段
+
+        Returns:
+            按优先级排列的模型列表
+        """
+        names = []
+        if stage in self.fast_stages and "fast" in self.providers:
+            names.append("fast")
+        names.append("primary")
+        if "fallback" in self.providers:
+            names.append("fallback")
+
+        now = time.monotonic()
+        with self._lock:
+            healthy = [n for n in names if self._cooldown_until.get(n, 0.0) <= now]
+        cooling = [n for n in names if n not in healthy]
+        return [self.providers[n] for n in healthy + cooling]
+
+    def _trip(self, provider: OpenAICompatibleLLM, reason: str) -> None:
+        """将模型置为冷却状态"""
+        with self._lock:
+            self._cooldown_until[provider.name] = time.monotonic() + self.cooldown
+        record_llm_failover(provider.name, reason)
+
+    def generate(self, prompt: str, system_prompt: Optional[str] = None, stage: str = "default", days: int = 1) -> str:
+        """
+        按路由调用LLM生成响应
+        
+        Args:
+            prompt: 用户输入提示
+            system_prompt: 系统提示（可选）
+            stage: 调用阶段（决定使用的模型和token预算）
+            days: 旅行天数（用于token预算）
+            
+        Returns:
+            LLM生成的响应
+        """
+        return self.complete(prompt, system_prompt, stage=stage, days=days).content
+
+    def complete(self, prompt: str, system_prompt: Optional[str] = None, stage: str = "default",
+                 days: int = 1, max_tokens: Optional[int] = None,
+                 response_format: Optional[Dict[str, Any]] = None) -> LLMResult:
+        """
+        按路由调用LLM,当前模型出错时依次尝试候选链中的下一个模型
+
+        Args:
+            prompt: 用户输入提示
+            system_prompt: 系统提示（可选）
+            stage: 调用阶段
+            days: 旅行天数
+            max_tokens: 输出token上限,不传时由预算计算
+            response_format: 输出格式,例如 {"type": "json_object"}
+
+        Returns:
+            LLM调用结果
+        """
+        return self.chat(build_messages(prompt, system_prompt), stage=stage, days=days,
+                         max_tokens=max_tokens, response_format=response_format)
+
+    def chat(self, messages: List[Dict[str, Any]], stage: str = "default", days: int = 1,
+             max_tokens: Optional[int] = None, tools: Optional[List[Dict[str, Any]]] = None,
+             response_format: Optional[Dict[str, Any]] = None) -> LLMResult:
+        """
+        按路由以完整的消息列表调用LLM,当前模型出错时依次尝试候选链中的下一个模型
+
+        Args:
+            messages: 消息列表
+            stage: 调用阶段
+            days: 旅行天数
+            max_tokens: 输出token上限,不传时由预算计算
+            tools: 可调用的函数定义
+            response_format: 输出格式
+
+        Returns:
+            LLM调用结果
+        """
+        candidates = self.route(stage)
+        last_error: Optional[Exception] = None
+        for index, provider in enumerate(candidates):
+            # 最后一个候选不限时,避免所有模型都因延迟目标而失败
+            slo_seconds = provider.slo_seconds if index < len(candidates) - 1 else None
+            try:
+                return provider.chat(messages, stage=stage, days=days, max_tokens=max_tokens,
+                                     tools=tools, response_format=response_format, slo_seconds=slo_seconds)
+            except (DeadlineExceeded, LLMRequestRejected):
+                # 截止时间对所有模型相同,请求被拒绝时换模型也会失败,不切换也不冷却
+                raise
+            except LLMSloExceeded as e:
+                last_error = e
+                logger.warning(f"LLM[{provider.name}]超过延迟目标{provider.slo_seconds:g}s,切换下一个模型")
+                self._trip(provider, "slo")
+            except Exception as e:
+                last_error = e
+                if len(candidates) > 1:
+                    logger.warning(f"LLM[{provider.name}]调用失败,切换下一个模型: {str(e)}")
+                    self._trip(provider, "error")
+
+        raise last_error if last_error else RuntimeError("没有可用的LLM")
+
+
+def _split(value: str) -> List[str]:
+    """解析逗号分隔的配置"""
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def create_llm_router() -> LLMRouter:
+    """
+    根据配置创建LLM路由
+
+    快速模型和备用模型只需配置模型ID,接口地址和API Key未配置时沿用主模型的配置。
+
+    Returns:
+        LLM路由
     """
-    获取LLM实例
+    settings = get_settings()
+    primary = ZhipuLLM()
+    providers: Dict[str, OpenAICompatibleLLM] = {"primary": primary}
+
+    tiers = {
+        "fast": (settings.llm_fast_model_id, settings.llm_fast_base_url, settings.llm_fast_api_key,
+                 settings.llm_fast_slo_seconds),
+        "fallback": (settings.llm_fallback_model_id, settings.llm_fallback_base_url, settings.llm_fallback_api_key,
+                     settings.llm_slo_seconds),
+    }
+    for name, (model_id, base_url, api_key, slo_seconds) in tiers.items():
+        if not model_id:
+            continue
+        providers[name] = OpenAICompatibleLLM(
+            name,
+            base_url or primary.base_url,
+            api_key or primary.api_key,
+            model_id,
+            slo_seconds=slo_seconds
+        )
+
+    return LLMRouter(providers, _split(settings.llm_fast_stages), settings.llm_failover_cooldown)
+
+
+# 全局LLM实例
+_llm = None
+
+
+def get_llm() -> LLMRouter:
+    """
+    获取LLM实例(单例模式,共享连接池)
     
     Returns:
-        LLM实例
+        按阶段路由的LLM实例
     """
-    # 直接使用真实的LLM服务
-    return ZhipuLLM()
\ No newline at end of file
+    global _llm
+
+    if _llm is None:
+        _llm = create_llm_router()
+
+    return _llm
@@ -0,0 +1,247 @@
+"""Prometheus指标服务"""
+
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+
+from loguru import logger
+
+from .tracing_service import span
+
+# 规划流程各阶段耗时分桶(秒),覆盖从毫秒级解析到分钟级LLM生成
+STAGE_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 60, 120, 300)
+
+# 单个计划消耗的token数分桶
+PLAN_TOKEN_BUCKETS = (500, 1000, 2000, 4000, 8000, 16000, 32000, 64000)
+
+# 上游请求耗时分桶(秒)
+UPSTREAM_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+STAGE_LATENCY = Histogram(
+    "trip_plan_stage_seconds",
+    "plan_trip各阶段耗时",
+    ["stage"],
+    buckets=STAGE_BUCKETS
+)
+
+UPSTREAM_LATENCY = Histogram(
+    "upstream_request_seconds",
+    "上游请求耗时",
+    ["upstream", "endpoint", "status"],
+    buckets=UPSTREAM_BUCKETS
+)
+
+LLM_TOKENS = Counter(
+    "llm_tokens_total",
+    "LLM消耗的token数",
+    ["stage", "kind"]
+)
+
+PLAN_TOKENS = Histogram(
+    "trip_plan_llm_tokens",
+    "单个旅行计划消耗的LLM token数",
+    ["kind"],
+    buckets=PLAN_TOKEN_BUCKETS
+)
+
+LLM_FAILOVERS = Counter(
+    "llm_failover_total",
+    "LLM模型因出错或超出延迟目标被切换的次数",
+    ["provider", "reason"]
+)
+
+CACHE_REQUESTS = Counter(
+    "cache_requests_total",
+    "缓存查询次数(按命中/未命中统计,可计算命中率)",
+    ["cache", "result"]
+)
+
+FALLBACKS = Counter(
+    "trip_plan_fallback_total",
+    "使用默认数据兜底的次数",
+    ["stage"]
+)
+
+CONTINUATIONS = Counter(
+    "trip_plan_continuation_total",
+    "规划输出被截断后续写的次数(complete: 续写补全, local: 剩余天数在本地编排)",
+    ["result"]
+)
+
+DEGRADATIONS = Counter(
+    "trip_plan_degradation_total",
+    "规划阶段因剩余时间不足或出错而改用其他数据的次数",
+    ["stage", "fallback"]
+)
+
+REPLANS = Counter(
+    "trip_plan_replan_total",
+    "推测式规划后重新调用规划器的次数",
+    ["reason"]
+)
+
+ADMISSIONS = Counter(
+    "trip_plan_admission_total",
+    "规划请求准入结果",
+    ["result"]
+)
+
+QUEUE_WAIT = Histogram(
+    "trip_plan_queue_wait_seconds",
+    "规划请求的排队等待时间",
+    buckets=STAGE_BUCKETS
+)
+
+CANCELLATIONS = Counter(
+    "cancelled_work_total",
+    "因客户端断开而取消的请求和中止的上游调用",
+    ["kind"]
+)
+
+AMAP_KEY_QUARANTINES = Counter(
+    "amap_key_quarantine_total",
+    "因配额错误被隔离的高德API Key次数",
+    ["reason"]
+)
+
+PLANS_IN_FLIGHT = Gauge(
+    "trip_plans_in_flight",
+    "正在生成中的旅行计划数",
+    multiprocess_mode="livesum"
+)
+
+# 当前计划累计的token用量,由track_plan_tokens设置
+_plan_tokens: ContextVar[Optional[Dict[str, int]]] = ContextVar("plan_tokens", default=None)
+
+
+@contextmanager
+def track_stage(stage: str) -> Iterator[None]:
+    """
+    记录规划阶段耗时,同时在当前Trace中记录对应的Span
+
+    Args:
+        stage: 阶段名称 (attractions/weather/hotels/planner/parse)
+    """
+    start = time.perf_counter()
+    try:
+        with span(f"stage.{stage}"):
+            yield
+    finally:
+        STAGE_LATENCY.labels(stage=stage).observe(time.perf_counter() - start)
+
+
+def observe_upstream(upstream: str, endpoint: str, status: str, seconds: float) -> None:
+    """
+    记录一次上游请求
+
+    Args:
+        upstream: 上游名称 (amap/unsplash/llm)
+        endpoint: 接口名称
+        status: HTTP状态码,请求异常时为"error"
+        seconds: 耗时(秒)
+    """
+    UPSTREAM_LATENCY.labels(upstream=upstream, endpoint=endpoint, status=status).observe(seconds)
+
+
+def record_llm_usage(stage: str, usage: Optional[Dict[str, int]]) -> None:
+    """
+    记录LLM token用量
+
+    Args:
+        stage: 调用阶段
+        usage: 响应中的usage字段
+    """
+    if not usage:
+        return
+    prompt_tokens = usage.get("prompt_tokens", 0) or 0
+    completion_tokens = usage.get("completion_tokens", 0) or 0
+    LLM_TOKENS.labels(stage=stage, kind="prompt").inc(prompt_tokens)
+    LLM_TOKENS.labels(stage=stage, kind="completion").inc(completion_tokens)
+
+    totals = _plan_tokens.get()
+    if totals is not None:
+        totals["prompt"] += prompt_tokens
+        totals["completion"] += completion_tokens
+
+
+@contextmanager
+def track_plan_tokens() -> Iterator[Dict[str, int]]:
+    """
+    累计一次规划中所有LLM调用的token用量,结束时记录指标和日志
+
+    Yields:
+        累计用量 {"prompt": ..., "completion": ...}
+    """
+    totals = {"prompt": 0, "completion": 0}
+    token = _plan_tokens.set(totals)
+    try:
+        yield totals
+    finally:
+        _plan_tokens.reset(token)
+        PLAN_TOKENS.labels(kind="prompt").observe(totals["prompt"])
+        PLAN_TOKENS.labels(kind="completion").observe(totals["completion"])
+        logger.info(f"本次规划消耗token: prompt={totals['prompt']}, completion={totals['completion']}")
+
+
+def record_admission(result: str) -> None:
+    """记录一次准入结果(admitted/client_limit/queue_full/wait_too_long/wait_timeout)"""
+    ADMISSIONS.labels(result=result).inc()
+
+
+def observe_queue_wait(seconds: float) -> None:
+    """记录准入前的排队等待时间"""
+    QUEUE_WAIT.observe(seconds)
+
+
+def record_cancellation(kind: str) -> None:
+    """记录一次取消(kind: 路由名称,或被中止的上游调用 llm/amap)"""
+    CANCELLATIONS.labels(kind=kind).inc()
+
+
+def record_amap_key_quarantine(reason: str) -> None:
+    """记录一次高德API Key隔离(reason: daily_quota/too_frequent)"""
+    AMAP_KEY_QUARANTINES.labels(reason=reason).inc()
+
+
+def record_continuation(result: str) -> None:
+    """记录一次截断续写的结果"""
+    CONTINUATIONS.labels(result=result).inc()
+
+
+def record_degradation(stage: str, fallback: str) -> None:
+    """记录一次阶段降级(fallback: cache/local/default/skipped)"""
+    DEGRADATIONS.labels(stage=stage, fallback=fallback).inc()
+
+
+def record_replan(reason: str) -> None:
+    """记录一次重新规划"""
+    REPLANS.labels(reason=reason).inc()
+
+
+def record_llm_failover(provider: str, reason: str) -> None:
+    """记录一次LLM模型切换(reason: error/slo)"""
+    LLM_FAILOVERS.labels(provider=provider, reason=reason).inc()
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    """记录一次缓存查询结果"""
+    CACHE_REQUESTS.labels(cache=cache, result="hit" if hit else "miss").inc()
+
+
+def record_fallback(stage: str) -> None:
+    """记录一次默认数据兜底"""
+    FALLBACKS.labels(stage=stage).inc()
+
+
+def render_metrics() -> bytes:
+    """生成Prometheus文本格式的指标,多worker部署时汇总所有进程"""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest()
+
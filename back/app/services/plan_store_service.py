@@ -0,0 +1,296 @@
+"""旅行计划存储服务
+
+生成的计划连同请求和各阶段的输出(景点/天气/酒店)一起保存在本地SQLite数据库中,
+JSON经zlib压缩后存储,按计划ID、请求哈希和创建时间建立索引:
+    - 单日编辑直接复用保存的阶段输出,无需重新执行整个规划流程;
+      保存时按读取时的 updated_at 做乐观并发检查,同一计划的并发编辑不会互相覆盖
+    - 刷新结果页或打开分享链接时直接从存储读取,不再重新生成
+    - 按保存天数和最大数量定期清理
+"""
+
+import asyncio
+import hashlib
+import json
+import time
+import uuid
+import zlib
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from loguru import logger
+from pydantic import BaseModel
+
+from ..config import get_settings
+from ..models.schemas import TripPlan, TripRequest
+from .cache_service import SharedStore
+
+_SCHEMA = """
+PRAGMA auto_vacuum = INCREMENTAL;
+CREATE TABLE IF NOT EXISTS plans (
+    plan_id TEXT PRIMARY KEY,
+    request_hash TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    plan BLOB NOT NULL,
+    request BLOB NOT NULL,
+    context BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_plans_request_hash ON plans (request_hash, created_at);
+CREATE INDEX IF NOT EXISTS idx_plans_created_at ON plans (created_at);
+"""
+
+# zlib压缩级别,规划JSON重复度高,默认级别已能压缩到原大小的约1/5
+COMPRESS_LEVEL = 6
+
+# 清理时每批删除的行数,避免长时间持有写锁
+PURGE_BATCH_SIZE = 1000
+
+
+@dataclass
+class StoredPlan:
+    """已保存的计划"""
+    plan_id: str
+    plan: TripPlan
+    request: TripRequest
+    context: Dict[str, List[Any]] = field(default_factory=dict)
+    created_at: float = 0.0
+    # 读取时的更新时间,保存编辑时用于检测并发修改
+    updated_at: float = 0.0
+
+
+def _to_jsonable(items: List[Any]) -> List[Any]:
+    """阶段输出中可能混有模型对象和字典,统一转换为字典"""
+    return [item.model_dump(mode="json") if isinstance(item, BaseModel) else item for item in items or []]
+
+
+def _pack(data: bytes) -> bytes:
+    """压缩JSON字节串"""
+    return zlib.compress(data, COMPRESS_LEVEL)
+
+
+def _unpack(blob: bytes) -> bytes:
+    """解压JSON字节串"""
+    return zlib.decompress(blob)
+
+
+def request_hash(request: TripRequest) -> str:
+    """
+    计算旅行请求的哈希(字段顺序无关)
+
+    Args:
+        request: 旅行请求
+
+    Returns:
+        请求哈希
+    """
+    canonical = json.dumps(request.model_dump(mode="json"), ensure_ascii=False, sort_keys=True)
+    return hashlib.blake2b(canonical.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class PlanStore:
+    """基于SQLite的旅行计划存储,多worker共享同一个数据库文件"""
+
+    def __init__(self, path: Optional[str] = None):
+        settings = get_settings()
+        self.store = SharedStore(path or settings.plan_db_path, schema=_SCHEMA)
+        self.retention_days = settings.plan_retention_days
+        self.max_count = settings.plan_max_count
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def new_id() -> str:
+        """生成计划ID"""
+        return uuid.uuid4().hex
+
+    def save(self, plan: TripPlan, request: TripRequest, context: Optional[Dict[str, List[Any]]] = None,
+             plan_id: Optional[str] = None) -> str:
+        """
+        保存计划
+
+        Args:
+            plan: 旅行计划
+            request: 旅行请求
+            context: 各阶段输出 {"attractions": [...], "weather_info": [...], "hotels": [...]}
+            plan_id: 计划ID,为空时生成新ID
+
+        Returns:
+            计划ID
+        """
+        plan_id = plan_id or self.new_id()
+        now = time.time()
+        context_json = json.dumps(
+            {name: _to_jsonable(items) for name, items in (context or {}).items()}, ensure_ascii=False
+        ).encode("utf-8")
+        self.store.connect().execute(
+            "INSERT INTO plans (plan_id, request_hash, created_at, updated_at, plan, request, context) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                plan_id,
+                request_hash(request),
+                now,
+                now,
+                _pack(plan.__pydantic_serializer__.to_json(plan)),
+                _pack(request.__pydantic_serializer__.to_json(request)),
+                _pack(context_json)
+            )
+        )
+        return plan_id
+
+    def get(self, plan_id: str) -> Optional[StoredPlan]:
+        """
+        读取计划(含请求和阶段输出)
+
+        Args:
+            plan_id: 计划ID
+
+        Returns:
+            已保存的计划,不存在时返回None
+        """
+        row = self.store.connect().execute(
+            "SELECT plan, request, context, created_at, updated_at FROM plans WHERE plan_id = ?", (plan_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return StoredPlan(
+            plan_id=plan_id,
+            plan=TripPlan.model_validate_json(_unpack(row[0])),
+            request=TripRequest.model_validate_json(_unpack(row[1])),
+            context=json.loads(_unpack(row[2])),
+            created_at=row[3],
+            updated_at=row[4]
+        )
+
+    def get_plan_json(self, plan_id: str) -> Optional[bytes]:
+        """
+        读取计划的JSON字节串,不做解析,用于直接返回给客户端
+
+        Args:
+            plan_id: 计划ID
+
+        Returns:
+            计划JSON,不存在时返回None
+        """
+        row = self.store.connect().execute(
+            "SELECT plan FROM plans WHERE plan_id = ?", (plan_id,)
+        ).fetchone()
+        return _unpack(row[0]) if row else None
+
+    def find_recent(self, request: TripRequest, max_age: float) -> Optional[str]:
+        """
+        查找相同请求在指定时间内生成的最新计划
+
+        Args:
+            request: 旅行请求
+            max_age: 最长时间(秒)
+
+        Returns:
+            计划ID,没有时返回None
+        """
+        row = self.store.connect().execute(
+            "SELECT plan_id FROM plans WHERE request_hash = ? AND created_at >= ? "
+            "ORDER BY created_at DESC LIMIT 1",
+            (request_hash(request), time.time() - max_age)
+        ).fetchone()
+        return row[0] if row else None
+
+    def update(self, stored: StoredPlan) -> bool:
+        """
+        保存编辑后的计划(请求和阶段输出不变)
+
+        Args:
+            stored: 通过get读取并修改后的计划
+
+        Returns:
+            是否保存成功,读取之后计划已被其他请求修改(或已删除)时返回False
+        """
+        # 保证更新时间严格递增,同一时刻的两次编辑也能区分
+        updated_at = max(time.time(), stored.updated_at + 1e-6)
+        cursor = self.store.connect().execute(
+            "UPDATE plans SET plan = ?, updated_at = ? WHERE plan_id = ? AND updated_at = ?",
+            (_pack(stored.plan.__pydantic_serializer__.to_json(stored.plan)), updated_at,
+             stored.plan_id, stored.updated_at)
+        )
+        if cursor.rowcount != 1:
+            return False
+        stored.updated_at = updated_at
+        return True
+
+    def _delete_batches(self, where: str, params: tuple) -> int:
+        """分批删除满足条件的计划"""
+        conn = self.store.connect()
+        total = 0
+        while True:
+            cursor = conn.execute(
+                f"DELETE FROM plans WHERE rowid IN (SELECT rowid FROM plans WHERE {where} LIMIT ?)",
+                params + (PURGE_BATCH_SIZE,)
+            )
+            total += cursor.rowcount
+            if cursor.rowcount < PURGE_BATCH_SIZE:
+                return total
+
+    def apply_retention(self) -> int:
+        """
+        按保存天数和最大数量清理计划,并回收空闲页
+
+        Returns:
+            清理的计划数
+        """
+        removed = 0
+        if self.retention_days > 0:
+            removed += self._delete_batches("created_at < ?", (time.time() - self.retention_days * 86400,))
+
+        if self.max_count > 0:
+            conn = self.store.connect()
+            count = conn.execute("SELECT COUNT(*) FROM plans").fetchone()[0]
+            if count > self.max_count:
+                # 找到需要保留的最早一条的创建时间,删除更早的计划
+                row = conn.execute(
+                    "SELECT created_at FROM plans ORDER BY created_at DESC LIMIT 1 OFFSET ?", (self.max_count - 1,)
+                ).fetchone()
+                if row:
+                    removed += self._delete_batches("created_at < ?", (row[0],))
+
+        if removed:
+            self.store.connect().execute("PRAGMA incremental_vacuum")
+            logger.info(f"已清理{removed}个过期旅行计划")
+        return removed
+
+    async def _run_retention(self) -> None:
+        """后台任务: 定期清理"""
+        interval = get_settings().plan_retention_interval
+        while True:
+            try:
+                await run_in_threadpool(self.apply_retention)
+            except Exception as e:
+                logger.error(f"清理旅行计划失败: {str(e)}")
+            await asyncio.sleep(interval)
+
+    def start_retention(self) -> None:
+        """在当前事件循环中启动定期清理任务"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run_retention())
+
+    async def stop_retention(self) -> None:
+        """停止定期清理任务"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# 全局服务实例
+_plan_store = None
+
+
+def get_plan_store() -> PlanStore:
+    """获取计划存储实例(单例模式)"""
+    global _plan_store
+
+    if _plan_store is None:
+        _plan_store = PlanStore()
+
+    return _plan_store
@@ -0,0 +1,235 @@
+"""上游请求录制与回放
+
+对比性能改动时直接请求高德、Unsplash和LLM,结果受网络波动影响且消耗配额。
+各服务的httpx客户端通过 create_http_client 创建,由 UPSTREAM_MODE 决定传输层:
+    - live: 直接请求上游
+    - record: 请求上游,同时把请求和响应(含流式响应的每个分块及其到达时间)保存到本地存档
+    - replay: 不访问网络,按请求指纹从存档返回响应;同一请求录制了多次时按顺序返回,
+      用完后重复最后一次。UPSTREAM_REPLAY_LATENCY 开启时按录制时的耗时返回
+
+请求指纹不包含API Key等凭据和逐次变化的 max_tokens,录制时使用的Key不会写入存档。
+高德请求的合并结果取决于时序,录制和回放时不合并(逐个请求)。
+录制模式请使用单worker运行,多个进程同时写同一个存档文件时可能丢失记录。
+"""
+
+import base64
+import hashlib
+import json
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+import httpx
+from loguru import logger
+
+from ..config import get_settings
+
+# 写入存档前从URL和请求体中去掉的凭据参数
+_SECRET_PATTERN = re.compile(r"\b(key|client_id)=[^&\"\s]*")
+
+# 计算指纹时忽略的JSON请求体字段(自适应预算每次可能不同)
+VOLATILE_BODY_FIELDS = ("max_tokens",)
+
+# 不写入存档的请求/响应头
+_SKIPPED_HEADERS = {"authorization", "set-cookie", "date"}
+
+
+def _redact(text: str) -> str:
+    """去掉文本中的凭据参数值"""
+    return _SECRET_PATTERN.sub(r"\1=", text)
+
+
+def fingerprint(request: httpx.Request) -> str:
+    """
+    计算请求指纹
+
+    Args:
+        request: HTTP请求(请求体已读取)
+
+    Returns:
+        指纹
+    """
+    query = sorted((k, v) for k, v in request.url.params.multi_items() if k not in ("key", "client_id"))
+    body = request.content or b""
+    if body and "json" in request.headers.get("content-type", ""):
+        try:
+            payload = json.loads(body)
+            if isinstance(payload, dict):
+                for name in VOLATILE_BODY_FIELDS:
+                    payload.pop(name, None)
+            body = json.dumps(payload, ensure_ascii=False, sort_keys=True).encode("utf-8")
+        except ValueError:
+            pass
+    digest = hashlib.blake2b(digest_size=16)
+    for part in (request.method, request.url.host, request.url.path, json.dumps(query, ensure_ascii=False)):
+        digest.update(part.encode("utf-8") + b"\0")
+    digest.update(_redact(body.decode("utf-8", errors="replace")).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class UpstreamArchive:
+    """按上游和请求指纹保存的录制存档,每个指纹一个JSON文件"""
+
+    def __init__(self, root: str, upstream: str):
+        self.dir = Path(root) / upstream
+        self._lock = threading.Lock()
+        # 指纹 -> 已回放的次数
+        self._replayed: Dict[str, int] = {}
+
+    def _path(self, key: str) -> Path:
+        return self.dir / f"{key}.json"
+
+    def append(self, key: str, exchange: Dict[str, Any]) -> None:
+        """追加一次录制"""
+        with self._lock:
+            self.dir.mkdir(parents=True, exist_ok=True)
+            path = self._path(key)
+            exchanges = json.loads(path.read_text("utf-8")) if path.exists() else []
+            exchanges.append(exchange)
+            path.write_text(json.dumps(exchanges, ensure_ascii=False, indent=1), "utf-8")
+
+    def next(self, key: str) -> Optional[Dict[str, Any]]:
+        """按录制顺序取出下一次响应,用完后重复最后一次"""
+        path = self._path(key)
+        if not path.exists():
+            return None
+        exchanges = json.loads(path.read_text("utf-8"))
+        if not exchanges:
+            return None
+        with self._lock:
+            index = self._replayed.get(key, 0)
+            self._replayed[key] = index + 1
+        return exchanges[min(index, len(exchanges) - 1)]
+
+
+class _RecordingStream(httpx.SyncByteStream):
+    """原样转发上游响应,同时记录每个分块及其到达时间,关闭时写入存档"""
+
+    def __init__(self, inner: httpx.SyncByteStream, on_close: Any, start: float):
+        self.inner = inner
+        self.on_close = on_close
+        self.start = start
+        self.chunks: List[Dict[str, Any]] = []
+
+    def __iter__(self) -> Iterator[bytes]:
+        for chunk in self.inner:
+            self.chunks.append({"t": round(time.perf_counter() - self.start, 4), "data": base64.b64encode(chunk).decode()})
+            yield chunk
+
+    def close(self) -> None:
+        try:
+            self.inner.close()
+        finally:
+            self.on_close(self.chunks)
+
+
+class _ReplayStream(httpx.SyncByteStream):
+    """按录制的分块返回响应,可选按录制时的到达时间等待"""
+
+    def __init__(self, chunks: List[Dict[str, Any]], start: float, realtime: bool):
+        self.chunks = chunks
+        self.start = start
+        self.realtime = realtime
+
+    def __iter__(self) -> Iterator[bytes]:
+        for chunk in self.chunks:
+            if self.realtime:
+                delay = chunk["t"] - (time.perf_counter() - self.start)
+                if delay > 0:
+                    time.sleep(delay)
+            yield base64.b64decode(chunk["data"])
+
+
+class RecordReplayTransport(httpx.BaseTransport):
+    """录制或回放上游请求的httpx传输层"""
+
+    def __init__(self, upstream: str, mode: str, archive_dir: str, realtime: bool = False,
+                 inner: Optional[httpx.BaseTransport] = None):
+        """
+        初始化传输层
+
+        Args:
+            upstream: 上游名称(存档子目录)
+            mode: record/replay
+            archive_dir: 存档目录
+            realtime: 回放时是否按录制的耗时返回
+            inner: 录制时实际发送请求的传输层
+        """
+        self.upstream = upstream
+        self.mode = mode
+        self.realtime = realtime
+        self.archive = UpstreamArchive(archive_dir, upstream)
+        self.inner = inner or httpx.HTTPTransport()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        request.read()
+        key = fingerprint(request)
+        if self.mode == "replay":
+            return self._replay(request, key)
+        return self._record(request, key)
+
+    def _record(self, request: httpx.Request, key: str) -> httpx.Response:
+        """转发请求,响应读取完毕后写入存档"""
+        start = time.perf_counter()
+        response = self.inner.handle_request(request)
+        first_byte = round(time.perf_counter() - start, 4)
+
+        def save(chunks: List[Dict[str, Any]]) -> None:
+            try:
+                self.archive.append(key, {
+                    "request": {"method": request.method, "url": _redact(str(request.url))},
+                    "status": response.status_code,
+                    "headers": [[k, v] for k, v in response.headers.multi_items() if k.lower() not in _SKIPPED_HEADERS],
+                    "first_byte": first_byte,
+                    "elapsed": round(time.perf_counter() - start, 4),
+                    "chunks": chunks
+                })
+            except Exception as e:
+                logger.warning(f"写入上游录制存档失败[{self.upstream}]: {str(e)}")
+
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_RecordingStream(response.stream, save, start),
+            extensions=response.extensions
+        )
+
+    def _replay(self, request: httpx.Request, key: str) -> httpx.Response:
+        """从存档返回响应,没有录制时按连接错误处理"""
+        start = time.perf_counter()
+        exchange = self.archive.next(key)
+        if exchange is None:
+            raise httpx.ConnectError(f"回放存档中没有该请求[{self.upstream}]: {request.method} {_redact(str(request.url))}",
+                                     request=request)
+        if self.realtime and exchange.get("first_byte"):
+            time.sleep(exchange["first_byte"])
+        return httpx.Response(
+            status_code=exchange["status"],
+            headers=exchange["headers"],
+            stream=_ReplayStream(exchange["chunks"], start, self.realtime)
+        )
+
+    def close(self) -> None:
+        self.inner.close()
+
+
+def create_http_client(upstream: str, **kwargs: Any) -> httpx.Client:
+    """
+    按 UPSTREAM_MODE 创建上游httpx客户端
+
+    Args:
+        upstream: 上游名称(amap/unsplash/llm等),作为存档子目录
+        **kwargs: httpx.Client的其他参数
+
+    Returns:
+        httpx客户端
+    """
+    settings = get_settings()
+    mode = settings.upstream_mode
+    if mode not in ("record", "replay"):
+        return httpx.Client(**kwargs)
+    logger.info(f"上游{upstream}使用{mode}模式, 存档目录: {settings.upstream_archive_dir}")
+    transport = RecordReplayTransport(upstream, mode, settings.upstream_archive_dir, settings.upstream_replay_latency)
+    return httpx.Client(transport=transport, **kwargs)
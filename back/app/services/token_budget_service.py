@@ -0,0 +1,120 @@
+"""LLM输出token预算
+
+不同调用需要的输出长度差别很大: 景点/天气/酒店Agent只需要回复一行工具调用,
+行程规划的JSON则随旅行天数线性增长。每次调用按阶段和天数给出 max_tokens,
+并根据实际观测到的输出长度自适应调整,缩短最坏情况下的生成时间。
+"""
+
+import math
+import threading
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+from loguru import logger
+
+from ..config import get_settings
+
+# 各阶段的静态预算: 阶段 -> (固定部分, 每天增加的部分)
+STAGE_BUDGETS: Dict[str, Tuple[int, int]] = {
+    "attractions": (256, 0),
+    "hotels": (256, 0),
+    "planner": (800, 1200),
+    "replan_day": (1500, 0),
+}
+
+# 每个阶段保留的最近观测数
+WINDOW_SIZE = 50
+
+# 观测数达到该值后才使用自适应预算
+MIN_SAMPLES = 5
+
+# 自适应预算在观测到的P95之上预留的余量
+HEADROOM = 1.3
+
+# 输出被截断时,按实际输出长度的该倍数记录观测,使后续预算放宽
+TRUNCATION_GROWTH = 1.5
+
+# 任何调用的最小预算
+MIN_BUDGET = 64
+
+
+class TokenBudgeter:
+    """按阶段计算并自适应调整 max_tokens
+
+    观测值按天数归一化(每天的输出token数),只保存在当前进程内,
+    多worker模式下各进程独立学习。
+    """
+
+    def __init__(self, max_tokens: Optional[int] = None, adaptive: Optional[bool] = None):
+        settings = get_settings()
+        self.max_tokens = max_tokens or settings.llm_max_tokens
+        self.adaptive = settings.llm_adaptive_budget if adaptive is None else adaptive
+        self._samples: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def _static_budget(self, stage: str, days: int) -> int:
+        """静态预算,未知阶段使用全局上限"""
+        if stage not in STAGE_BUDGETS:
+            return self.max_tokens
+        base, per_day = STAGE_BUDGETS[stage]
+        return base + per_day * days
+
+    def _units(self, stage: str, days: int) -> int:
+        """观测值归一化的单位数,只有随天数增长的阶段按天归一化"""
+        per_day = STAGE_BUDGETS.get(stage, (0, 0))[1]
+        return max(1, days) if per_day else 1
+
+    def budget(self, stage: str, days: int = 1) -> int:
+        """
+        计算一次调用的 max_tokens
+
+        Args:
+            stage: 调用阶段
+            days: 旅行天数
+
+        Returns:
+            本次调用的 max_tokens
+        """
+        budget = self._static_budget(stage, days)
+        if self.adaptive:
+            with self._lock:
+                samples = sorted(self._samples.get(stage, ()))
+            if len(samples) >= MIN_SAMPLES:
+                p95 = samples[min(len(samples) - 1, math.ceil(len(samples) * 0.95) - 1)]
+                budget = math.ceil(p95 * self._units(stage, days) * HEADROOM)
+        return max(MIN_BUDGET, min(budget, self.max_tokens))
+
+    def observe(self, stage: str, days: int, completion_tokens: int, finish_reason: Optional[str]) -> None:
+        """
+        记录一次调用的实际输出长度
+
+        Args:
+            stage: 调用阶段
+            days: 旅行天数
+            completion_tokens: 实际输出token数
+            finish_reason: 结束原因,"length"表示被 max_tokens 截断
+        """
+        if not completion_tokens:
+            return
+        value = float(completion_tokens)
+        if finish_reason == "length":
+            logger.warning(f"LLM输出被截断: stage={stage}, completion_tokens={completion_tokens}")
+            value *= TRUNCATION_GROWTH
+        with self._lock:
+            if stage not in self._samples:
+                self._samples[stage] = deque(maxlen=WINDOW_SIZE)
+            self._samples[stage].append(value / self._units(stage, days))
+
+
+# 全局预算实例
+_token_budgeter = None
+
+
+def get_token_budgeter() -> TokenBudgeter:
+    """获取token预算实例(单例模式)"""
+    global _token_budgeter
+
+    if _token_budgeter is None:
+        _token_budgeter = TokenBudgeter()
+
+    return _token_budgeter
@@ -0,0 +1,292 @@
+"""轻量级请求链路追踪服务
+
+每个HTTP请求对应一个Trace,路由、规划阶段、Agent调用和上游请求各自记录为Span。
+请求结束后:
+    - 汇总为 Server-Timing 响应头
+    - 可选地以OTLP JSON格式逐行写入本地文件,供OpenTelemetry Collector的
+      otlpjsonfile receiver读取(由后台线程写入,请求路径只入队)
+    - 超过阈值的慢请求输出完整的Span树日志
+"""
+
+import contextvars
+import json
+import os
+import queue
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from concurrent.futures import Executor, Future
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from loguru import logger
+
+from ..config import get_settings
+
+
+@dataclass
+class Span:
+    """单个追踪片段"""
+    name: str
+    span_id: str
+    parent_id: Optional[str]
+    start_ns: int
+    start_perf: float
+    end_perf: Optional[float] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+
+    @property
+    def duration_ms(self) -> float:
+        """耗时(毫秒),未结束的Span按当前时间计算"""
+        end = self.end_perf if self.end_perf is not None else time.perf_counter()
+        return (end - self.start_perf) * 1000
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        """设置Span属性"""
+        self.attributes[key] = value
+
+
+class Trace:
+    """一次请求的全部Span"""
+
+    def __init__(self, name: str):
+        self.trace_id = os.urandom(16).hex()
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+        self.root = self.new_span(name, None)
+
+    def new_span(self, name: str, parent: Optional[Span]) -> Span:
+        """创建子Span(规划阶段可能在线程池中并发执行,需要加锁)"""
+        span_obj = Span(
+            name=name,
+            span_id=os.urandom(8).hex(),
+            parent_id=parent.span_id if parent else None,
+            start_ns=time.time_ns(),
+            start_perf=time.perf_counter()
+        )
+        with self._lock:
+            self.spans.append(span_obj)
+        return span_obj
+
+    def server_timing(self, limit: int = 20) -> str:
+        """
+        生成 Server-Timing 响应头,同名Span的耗时累加
+
+        Args:
+            limit: 最多输出的条目数
+
+        Returns:
+            Server-Timing 头的值
+        """
+        totals: Dict[str, float] = {}
+        with self._lock:
+            for span_obj in self.spans:
+                metric = re.sub(r"[^A-Za-z0-9_\-]", "_", span_obj.name)
+                totals[metric] = totals.get(metric, 0.0) + span_obj.duration_ms
+        entries = [f"{name};dur={dur:.1f}" for name, dur in list(totals.items())[:limit]]
+        return ", ".join(entries)
+
+    def render_tree(self) -> str:
+        """以缩进树形式渲染全部Span,用于慢请求日志"""
+        children: Dict[Optional[str], List[Span]] = {}
+        for span_obj in self.spans:
+            children.setdefault(span_obj.parent_id, []).append(span_obj)
+        lines: List[str] = []
+
+        def walk(parent_id: Optional[str], depth: int) -> None:
+            for span_obj in sorted(children.get(parent_id, []), key=lambda s: s.start_perf):
+                offset_ms = (span_obj.start_perf - self.root.start_perf) * 1000
+                suffix = f" error={span_obj.error}" if span_obj.error else ""
+                lines.append(f"{'  ' * depth}{span_obj.name} +{offset_ms:.0f}ms {span_obj.duration_ms:.1f}ms{suffix}")
+                walk(span_obj.span_id, depth + 1)
+
+        walk(None, 0)
+        return "\n".join(lines)
+
+    def to_otlp(self, service_name: str) -> Dict[str, Any]:
+        """转换为OTLP JSON格式(ExportTraceServiceRequest)"""
+        spans = []
+        for span_obj in self.spans:
+            end_ns = span_obj.start_ns + int(span_obj.duration_ms * 1e6)
+            spans.append({
+                "traceId": self.trace_id,
+                "spanId": span_obj.span_id,
+                "parentSpanId": span_obj.parent_id or "",
+                "name": span_obj.name,
+                "kind": 2 if span_obj is self.root else 1,
+                "startTimeUnixNano": str(span_obj.start_ns),
+                "endTimeUnixNano": str(end_ns),
+                "attributes": [
+                    {"key": k, "value": {"stringValue": str(v)}} for k, v in span_obj.attributes.items()
+                ],
+                "status": {"code": 2, "message": span_obj.error} if span_obj.error else {"code": 1}
+            })
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service_name}}]},
+                "scopeSpans": [{"scope": {"name": "app.services.tracing_service"}, "spans": spans}]
+            }]
+        }
+
+
+# 等待写入追踪文件的Trace上限,写入跟不上时丢弃新的Trace
+TRACE_QUEUE_SIZE = 1000
+
+
+class _TraceFileWriter:
+    """后台线程批量把Trace以OTLP JSON逐行追加到追踪文件"""
+
+    def __init__(self, path: str, service_name: str):
+        self.path = path
+        self.service_name = service_name
+        self.queue: "queue.Queue[Optional[Trace]]" = queue.Queue(maxsize=TRACE_QUEUE_SIZE)
+        self.dropped = 0
+        self.thread = threading.Thread(target=self._run, name="trace-writer", daemon=True)
+        self.thread.start()
+
+    def put(self, trace: Trace) -> None:
+        """Trace入队,队列已满时丢弃"""
+        try:
+            self.queue.put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped % 100 == 1:
+                logger.warning(f"追踪文件写入队列已满,已丢弃{self.dropped}个Trace")
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """写完已入队的Trace后停止线程"""
+        self.queue.put(None)
+        self.thread.join(timeout)
+
+    def _run(self) -> None:
+        while True:
+            batch = [self.queue.get()]
+            # 一次取出已积压的Trace,合并为一次写入
+            while len(batch) < TRACE_QUEUE_SIZE:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stopping = None in batch
+            traces = [trace for trace in batch if trace is not None]
+            if traces:
+                self._write(traces)
+            if stopping:
+                return
+
+    def _write(self, traces: List[Trace]) -> None:
+        try:
+            lines = "".join(
+                json.dumps(trace.to_otlp(self.service_name), ensure_ascii=False) + "\n" for trace in traces
+            )
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(lines)
+        except Exception as e:
+            logger.error(f"写入追踪文件失败: {str(e)}")
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+_writer: Optional[_TraceFileWriter] = None
+_writer_lock = threading.Lock()
+
+
+def _get_writer(path: str, service_name: str) -> _TraceFileWriter:
+    """获取追踪文件写入线程(首次使用时在当前进程中启动)"""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = _TraceFileWriter(path, service_name)
+    return _writer
+
+
+def stop_trace_writer() -> None:
+    """应用关闭时写完剩余的Trace"""
+    global _writer
+    with _writer_lock:
+        writer, _writer = _writer, None
+    if writer is not None:
+        writer.stop()
+
+
+def current_trace() -> Optional[Trace]:
+    """获取当前请求的Trace"""
+    return _current_trace.get()
+
+
+def current_span() -> Optional[Span]:
+    """获取当前Span"""
+    return _current_span.get()
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+    """
+    在当前Trace下记录一个Span,不在请求上下文中时不做任何事
+
+    Args:
+        name: Span名称
+        **attributes: Span属性
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+    span_obj = trace.new_span(name, _current_span.get() or trace.root)
+    span_obj.attributes.update(attributes)
+    token = _current_span.set(span_obj)
+    try:
+        yield span_obj
+    except BaseException as e:
+        span_obj.error = type(e).__name__
+        raise
+    finally:
+        span_obj.end_perf = time.perf_counter()
+        _current_span.reset(token)
+
+
+def submit_with_context(executor: Executor, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Future:
+    """
+    向线程池提交任务并携带当前上下文,使子任务的Span挂在当前Span之下
+
+    Args:
+        executor: 线程池
+        func: 任务函数
+        *args: 位置参数
+        **kwargs: 关键字参数
+
+    Returns:
+        任务Future
+    """
+    ctx = contextvars.copy_context()
+    return executor.submit(ctx.run, func, *args, **kwargs)
+
+
+def start_trace(name: str, **attributes: Any) -> Trace:
+    """开始一个新的Trace并设置为当前上下文"""
+    trace = Trace(name)
+    trace.root.attributes.update(attributes)
+    _current_trace.set(trace)
+    _current_span.set(trace.root)
+    return trace
+
+
+def finish_trace(trace: Trace) -> None:
+    """
+    结束Trace:写入追踪文件,慢请求输出Span树
+
+    Args:
+        trace: 要结束的Trace
+    """
+    trace.root.end_perf = time.perf_counter()
+    settings = get_settings()
+
+    if settings.trace_file:
+        _get_writer(settings.trace_file, settings.app_name).put(trace)
+
+    if trace.root.duration_ms >= settings.trace_slow_threshold_ms:
+        logger.warning(f"慢请求 trace_id={trace.trace_id} 耗时{trace.root.duration_ms:.0f}ms\n{trace.render_tree()}")
@@ -1,9 +1,19 @@
 """Unsplash图片服务"""
 
-import requests
+import time
+import httpx
 from typing import List, Optional
 from loguru import logger
 from ..config import get_settings
+from .cancellation_service import check_cancelled
+from .deadline_service import upstream_timeout
+from .metrics_service import observe_upstream
+from .tracing_service import span
+from .cache_service import get_shared_cache
+from .replay_service import create_http_client
+
+# 图片搜索结果缓存时间(秒)
+PHOTO_CACHE_TTL = 24 * 3600
 
 class UnsplashService:
     """Unsplash图片服务类"""
@@ -12,7 +22,10 @@ class UnsplashService:
         """初始化服务"""
         settings = get_settings()
         self.access_key = settings.unsplash_access_key
-        self.base_url = "https://api.unsplash.com"
+        self.base_url = settings.unsplash_base_url.rstrip("/")
+        self.cache = get_shared_cache() if settings.cache_enabled else None
+        # 复用连接池
+        self.client = create_http_client("unsplash", timeout=10.0)
         
         if not self.access_key:
             logger.warning("Unsplash访问密钥未配置，图片功能将不可用")
@@ -31,7 +44,21 @@ class UnsplashService:
         if not self.access_key:
             logger.warning("Unsplash访问密钥未配置，无法搜索图片")
             return []
-            
+
+        if self.cache is None:
+            return self._search_photos(query, per_page)
+        # 搜索失败返回空列表,不写入缓存
+        return self.cache.get_or_load(
+            "unsplash",
+            f"unsplash:search_photos:{per_page}:{query}",
+            PHOTO_CACHE_TTL,
+            lambda: self._search_photos(query, per_page),
+            should_cache=bool
+        )
+
+    def _search_photos(self, query: str, per_page: int) -> List[dict]:
+        """请求Unsplash搜索接口"""
+        check_cancelled("unsplash")
         try:
             url = f"{self.base_url}/search/photos"
             params = {
@@ -40,7 +67,14 @@ class UnsplashService:
                 "client_id": self.access_key
             }
             
-            response = requests.get(url, params=params, timeout=10)
+            start = time.perf_counter()
+            status = "error"
+            try:
+                with span("unsplash.search_photos"):
+                    response = self.client.get(url, params=params, timeout=upstream_timeout(10))
+                    status = str(response.status_code)
+            finally:
+                observe_upstream("unsplash", "search_photos", status, time.perf_counter() - start)
             response.raise_for_status()
             
             data = response.json()
@@ -59,7 +93,7 @@ class UnsplashService:
             
             return photos
             
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             logger.error(f"Unsplash搜索请求失败: {str(e)}")
             return []
         except Exception as e:
@@ -0,0 +1,195 @@
+"""规划器解析与模型校验热点路径的微基准
+
+用法(在back目录下执行):
+    python -m benchmarks.bench_planner --output bench.json
+    python -m benchmarks.bench_planner --compare bench.json
+
+对每个样本分别测量:
+    parse      - _parse_trip_plan_response 完整解析
+    repair     - _fix_incomplete_json / _fix_json_format 修复
+    validate   - TripPlan 模型校验
+    serialize  - TripPlanResponse JSON序列化
+并记录完整流程的峰值内存。结果以JSON输出,便于不同版本之间对比。
+"""
+
+import argparse
+import datetime
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from loguru import logger
+
+from app.agents.trip_planner import MultiAgentTripPlanner
+from app.models.schemas import TripPlan, TripPlanResponse
+from benchmarks.fixtures import build_request, load_outputs
+
+
+def _time_call(func: Callable[[], Any], repeat: int, number: int) -> Dict[str, float]:
+    """
+    多轮计时,返回单次调用耗时统计(微秒)
+
+    Args:
+        func: 被测函数
+        repeat: 轮数
+        number: 每轮调用次数
+
+    Returns:
+        min/median/mean 统计
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        timings.append((time.perf_counter() - start) / number * 1e6)
+    return {
+        "min_us": round(min(timings), 2),
+        "median_us": round(statistics.median(timings), 2),
+        "mean_us": round(statistics.mean(timings), 2)
+    }
+
+
+def _peak_memory(func: Callable[[], Any]) -> float:
+    """测量单次调用的峰值内存(KiB)"""
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return round(peak / 1024, 2)
+
+
+def _extract_json(text: str) -> str:
+    """与 _parse_trip_plan_response 相同的JSON截取逻辑"""
+    return text[text.find('{'):text.rfind('}') + 1]
+
+
+def bench_sample(planner: MultiAgentTripPlanner, sample: Dict[str, Any], repeat: int, number: int) -> List[Dict[str, Any]]:
+    """
+    对单个样本执行全部阶段的基准测试
+
+    Args:
+        planner: 规划器实例
+        sample: 样本
+        repeat: 轮数
+        number: 每轮调用次数
+
+    Returns:
+        各阶段的测量结果
+    """
+    request = build_request(sample["days"])
+    text = sample["text"]
+    json_str = _extract_json(text)
+
+    def parse():
+        try:
+            return planner._parse_trip_plan_response(text, request)
+        except Exception:
+            return None
+
+    def repair():
+        fixed = json_str
+        if not planner._is_json_complete(fixed):
+            fixed = planner._fix_incomplete_json(fixed, request)
+        return planner._fix_json_format(fixed)
+
+    plan = parse()
+    outcome = "ok" if plan is not None else "error"
+    # 解析失败的样本无法继续测量校验和序列化
+    plan_data = plan.model_dump() if plan is not None else None
+
+    def validate():
+        return TripPlan.model_validate(plan_data)
+
+    def serialize():
+        return TripPlanResponse(success=True, message="旅行计划生成成功", data=plan).model_dump_json()
+
+    def full_pipeline():
+        result = parse()
+        if result is not None:
+            TripPlanResponse(success=True, message="旅行计划生成成功", data=result).model_dump_json()
+
+    stages = [("parse", parse), ("repair", repair)]
+    if plan is not None:
+        stages += [("validate", validate), ("serialize", serialize)]
+
+    results = []
+    for stage, func in stages:
+        stats = _time_call(func, repeat, number)
+        results.append({
+            "sample": sample["name"],
+            "days": sample["days"],
+            "variant": sample["variant"],
+            "stage": stage,
+            "outcome": outcome,
+            "input_bytes": len(text.encode("utf-8")),
+            **stats
+        })
+    peak = _peak_memory(full_pipeline)
+    for item in results:
+        item["pipeline_peak_kib"] = peak
+    return results
+
+
+def compare(current: List[Dict[str, Any]], baseline_path: Path) -> None:
+    """打印与基线结果的对比(中位数耗时之比)"""
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+    old = {(r["sample"], r["stage"]): r for r in baseline["results"]}
+    print(f"{'sample':<16}{'stage':<12}{'baseline_us':>14}{'current_us':>14}{'ratio':>8}")
+    for item in current:
+        prev = old.get((item["sample"], item["stage"]))
+        if not prev:
+            continue
+        ratio = item["median_us"] / prev["median_us"] if prev["median_us"] else float("inf")
+        print(f"{item['sample']:<16}{item['stage']:<12}{prev['median_us']:>14.1f}{item['median_us']:>14.1f}{ratio:>8.2f}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="规划器解析与模型校验微基准")
+    parser.add_argument("--repeat", type=int, default=5, help="计时轮数")
+    parser.add_argument("--number", type=int, default=20, help="每轮调用次数")
+    parser.add_argument("--recordings", type=Path, default=None, help="录制的规划器输出目录")
+    parser.add_argument("--output", type=Path, default=None, help="结果输出文件(JSON),默认输出到标准输出")
+    parser.add_argument("--compare", type=Path, default=None, help="与指定的基线结果文件对比")
+    args = parser.parse_args(argv)
+
+    # 解析失败路径会输出大量错误日志,基准测试期间关闭
+    logger.disable("app")
+
+    planner = MultiAgentTripPlanner(llm=None)
+    results = []
+    for sample in load_outputs(args.recordings):
+        results.extend(bench_sample(planner, sample, args.repeat, args.number))
+
+    report = {
+        "meta": {
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+            "number": args.number
+        },
+        "results": results
+    }
+
+    if args.compare:
+        compare(results, args.compare)
+
+    payload = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        args.output.write_text(payload, encoding="utf-8")
+        print(f"基准结果已写入 {args.output}")
+    elif not args.compare:
+        print(payload)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
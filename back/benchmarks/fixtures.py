@@ -0,0 +1,170 @@
+"""基准测试用的规划器输出样本
+
+样本按照 PLANNER_AGENT_PROMPT 约定的格式生成,模拟大模型的真实输出
+(带前后说明文字和 ```json 代码块)。也可以通过 --recordings 目录加载
+线上录制的原始输出,文件名形如 ``7d_valid.txt``。
+"""
+
+import datetime
+import json
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from app.models.schemas import TripRequest
+
+# 基准覆盖的行程天数
+DAY_COUNTS = [1, 7, 30]
+
+# 基准覆盖的输出变体
+VARIANTS = ["valid", "truncated", "malformed"]
+
+_ATTRACTION_NAMES = ["故宫博物院", "天坛公园", "颐和园", "八达岭长城", "圆明园", "南锣鼓巷", "北海公园", "景山公园"]
+_HOTEL_NAMES = ["北京王府井希尔顿酒店", "如家快捷酒店(前门店)", "全季酒店(天坛店)"]
+
+
+def build_request(days: int) -> TripRequest:
+    """构建与样本对应的旅行请求"""
+    start = datetime.date(2025, 6, 1)
+    end = start + datetime.timedelta(days=days - 1)
+    return TripRequest(
+        start_city="上海",
+        city="北京",
+        start_date=start.strftime("%Y-%m-%d"),
+        end_date=end.strftime("%Y-%m-%d"),
+        travel_days=days,
+        to_transportation="飞机",
+        transportation="公共交通",
+        accommodation="经济型酒店",
+        preferences=["历史文化", "美食"],
+        free_text_input="希望多安排一些博物馆"
+    )
+
+
+def _build_plan_dict(days: int) -> Dict:
+    """构建一个符合提示词格式的完整行程字典"""
+    start = datetime.date(2025, 6, 1)
+    day_list = []
+    weather_list = []
+    for i in range(days):
+        date_str = (start + datetime.timedelta(days=i)).strftime("%Y-%m-%d")
+        hotel_name = _HOTEL_NAMES[i % len(_HOTEL_NAMES)]
+        attractions = []
+        for j in range(3):
+            name = _ATTRACTION_NAMES[(i * 3 + j) % len(_ATTRACTION_NAMES)]
+            attractions.append({
+                "name": name,
+                "address": f"北京市东城区{name}路{j + 1}号",
+                "location": {"longitude": 116.397128 + 0.01 * j, "latitude": 39.916527 + 0.01 * i},
+                "visit_duration": 120 + 30 * j,
+                "description": f"{name}是北京最具代表性的景点之一,建议预留充足时间游览,注意提前在官方渠道预约门票。",
+                "category": "历史文化",
+                "ticket_price": 40 + 10 * j
+            })
+        day_list.append({
+            "date": date_str,
+            "day_index": i,
+            "description": f"第{i + 1}天:上午游览{attractions[0]['name']},下午前往{attractions[1]['name']},傍晚在{attractions[2]['name']}附近用餐。",
+            "transportation": "地铁+步行",
+            "accommodation": "经济型酒店",
+            "hotel": {
+                "name": hotel_name,
+                "address": "北京市东城区王府井大街8号",
+                "location": {"longitude": 116.410, "latitude": 39.914},
+                "price_range": "300-500元",
+                "rating": "4.5",
+                "distance": "距离景点2公里",
+                "type": "经济型酒店",
+                "estimated_cost": 400
+            },
+            "attractions": attractions,
+            "meals": [
+                {"type": "breakfast", "name": "护国寺小吃", "description": "豆汁焦圈等老北京早点", "estimated_cost": 30},
+                {"type": "lunch", "name": "四季民福烤鸭店", "description": "招牌烤鸭,建议提前取号", "estimated_cost": 120},
+                {"type": "dinner", "name": "南门涮肉", "description": "铜锅涮肉", "estimated_cost": 100}
+            ]
+        })
+        weather_list.append({
+            "date": date_str,
+            "day_weather": "晴",
+            "night_weather": "多云",
+            "day_temp": "28°C",
+            "night_temp": "18℃",
+            "wind_direction": "南风",
+            "wind_power": "1-3级"
+        })
+    return {
+        "city": "北京",
+        "start_date": day_list[0]["date"],
+        "end_date": day_list[-1]["date"],
+        "days": day_list,
+        "weather_info": weather_list,
+        "overall_suggestions": "夏季北京气温较高,注意防晒补水;热门景点需提前预约。",
+        "budget": {
+            "total_attractions": 150 * days,
+            "total_hotels": 400 * days,
+            "total_meals": 250 * days,
+            "total_transportation": 50 * days,
+            "total": 850 * days
+        }
+    }
+
+
+def _wrap(json_str: str) -> str:
+    """模拟大模型在JSON前后附带的说明文字"""
+    return f"好的,以下是为您规划的行程:\n```json\n{json_str}\n```\n祝您旅途愉快!"
+
+
+def build_output(days: int, variant: str) -> str:
+    """
+    生成指定天数和变体的规划器输出
+
+    Args:
+        days: 行程天数
+        variant: 输出变体 (valid/truncated/malformed)
+
+    Returns:
+        模拟的大模型原始输出
+    """
+    json_str = json.dumps(_build_plan_dict(days), ensure_ascii=False, indent=2)
+    if variant == "valid":
+        return _wrap(json_str)
+    if variant == "truncated":
+        # 模拟max_tokens截断:输出在70%处中断,没有结尾说明
+        return "好的,以下是为您规划的行程:\n```json\n" + json_str[:int(len(json_str) * 0.7)]
+    if variant == "malformed":
+        # 模拟常见的格式错误:键名缺少引号、尾部多余逗号
+        broken = json_str.replace('"day_index"', 'day_index').replace('"visit_duration"', "visit_duration")
+        broken = broken.replace('"estimated_cost": 400\n', '"estimated_cost": 400,\n')
+        return _wrap(broken)
+    raise ValueError(f"未知的输出变体: {variant}")
+
+
+def build_day_output() -> str:
+    """生成单日重新规划的输出(只包含一天)"""
+    day = _build_plan_dict(1)["days"][0]
+    return _wrap(json.dumps(day, ensure_ascii=False, indent=2))
+
+
+def load_outputs(recordings_dir: Optional[Path] = None) -> List[Dict]:
+    """
+    加载全部基准样本
+
+    Args:
+        recordings_dir: 录制样本目录(可选),同名样本优先使用录制内容
+
+    Returns:
+        样本列表,每项包含 name/days/variant/text
+    """
+    samples = []
+    for days in DAY_COUNTS:
+        for variant in VARIANTS:
+            name = f"{days}d_{variant}"
+            text = None
+            if recordings_dir is not None:
+                recorded = recordings_dir / f"{name}.txt"
+                if recorded.exists():
+                    text = recorded.read_text(encoding="utf-8")
+            if text is None:
+                text = build_output(days, variant)
+            samples.append({"name": name, "days": days, "variant": variant, "text": text})
+    return samples
@@ -0,0 +1,46 @@
+"""生产环境gunicorn配置
+
+多个uvicorn worker进程共享同一个监听端口;应用在master进程中预加载,
+worker通过fork启动。发送 SIGHUP 可平滑重启全部worker,但新worker仍使用master中
+已加载的代码;更新代码后需要重启master,或发送 SIGUSR2 启动新master后再向旧master
+发送 SIGQUIT。
+"""
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+# 必须在导入应用之前设置,prometheus_client在导入时读取该环境变量
+_metrics_dir = os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "trip-planner-metrics")
+)
+shutil.rmtree(_metrics_dir, ignore_errors=True)
+os.makedirs(_metrics_dir, exist_ok=True)
+
+from app.config import get_settings  # noqa: E402
+
+settings = get_settings()
+
+bind = f"{settings.host}:{settings.port}"
+workers = settings.workers or multiprocessing.cpu_count()
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+
+# LLM调用最长300秒,worker超时和平滑退出时间都要覆盖一次完整的规划
+timeout = 330
+graceful_timeout = 330
+keepalive = 5
+
+# 定期回收worker,防止内存缓慢增长
+max_requests = 2000
+max_requests_jitter = 200
+
+loglevel = settings.log_level.lower()
+accesslog = "-"
+
+
+def child_exit(server, worker):
+    """worker退出时清理其指标文件"""
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
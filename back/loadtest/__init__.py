@@ -0,0 +1 @@
+"""压测工具模块"""
\ No newline at end of file
@@ -0,0 +1,342 @@
+"""本地模拟上游服务
+
+在一个进程里模拟高德地图v3、Unsplash搜索和OpenAI兼容的 /chat/completions 接口,
+用于压测时不消耗真实配额。
+
+启动:
+    python -m loadtest.fake_upstreams --port 9100 \\
+        --amap-latency lognormal:40:0.5 --llm-token-rate 80 --llm-truncate-rate 0.05
+
+后端指向模拟服务:
+    AMAP_BASE_URL=http://127.0.0.1:9100/v3
+    UNSPLASH_BASE_URL=http://127.0.0.1:9100
+    UNSPLASH_ACCESS_KEY=fake
+    LLM_BASE_URL=http://127.0.0.1:9100
+    LLM_API_KEY=fake
+
+延迟分布格式:
+    fixed:MS              固定延迟
+    uniform:LOW:HIGH      均匀分布
+    lognormal:MEDIAN:SIGMA 对数正态分布(中位数MS)
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import re
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from benchmarks.fixtures import build_day_output, build_output
+
+
+@dataclass
+class LatencyDistribution:
+    """延迟分布(毫秒)"""
+    kind: str = "fixed"
+    a: float = 0.0
+    b: float = 0.0
+
+    @classmethod
+    def parse(cls, spec: str) -> "LatencyDistribution":
+        """从 kind:a[:b] 格式解析"""
+        parts = spec.split(":")
+        kind = parts[0]
+        values = [float(p) for p in parts[1:]]
+        if kind == "fixed" and len(values) == 1:
+            return cls(kind, values[0])
+        if kind in ("uniform", "lognormal") and len(values) == 2:
+            return cls(kind, values[0], values[1])
+        raise ValueError(f"无效的延迟分布: {spec}")
+
+    def sample(self) -> float:
+        """采样一次延迟(秒)"""
+        if self.kind == "uniform":
+            ms = random.uniform(self.a, self.b)
+        elif self.kind == "lognormal":
+            ms = random.lognormvariate(math.log(max(self.a, 0.001)), self.b)
+        else:
+            ms = self.a
+        return ms / 1000
+
+
+@dataclass
+class UpstreamProfile:
+    """单个上游的行为配置"""
+    latency: LatencyDistribution
+    error_rate: float = 0.0
+
+
+@dataclass
+class LLMProfile(UpstreamProfile):
+    """LLM上游的行为配置"""
+    token_rate: float = 0.0  # 每秒生成token数, 0表示不限
+    truncate_rate: float = 0.0  # 按max_tokens截断的概率
+
+
+def _estimate_tokens(text: str) -> int:
+    """粗略估算token数(中文约1.5字符/token)"""
+    return max(1, int(len(text) / 1.5))
+
+
+def _fake_poi(index: int, keywords: str, city: str) -> Dict[str, Any]:
+    """生成一条高德POI记录"""
+    return {
+        "id": f"B000A{index:05d}",
+        "name": f"{city}{keywords}{index}",
+        "type": "风景名胜;风景名胜;国家级景点",
+        "address": f"{city}市中心大街{index}号",
+        "location": f"{116.3 + index * 0.001:.6f},{39.9 + index * 0.001:.6f}",
+        "tel": "010-12345678",
+        "biz_ext": {"rating": f"{4.0 + (index % 10) / 10:.1f}", "cost": "60"},
+        "photos": [{"title": "", "url": f"https://example.com/photo/{index}.jpg"}]
+    }
+
+
+def _amap_error() -> Dict[str, Any]:
+    """高德接口的业务错误响应"""
+    return {"status": "0", "info": "SERVICE_NOT_AVAILABLE", "infocode": "10016"}
+
+
+def _query_city(user: str) -> str:
+    """从用户查询中提取城市名"""
+    city_match = re.search(r"(?:为|前往|查询|搜索)(\S{2,3}?)(?:的|未来|规划)", user)
+    return city_match.group(1) if city_match else "北京"
+
+
+def _llm_reply(messages: List[Dict[str, Any]]) -> str:
+    """根据系统提示词生成与真实智能体相同格式的回复"""
+    system = next((m["content"] for m in messages if m["role"] == "system"), "")
+    user = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+    city = _query_city(user)
+    if "重新规划旅行计划中的某一天" in system:
+        return build_day_output()
+    if "行程规划专家" in system:
+        days_match = re.search(r"(\d+)天", user)
+        days = int(days_match.group(1)) if days_match else 3
+        return build_output(days, "valid")
+    if "天气查询专家" in system:
+        return f"[TOOL_CALL:amap_maps_weather:city={city}]"
+    if "酒店推荐专家" in system:
+        return f"[TOOL_CALL:amap_maps_text_search:keywords=酒店,city={city}]"
+    return f"[TOOL_CALL:amap_maps_text_search:keywords=景点,city={city}]"
+
+
+def _llm_tool_calls(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """原生函数调用模式下,按系统提示词生成工具调用(已有工具结果时不再调用)"""
+    if any(m["role"] == "tool" for m in messages):
+        return []
+    system = next((m["content"] for m in messages if m["role"] == "system"), "")
+    user = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+    city = _query_city(user)
+    if "天气查询专家" in system:
+        calls = [("amap_maps_weather", {"city": city})]
+    elif "酒店推荐专家" in system:
+        calls = [("amap_maps_text_search", {"keywords": "酒店", "city": city})]
+    elif "景点搜索专家" in system:
+        # 同一轮返回多个并行调用
+        calls = [("amap_maps_text_search", {"keywords": keywords, "city": city}) for keywords in ("景点", "公园")]
+    else:
+        return []
+    return [
+        {"id": f"call_{uuid.uuid4().hex[:8]}", "type": "function",
+         "function": {"name": name, "arguments": json.dumps(args, ensure_ascii=False)}}
+        for name, args in calls
+    ]
+
+
+def create_app(amap: UpstreamProfile, unsplash: UpstreamProfile, llm: LLMProfile) -> FastAPI:
+    """
+    创建模拟上游应用
+
+    Args:
+        amap: 高德地图行为配置
+        unsplash: Unsplash行为配置
+        llm: LLM行为配置
+
+    Returns:
+        FastAPI应用
+    """
+    app = FastAPI(title="fake-upstreams")
+
+    async def _delay(profile: UpstreamProfile) -> bool:
+        """模拟网络延迟,返回本次是否注入错误"""
+        await asyncio.sleep(profile.latency.sample())
+        return random.random() < profile.error_rate
+
+    # ============ 高德地图 v3 ============
+
+    @app.get("/v3/place/text")
+    async def place_text(keywords: str = "", city: str = "", page: int = 1, offset: int = 20):
+        if await _delay(amap):
+            return _amap_error()
+        total = 120
+        start = (page - 1) * offset
+        pois = [_fake_poi(i, keywords, city) for i in range(start, min(start + offset, total))]
+        return {"status": "1", "info": "OK", "infocode": "10000", "count": str(total), "pois": pois}
+
+    @app.get("/v3/place/detail")
+    async def place_detail(id: str = ""):
+        if await _delay(amap):
+            return _amap_error()
+        index = int(re.sub(r"\D", "", id) or 0)
+        return {"status": "1", "info": "OK", "infocode": "10000", "count": "1", "pois": [_fake_poi(index, "景点", "北京")]}
+
+    @app.get("/v3/weather/weatherInfo")
+    async def weather(city: str = ""):
+        if await _delay(amap):
+            return _amap_error()
+        casts = [
+            {"date": f"2025-06-0{i + 1}", "week": str(i + 1), "dayweather": "晴", "nightweather": "多云",
+             "daytemp": "28", "nighttemp": "18", "daywind": "南", "nightwind": "南", "daypower": "1-3", "nightpower": "1-3"}
+            for i in range(4)
+        ]
+        return {"status": "1", "info": "OK", "infocode": "10000", "forecasts": [{"city": city, "casts": casts}]}
+
+    @app.get("/v3/geocode/geo")
+    async def geocode(address: str = ""):
+        if await _delay(amap):
+            return _amap_error()
+        return {"status": "1", "info": "OK", "infocode": "10000", "geocodes": [{"formatted_address": address, "location": "116.397128,39.916527"}]}
+
+    @app.get("/v3/direction/{route_type:path}")
+    async def direction(route_type: str):
+        if await _delay(amap):
+            return _amap_error()
+        return {"status": "1", "info": "OK", "infocode": "10000", "route": {"paths": [{"distance": "3200", "duration": "2400"}]}}
+
+    @app.post("/v3/batch")
+    async def batch(request: Request):
+        # 子请求在本应用内并发执行,与真实接口一样只付一次往返
+        ops = (await request.json()).get("ops", [])[:20]
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://fake") as client:
+            responses = await asyncio.gather(*(client.get(op["url"]) for op in ops))
+        return [{"status": r.status_code, "body": r.json()} for r in responses]
+
+    # ============ Unsplash ============
+
+    @app.get("/search/photos")
+    async def search_photos(query: str = "", per_page: int = 5):
+        if await _delay(unsplash):
+            return JSONResponse(status_code=503, content={"errors": ["Service Unavailable"]})
+        results = [
+            {
+                "id": f"fake{i}",
+                "urls": {"regular": f"https://images.example.com/{i}?w=1080", "thumb": f"https://images.example.com/{i}?w=200"},
+                "description": query,
+                "user": {"name": "fake"}
+            }
+            for i in range(per_page)
+        ]
+        return {"total": per_page, "total_pages": 1, "results": results}
+
+    # ============ OpenAI兼容 /chat/completions ============
+
+    @app.post("/chat/completions")
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        if await _delay(llm):
+            return JSONResponse(status_code=500, content={"error": {"message": "injected error"}})
+
+        tool_calls = _llm_tool_calls(body["messages"]) if body.get("tools") else []
+        content = "" if tool_calls else _llm_reply(body.get("messages", []))
+        finish_reason = "tool_calls" if tool_calls else "stop"
+        max_tokens = body.get("max_tokens")
+        tokens = _estimate_tokens(content)
+        if max_tokens and tokens > max_tokens:
+            content = content[:int(max_tokens * 1.5)]
+            finish_reason = "length"
+        elif random.random() < llm.truncate_rate:
+            content = content[:int(len(content) * random.uniform(0.3, 0.9))]
+            finish_reason = "length"
+        completion_tokens = _estimate_tokens(content) + sum(_estimate_tokens(c["function"]["arguments"]) for c in tool_calls)
+        prompt_tokens = sum(_estimate_tokens(m.get("content") or "") for m in body.get("messages", []))
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+        model = body.get("model", "fake-model")
+
+        if body.get("stream"):
+            async def event_stream():
+                chunk_chars = 24
+                delay = (chunk_chars / 1.5) / llm.token_rate if llm.token_rate else 0
+                for i in range(0, len(content), chunk_chars):
+                    if delay:
+                        await asyncio.sleep(delay)
+                    chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                             "choices": [{"index": 0, "delta": {"content": content[i:i + chunk_chars]}, "finish_reason": None}]}
+                    yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+                for index, call in enumerate(tool_calls):
+                    # 与真实接口一样,参数分多个分块返回
+                    arguments = call["function"]["arguments"]
+                    half = len(arguments) // 2
+                    for delta in (
+                        {"index": index, "id": call["id"], "type": "function",
+                         "function": {"name": call["function"]["name"], "arguments": arguments[:half]}},
+                        {"index": index, "function": {"arguments": arguments[half:]}}
+                    ):
+                        chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                                 "choices": [{"index": 0, "delta": {"tool_calls": [delta]}, "finish_reason": None}]}
+                        yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+                final = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                         "choices": [{"index": 0, "delta": {}, "finish_reason": finish_reason}], "usage": usage}
+                yield f"data: {json.dumps(final, ensure_ascii=False)}\n\n"
+                yield "data: [DONE]\n\n"
+            return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+        if llm.token_rate:
+            await asyncio.sleep(completion_tokens / llm.token_rate)
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content or None,
+                                                 **({"tool_calls": tool_calls} if tool_calls else {})},
+                         "finish_reason": finish_reason}],
+            "usage": usage
+        }
+
+    return app
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="本地模拟上游服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--amap-latency", default="lognormal:40:0.5")
+    parser.add_argument("--amap-error-rate", type=float, default=0.0)
+    parser.add_argument("--unsplash-latency", default="lognormal:120:0.5")
+    parser.add_argument("--unsplash-error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-latency", default="lognormal:800:0.4", help="首token延迟")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-token-rate", type=float, default=60.0, help="每秒生成token数")
+    parser.add_argument("--llm-truncate-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    app = create_app(
+        amap=UpstreamProfile(LatencyDistribution.parse(args.amap_latency), args.amap_error_rate),
+        unsplash=UpstreamProfile(LatencyDistribution.parse(args.unsplash_latency), args.unsplash_error_rate),
+        llm=LLMProfile(LatencyDistribution.parse(args.llm_latency), args.llm_error_rate,
+                       token_rate=args.llm_token_rate, truncate_rate=args.llm_truncate_rate)
+    )
+
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""端到端压测驱动
+
+按目标并发持续请求后端的 /api/trip/plan、/api/map/* 和 /api/poi/* 接口,
+统计每个接口的吞吐量和 p50/p95/p99 延迟。
+
+用法(先启动 loadtest.fake_upstreams 和指向它的后端):
+    python -m loadtest.run_load --base-url http://127.0.0.1:8080 \\
+        --concurrency 32 --duration 60 --output load.json
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import sys
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+# 场景: (名称, 方法, 路径, 请求参数, 权重)
+SCENARIOS: List[Tuple[str, str, str, Dict[str, Any], int]] = [
+    ("trip_plan", "POST", "/api/trip/plan", {"json": {
+        "start_city": "上海",
+        "city": "北京",
+        "start_date": "2025-06-01",
+        "end_date": "2025-06-03",
+        "travel_days": 3,
+        "to_transportation": "飞机",
+        "transportation": "公共交通",
+        "accommodation": "经济型酒店",
+        "preferences": ["历史文化", "美食"],
+        "free_text_input": ""
+    }}, 1),
+    ("map_poi", "GET", "/api/map/poi", {"params": {"keywords": "故宫", "city": "北京"}}, 4),
+    ("map_weather", "GET", "/api/map/weather", {"params": {"city": "北京"}}, 2),
+    ("map_route", "POST", "/api/map/route", {"json": {
+        "origin_address": "北京市朝阳区阜通东大街6号",
+        "destination_address": "北京市海淀区上地十街10号",
+        "route_type": "walking"
+    }}, 2),
+    ("poi_detail", "GET", "/api/poi/detail/B000A00001", {}, 3),
+    ("poi_search", "GET", "/api/poi/search", {"params": {"keywords": "博物馆", "city": "北京"}}, 3),
+    ("poi_photo", "GET", "/api/poi/photo", {"params": {"name": "故宫"}}, 3),
+]
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    """计算已排序列表的百分位数(最近秩法)"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+async def _worker(client: httpx.AsyncClient, scenarios: List[Tuple], weights: List[int], deadline: float,
+                  samples: Dict[str, List[float]], errors: Dict[str, int], rejected: Dict[str, int],
+                  client_id: str) -> None:
+    """单个并发槽位: 在截止时间前不断按权重挑选场景发请求
+
+    每个槽位模拟一个独立客户端;被准入控制拒绝(429)的请求单独计数,不计入延迟统计。
+    """
+    headers = {"X-Client-Id": client_id}
+    while time.perf_counter() < deadline:
+        name, method, path, kwargs, _ = random.choices(scenarios, weights=weights)[0]
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, path, headers=headers, **kwargs)
+            if response.status_code == 429:
+                rejected[name] += 1
+                await asyncio.sleep(min(float(response.headers.get("retry-after", 1)), 1.0))
+                continue
+            ok = response.status_code < 400
+        except httpx.HTTPError:
+            ok = False
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        samples[name].append(elapsed_ms)
+        if not ok:
+            errors[name] += 1
+
+
+async def run_load(base_url: str, concurrency: int, duration: float, endpoints: Optional[List[str]],
+                   timeout: float) -> Dict[str, Any]:
+    """
+    执行一次压测
+
+    Args:
+        base_url: 后端地址
+        concurrency: 并发数
+        duration: 持续时间(秒)
+        endpoints: 只压测指定场景(可选)
+        timeout: 单请求超时(秒)
+
+    Returns:
+        压测报告
+    """
+    scenarios = [s for s in SCENARIOS if not endpoints or s[0] in endpoints]
+    if not scenarios:
+        raise ValueError("没有匹配的压测场景")
+    weights = [s[4] for s in scenarios]
+    samples: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    rejected: Dict[str, int] = defaultdict(int)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(*[
+            _worker(client, scenarios, weights, deadline, samples, errors, rejected, f"load-{i}")
+            for i in range(concurrency)
+        ])
+        elapsed = time.perf_counter() - started
+
+    endpoints_report = {}
+    for name, values in sorted(samples.items()):
+        values.sort()
+        endpoints_report[name] = {
+            "requests": len(values),
+            "errors": errors[name],
+            "rejected": rejected[name],
+            "throughput_rps": round(len(values) / elapsed, 2),
+            "p50_ms": round(_percentile(values, 50), 1),
+            "p95_ms": round(_percentile(values, 95), 1),
+            "p99_ms": round(_percentile(values, 99), 1),
+            "max_ms": round(values[-1], 1)
+        }
+    total = sum(len(v) for v in samples.values())
+    return {
+        "base_url": base_url,
+        "concurrency": concurrency,
+        "duration_s": round(elapsed, 2),
+        "total_requests": total,
+        "total_errors": sum(errors.values()),
+        "total_rejected": sum(rejected.values()),
+        "throughput_rps": round(total / elapsed, 2),
+        "endpoints": endpoints_report
+    }
+
+
+def _print_report(report: Dict[str, Any]) -> None:
+    """以表格形式打印报告"""
+    print(f"并发 {report['concurrency']}, 持续 {report['duration_s']}s, "
+          f"总请求 {report['total_requests']}, 错误 {report['total_errors']}, 拒绝 {report['total_rejected']}, "
+          f"吞吐 {report['throughput_rps']} req/s")
+    print(f"{'endpoint':<14}{'reqs':>8}{'errors':>8}{'429':>8}{'rps':>10}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for name, item in report["endpoints"].items():
+        print(f"{name:<14}{item['requests']:>8}{item['errors']:>8}{item['rejected']:>8}{item['throughput_rps']:>10}"
+              f"{item['p50_ms']:>10}{item['p95_ms']:>10}{item['p99_ms']:>10}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="端到端压测驱动")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8080")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30.0, help="持续时间(秒)")
+    parser.add_argument("--endpoints", nargs="*", default=None,
+                        help=f"只压测指定场景: {', '.join(s[0] for s in SCENARIOS)}")
+    parser.add_argument("--timeout", type=float, default=300.0, help="单请求超时(秒)")
+    parser.add_argument("--output", default=None, help="报告输出文件(JSON)")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run_load(args.base_url, args.concurrency, args.duration, args.endpoints, args.timeout))
+    _print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,15 +1,60 @@
-"""启动脚本"""
+"""启动脚本
 
+开发模式(默认): 单进程,代码变更自动重载
+    python run.py
+生产模式: 多worker进程,预加载应用,支持平滑重启
+    python run.py --prod
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
 import uvicorn
 from app.config import get_settings
 
-if __name__ == "__main__":
-    settings = get_settings()
-    
+
+def prepare_metrics_dir():
+    """设置多进程指标目录(与gunicorn_conf.py相同),worker启动时继承该环境变量"""
+    metrics_dir = os.environ.setdefault(
+        "PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "trip-planner-metrics")
+    )
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+
+def run_production(settings):
+    """以多worker方式启动,优先使用gunicorn,不可用时(如Windows)退回uvicorn多进程"""
+    if shutil.which("gunicorn") and sys.platform != "win32":
+        os.execvp("gunicorn", ["gunicorn", "-c", "gunicorn_conf.py", "app.api.main:app"])
+
+    # uvicorn没有worker退出回调,被替换的worker留下的指标文件到下次启动时才清理
+    prepare_metrics_dir()
+    workers = settings.workers or os.cpu_count() or 1
     uvicorn.run(
         "app.api.main:app",
         host=settings.host,
         port=settings.port,
-        reload=True,
+        workers=workers,
         log_level=settings.log_level.lower()
     )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="智能旅行助手后端")
+    parser.add_argument("--prod", action="store_true", help="生产模式(多worker)")
+    args = parser.parse_args()
+
+    settings = get_settings()
+
+    if args.prod:
+        run_production(settings)
+    else:
+        uvicorn.run(
+            "app.api.main:app",
+            host=settings.host,
+            port=settings.port,
+            reload=True,
+            log_level=settings.log_level.lower()
+        )
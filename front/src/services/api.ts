@@ -1,5 +1,14 @@
 import axios from 'axios'
-import type { TripFormData, TripPlanResponse } from '@/types'
+import type {
+  TripFormData,
+  TripPlan,
+  TripPlanResponse,
+  CompactTripPlan,
+  CompactTripPlanResponse,
+  DayEditRequest,
+  TripPlanDelta,
+  TripPlanDeltaResponse
+} from '@/types'
 
 const API_BASE_URL = import.meta.env.VITE_API_BASE_URL || 'http://localhost:8080'
 
@@ -11,6 +20,13 @@ const apiClient = axios.create({
   }
 })
 
+/**
+ * 后端图片代理返回的是相对路径,拼接为完整地址
+ */
+export function resolveImageUrl(url: string): string {
+  return url.startsWith('/api/images/') ? `${API_BASE_URL}${url}` : url
+}
+
 // 请求拦截器
 apiClient.interceptors.request.use(
   (config) => {
@@ -55,20 +71,94 @@ apiClient.interceptors.response.use(
   }
 )
 
+/**
+ * 将紧凑格式的旅行计划还原为完整格式
+ */
+export function expandCompactPlan(compact: CompactTripPlan): TripPlan {
+  const { hotels, attractions, days, ...rest } = compact
+  return {
+    ...rest,
+    days: days.map(day => ({
+      ...day,
+      hotel: day.hotel === null || day.hotel === undefined ? undefined : hotels[day.hotel],
+      attractions: day.attractions.map(index => attractions[index])
+    }))
+  }
+}
+
 /**
  * 生成旅行计划
  */
 export async function generateTripPlan(formData: TripFormData): Promise<TripPlanResponse> {
   try {
-    // 修改API路径，确保与后端路由匹配
-    const response = await apiClient.post<TripPlanResponse>('/api/trip/plan', formData)
-    return response.data
+    // 请求紧凑格式以减少传输量,收到后还原为完整格式
+    const response = await apiClient.post<CompactTripPlanResponse>('/api/trip/plan', formData, {
+      params: { format: 'compact' }
+    })
+    const { success, message, plan_id, degradations, data } = response.data
+    return {
+      success,
+      message,
+      plan_id,
+      degradations,
+      data: data ? expandCompactPlan(data) : null
+    }
   } catch (error: any) {
     console.error('生成旅行计划失败:', error)
     throw new Error(error.message || '生成旅行计划失败')
   }
 }
 
+/**
+ * 获取已保存的旅行计划(刷新结果页或打开分享链接时使用)
+ */
+export async function getTripPlan(planId: string): Promise<TripPlanResponse> {
+  try {
+    const response = await apiClient.get<CompactTripPlanResponse>(`/api/trip/${planId}`, {
+      params: { format: 'compact' }
+    })
+    const { success, message, plan_id, data } = response.data
+    return {
+      success,
+      message,
+      plan_id,
+      data: data ? expandCompactPlan(data) : null
+    }
+  } catch (error: any) {
+    console.error('获取旅行计划失败:', error)
+    throw new Error(error.message || '获取旅行计划失败')
+  }
+}
+
+/**
+ * 编辑单日行程,返回修改后的这一天和预算
+ */
+export async function editTripDay(planId: string, dayIndex: number, edit: DayEditRequest): Promise<TripPlanDelta> {
+  try {
+    const response = await apiClient.patch<TripPlanDeltaResponse>(`/api/trip/${planId}/days/${dayIndex}`, edit)
+    if (!response.data.success || !response.data.data) {
+      throw new Error(response.data.message || '编辑行程失败')
+    }
+    return response.data.data
+  } catch (error: any) {
+    console.error('编辑行程失败:', error)
+    throw new Error(error.message || '编辑行程失败')
+  }
+}
+
+/**
+ * 将单日编辑的增量结果应用到旅行计划
+ */
+export function applyDayDelta(plan: TripPlan, delta: TripPlanDelta): TripPlan {
+  const days = plan.days.slice()
+  days[delta.day_index] = delta.day
+  return {
+    ...plan,
+    days,
+    budget: delta.budget ?? plan.budget
+  }
+}
+
 /**
  * 健康检查
  */
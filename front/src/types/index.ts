@@ -13,6 +13,8 @@ export interface Attraction {
   description: string
   category?: string
   rating?: number
+  photos?: string[]
+  poi_id?: string
   image_url?: string
   ticket_price?: number
 }
@@ -35,6 +37,9 @@ export interface Hotel {
   distance: string
   type: string
   estimated_cost?: number
+  poi_id?: string
+  photos?: string[]
+  image_url?: string
 }
 
 export interface Budget {
@@ -96,5 +101,67 @@ export interface TripFormData {
 export interface TripPlanResponse {
   success: boolean
   message: string
+  plan_id?: string | null
+  // 因时限或出错而降级的阶段,例如 "planner:local"
+  degradations?: string[]
   data: TripPlan | null
-}
\ No newline at end of file
+}
+
+// 单日编辑
+export type DayEditAction = 'swap_attraction' | 'remove_attraction' | 'change_hotel' | 'regenerate'
+
+export interface DayEditRequest {
+  action: DayEditAction
+  attraction_index?: number
+  attraction_name?: string
+  hotel_name?: string
+  instructions?: string
+}
+
+export interface TripPlanDelta {
+  plan_id: string
+  day_index: number
+  day: DayPlan
+  budget?: Budget | null
+}
+
+export interface TripPlanDeltaResponse {
+  success: boolean
+  message: string
+  data: TripPlanDelta | null
+}
+
+// 紧凑格式: 酒店和景点去重后放在顶层表中,每天通过索引引用
+export interface CompactDayPlan {
+  date: string
+  day_index: number
+  description: string
+  transportation: string
+  accommodation: string
+  hotel?: number | null
+  attractions: number[]
+  meals: Meal[]
+}
+
+export interface CompactTripPlan {
+  start_city: string
+  city: string
+  start_date: string
+  end_date: string
+  hotels: Hotel[]
+  attractions: Attraction[]
+  days: CompactDayPlan[]
+  weather_info?: WeatherInfo[]
+  overall_suggestions: string
+  budget?: Budget
+  to_transportation?: string
+}
+
+export interface CompactTripPlanResponse {
+  success: boolean
+  message: string
+  format: 'compact'
+  plan_id?: string | null
+  degradations?: string[]
+  data: CompactTripPlan | null
+}